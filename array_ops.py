@@ -0,0 +1,664 @@
+"""
+In-memory simulation backend for WarehouseOps.
+
+ArrayWarehouseOps keeps products, locations and pallets in NumPy arrays and runs
+the same daily phases as WarehouseOps without a database round-trip per pallet.
+For the same seed and settings it produces the same Movements trace as the
+PostgreSQL path, so PostgreSQL is only needed to persist a finished run.
+"""
+import csv
+import itertools
+import random
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from event_log import WARNING, EventLog
+from instrumentation import Profiler, profiled
+from kpis import KPI_COLUMNS, KPITracker
+from layout import merge_run_settings, validate_settings
+from warehouse_ops import HISTORY_COLUMNS, MOVEMENT_COLUMNS, WarehouseOps, write_parquet
+
+# Area codes, in the column order of the Movements table
+AREAS = ("Storage", "LoadingDock", "Floor", "Buffer")
+STORAGE, LOADING_DOCK, FLOOR, BUFFER = range(len(AREAS))
+
+
+def group_rank(keys):
+    """
+    Rank every element among the elements that share its key.
+
+    Parameters:
+    keys (numpy.ndarray): Group key of every element.
+
+    Returns:
+    numpy.ndarray: 0 for the first element of each key, 1 for the second, and so on,
+    following the array order.
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys)) - np.searchsorted(sorted_keys, sorted_keys, side="left")
+    return ranks
+
+
+def match_by_key(demand_keys, supply_keys):
+    """
+    Pair demand elements with supply elements of the same key.
+
+    The n-th demand element of a key gets the n-th supply element of that key, both
+    taken in array order. This is what a row-by-row loop doing "take the first free
+    match ORDER BY id" ends up with.
+
+    Parameters:
+    demand_keys (numpy.ndarray): Key of every demand element.
+    supply_keys (numpy.ndarray): Key of every supply element.
+
+    Returns:
+    numpy.ndarray: Index into supply for every demand element, -1 where the key ran out.
+    """
+    order = np.argsort(supply_keys, kind="stable")
+    sorted_keys = supply_keys[order]
+    start = np.searchsorted(sorted_keys, demand_keys, side="left")
+    stop = np.searchsorted(sorted_keys, demand_keys, side="right")
+    position = start + group_rank(demand_keys)
+    matched = np.full(len(demand_keys), -1, dtype=np.int64)
+    found = position < stop
+    matched[found] = order[position[found]]
+    return matched
+
+
+class ArrayWarehouseOps(WarehouseOps):
+    def __init__(self, seed: int = None, settings: dict = None, log_path: str = "log.txt",
+                 log_options: dict = None, profile: bool = False, detector=None,
+                 history: bool = False, kpis: bool = False):
+        """
+        Initialize the in-memory warehouse.
+
+        No database connection is opened; use persist() to write a run to PostgreSQL.
+
+        Parameters:
+        seed (int): Seed for the random generator driving truck contents and sales
+            (default is None, i.e. a non-reproducible run).
+        settings (dict): Values overriding those of warehouse_settings() (default is None).
+        log_path (str): Path of the log file (default is "log.txt").
+        log_options (dict): EventLog arguments such as level, format, run_id or append
+            (default is None).
+        profile (bool): Time every phase per day; there are no statements to count
+            (default is False).
+        detector (BottleneckDetector): Stops simulate() early once a bottleneck is
+            settled (default is None).
+        history (bool): Record every pallet move; persist() writes the moves to
+            PalletHistory (default is False).
+        kpis (bool): Track the daily KPIs; persist() writes them to DailyKPIs and
+            SkuKPIs (default is False).
+
+        Returns:
+        None
+        """
+        self.dbname = None
+        self.user = None
+        self.password = None
+        self.host = None
+        self.conn = None
+        self.cur = None
+        self.settings = {**self.warehouse_settings(), **(settings or {})}
+        self.rng = random.Random(seed)
+        # persist() seeds the tables with COPY
+        self.bulk = True
+        self.server_side = False
+        self.day = 0
+        self.defer_commits = False
+        self.profiler = Profiler() if profile else None
+        self.detector = detector
+        self.stop_reason = None
+        self.history = history
+        # Moves of the current phase as (pallets, products, from, to) index arrays, and
+        # the moves of the finished phases as arrays of HISTORY_COLUMNS rows
+        self.history_rows = []
+        self.history_chunks = []
+        self.history_partitions = set()
+        self.kpis = KPITracker() if kpis else None
+        self.prepared = False
+        self.statements = None
+        self.itersize = None
+
+        # Open the log; by default it truncates the file and keeps every level
+        self.event_log = EventLog(log_path, **(log_options or {}))
+        validate_settings(self.settings)
+        if detector is not None:
+            detector.start(self.settings)
+
+        self.log("Starting in-memory operations")
+        self.create_arrays()
+        if kpis:
+            self.kpis.start(self.area_occupancy)
+
+    def create_arrays(self):
+        """
+        Build the product, location and pallet arrays from the warehouse settings.
+
+        Ids follow the insertion order of create_tables: each product is followed by
+        its Floor locations, then come the LoadingDock, Storage and Buffer locations,
+        and all pallets start empty in Storage. Array index i holds the row with id i + 1.
+
+        Returns:
+        None
+        """
+        settings = self.settings
+        products = settings["product_name"]
+        units_per_pallet = settings["n_units_per_pallet"]
+        floor_locations = settings["floor_locations"]
+        n_products = len(products)
+        n_floor = len(floor_locations)
+        buffer_locations = settings["buffer_locations"]
+
+        # Products
+        self.units_per_pallet = np.asarray(units_per_pallet, dtype=np.int64)
+
+        # Locations: Floor, LoadingDock, Storage, Buffer
+        self.location_label = (list(floor_locations)
+                               + [settings["loading_dock_label"], settings["storage_label"]]
+                               + list(buffer_locations))
+        self.location_area = np.concatenate([
+            np.full(n_floor, FLOOR),
+            [LOADING_DOCK, STORAGE],
+            np.full(len(buffer_locations), BUFFER),
+        ]).astype(np.int64)
+        self.location_product = np.concatenate([
+            np.repeat(np.arange(1, n_products + 1), settings["floor_slots_per_product"]),
+            np.zeros(2 + len(buffer_locations)),
+        ]).astype(np.int64)
+        self.location_max_pallets = np.concatenate([
+            np.full(n_floor, settings["n_pallets_floor"]),
+            [settings["n_pallets_loading_dock"], settings["n_pallets_storage"]],
+            np.full(len(buffer_locations), settings["n_pallets_buffer"]),
+        ]).astype(np.int64)
+        self.loading_dock_location = n_floor
+        self.storage_location = n_floor + 1
+
+        # Pallets, all empty in Storage; product 0 stands for NULL
+        n_pallets = settings["n_pallets_storage"]
+        self.pallet_product = np.zeros(n_pallets, dtype=np.int64)
+        self.pallet_location = np.full(n_pallets, self.storage_location, dtype=np.int64)
+        self.pallet_quantity = np.zeros(n_pallets, dtype=np.int64)
+        # Fractions of a unit left unsold by the sales batches of sale_carry_day
+        self.sale_carry = np.zeros(n_pallets)
+        self.sale_carry_day = None
+
+        # Pallets per location and per area, kept in step with pallet_location by move()
+        self.occupancy = np.bincount(self.pallet_location, minlength=len(self.location_area))
+        self.area_occupancy = np.bincount(self.location_area, weights=self.occupancy,
+                                          minlength=len(AREAS)).astype(np.int64)
+
+        self.movements = []
+        # KPI rows of the finished days, and Floor stock-out days and last stock-out
+        # day of every product, as in DailyKPIs and SkuKPIs
+        self.daily_kpis = []
+        self.stockout_days = np.zeros(n_products, dtype=np.int64)
+        self.last_stockout_day = np.zeros(n_products, dtype=np.int64)
+        self.log(f"Created {n_products} products, {len(self.location_area)} locations "
+                 f"and {n_pallets} pallets in memory")
+
+    def move(self, pallets, locations):
+        """
+        Move pallets to new locations and update the occupancy counters.
+
+        With history, the moves are recorded for the PalletHistory rows of the phase.
+
+        Parameters:
+        pallets (numpy.ndarray): Indices of the pallets to move.
+        locations (numpy.ndarray): Index of the destination location of every pallet.
+
+        Returns:
+        None
+        """
+        if self.history and len(pallets):
+            self.history_rows.append((pallets, self.pallet_product[pallets],
+                                      self.pallet_location[pallets], locations))
+        np.subtract.at(self.occupancy, self.pallet_location[pallets], 1)
+        np.add.at(self.occupancy, locations, 1)
+        np.subtract.at(self.area_occupancy, self.location_area[self.pallet_location[pallets]], 1)
+        np.add.at(self.area_occupancy, self.location_area[locations], 1)
+        self.pallet_location[pallets] = locations
+
+    def pallets_in(self, area):
+        """
+        Return the indices of the pallets in an area, in id order.
+
+        Parameters:
+        area (int): One of STORAGE, LOADING_DOCK, FLOOR or BUFFER.
+
+        Returns:
+        numpy.ndarray: Pallet indices.
+        """
+        return np.flatnonzero(self.location_area[self.pallet_location] == area)
+
+    @profiled
+    def truck_arrives(self, products=None):
+        """
+        Handle the arrival of a truck with new pallets.
+
+        Draws the truck contents exactly like WarehouseOps.truck_arrives and fills the
+        lowest-id Storage pallets with them.
+
+        Parameters:
+        products (list): Zero-based indices of the products on this truck (default is
+            None, i.e. one truck with the day's whole delivery).
+
+        Returns:
+        int: The number of pallets moved to the LoadingDock.
+        """
+        units_per_pallet = self.settings["n_units_per_pallet"]
+        new_product_indices = self.draw_delivery() if products is None else products
+
+        storage_pallets = self.pallets_in(STORAGE)
+        n_moved = min(len(new_product_indices), len(storage_pallets))
+        pallets = storage_pallets[:n_moved]
+        indices = np.asarray(new_product_indices[:n_moved], dtype=np.int64)
+
+        self.pallet_product[pallets] = indices + 1
+        self.pallet_quantity[pallets] = np.asarray(units_per_pallet, dtype=np.int64)[indices]
+        self.move(pallets, np.full(n_moved, self.loading_dock_location))
+        self.log(f"Moved {n_moved} pallets to LoadingDock")
+        if n_moved < len(new_product_indices):
+            self.log("No more pallets available in storage to move to LoadingDock", WARNING)
+        if self.detector is not None:
+            self.detector.truck_unloaded(len(new_product_indices), n_moved)
+
+        # Log the movement after all pallets have been moved
+        self.log_movement('TruckArrives')
+        return n_moved
+
+    @profiled
+    def move_pallets_from_loading_dock(self):
+        """
+        Move pallets from the loading dock to the floor or buffer areas.
+
+        Pallets are handled in id order: each goes to a Floor location of its product
+        with a free slot, otherwise to a Buffer location with a free slot, otherwise it stays on
+        the loading dock.
+
+        Returns:
+        None
+        """
+        pallets = self.pallets_in(LOADING_DOCK)
+
+        # One entry per free Floor slot, in location id order
+        floor = np.flatnonzero(self.location_area == FLOOR)
+        free_slots = np.repeat(floor, self.location_max_pallets[floor] - self.occupancy[floor])
+        slot = match_by_key(self.pallet_product[pallets], self.location_product[free_slots])
+        to_floor = slot >= 0
+        self.move(pallets[to_floor], free_slots[slot[to_floor]])
+
+        # The rest takes the free Buffer slots in location id order
+        remaining = pallets[~to_floor]
+        buffer = np.flatnonzero(self.location_area == BUFFER)
+        buffer_slots = np.repeat(buffer, self.location_max_pallets[buffer] - self.occupancy[buffer])
+        n_buffered = min(len(remaining), len(buffer_slots))
+        self.move(remaining[:n_buffered], buffer_slots[:n_buffered])
+        if self.kpis is not None:
+            self.kpis.spill(n_buffered)
+
+        self.log(f"Moved {int(to_floor.sum())} pallets to Floor and {n_buffered} to Buffer")
+        if n_buffered < len(remaining):
+            self.log(f"No available space for {len(remaining) - n_buffered} pallets", WARNING)
+
+        # Log the movement after all pallets have been moved
+        self.log_movement('LoadingDock')
+
+    @profiled
+    def simulate_daily_sales(self, share=1.0):
+        """
+        Simulate daily sales of products on the floor area.
+
+        Draws one sale per Floor pallet in id order, exactly like
+        WarehouseOps.draw_sales, and sends emptied pallets to Storage.
+
+        Parameters:
+        share (float): Part of the daily sales this batch sells (default is 1.0).
+
+        Returns:
+        None
+        """
+        min_sale = self.settings["min_sale"]
+        if self.sale_carry_day != self.day:
+            self.sale_carry[:] = 0.0
+            self.sale_carry_day = self.day
+
+        pallets = self.pallets_in(FLOOR)
+        draws = np.array([self.rng.uniform(min_sale, 1) * share for _ in range(len(pallets))])
+        sales = draws * self.units_per_pallet[self.pallet_product[pallets] - 1] + self.sale_carry[pallets]
+        sale_quantity = sales.astype(np.int64)
+        new_quantity = self.pallet_quantity[pallets] - sale_quantity
+
+        # Carry the unsold fraction of a unit to the day's next batch
+        keep = (new_quantity > 0) if share < 1 else np.zeros(len(pallets), dtype=bool)
+        self.sale_carry[pallets] = np.where(keep, sales - sale_quantity, 0.0)
+        self.pallet_quantity[pallets] = new_quantity
+
+        # Move the empty pallets to Storage
+        empty = pallets[new_quantity <= 0]
+        self.move(empty, np.full(len(empty), self.storage_location))
+        self.pallet_product[empty] = 0
+        self.pallet_quantity[empty] = 0
+        self.log(f"Sold from {len(pallets)} pallets, {len(empty)} emptied and moved to Storage")
+
+        # Log the movement
+        self.log_movement('Sales')
+
+    @profiled
+    def move_from_buffer(self):
+        """
+        Move pallets from the buffer area to the floor area.
+
+        Every Floor location with a free slot takes the lowest-id Buffer pallet of its
+        product, if there is one.
+
+        Returns:
+        None
+        """
+        floor = np.flatnonzero(self.location_area == FLOOR)
+        open_floor = floor[self.occupancy[floor] < self.location_max_pallets[floor]]
+
+        buffer_pallets = self.pallets_in(BUFFER)
+        match = match_by_key(self.location_product[open_floor], self.pallet_product[buffer_pallets])
+        found = match >= 0
+        self.move(buffer_pallets[match[found]], open_floor[found])
+        self.log(f"Moved {int(found.sum())} pallets from Buffer to Floor")
+
+        # Log the movement
+        self.log_movement('BufferMoves')
+
+    @profiled
+    def log_movement(self, event):
+        """
+        Log the movement of pallets in the warehouse.
+
+        Appends the day, the event and the current pallet count of every area to the
+        in-memory movements list. With history, the moves of the phase are kept under
+        the one-based index of the new movement, the id persist() gives it.
+
+        Parameters:
+        event (str): A description of the movement event.
+
+        Returns:
+        tuple: The recorded (storage, loadingdock, floor, buffer) counts.
+        """
+        counts = tuple(int(count) for count in self.area_occupancy)
+        self.movements.append((self.day, event, *counts))
+        if self.history_rows:
+            self.write_history(len(self.movements))
+        if self.detector is not None:
+            self.detector.observe(event, counts)
+        if self.kpis is not None:
+            self.kpis.observe(event, counts)
+        self.log(f"Logged movement: {event}")
+        return counts
+
+    def write_history(self, movement_id):
+        """
+        Stamp the recorded moves of a phase with the day and movement id.
+
+        Parameters:
+        movement_id (int): One-based index of the movement logged for the phase.
+
+        Returns:
+        None
+        """
+        pallets, products, sources, destinations = (np.concatenate(column)
+                                                    for column in zip(*self.history_rows))
+        self.history_rows = []
+        # Array indices become one-based ids; product 0 stays 0 for NULL
+        self.history_chunks.append(np.column_stack([
+            np.full(len(pallets), self.day), np.full(len(pallets), movement_id),
+            pallets + 1, products, sources + 1, destinations + 1]).astype(np.int64))
+
+    def refresh_kpis(self):
+        """
+        Add the KPIs of the finished day, like WarehouseOps.refresh_kpis.
+
+        Returns:
+        dict: The KPI row of the day.
+        """
+        floor = self.location_area == FLOOR
+        stock = np.bincount(self.location_product[floor], weights=self.occupancy[floor],
+                            minlength=len(self.stockout_days) + 1)[1:]
+        stockout = stock == 0
+        self.stockout_days += stockout
+        self.last_stockout_day[stockout] = self.day
+        row = self.kpis.end_day(self.day, int(stockout.sum()))
+        self.daily_kpis.append(row)
+        return row
+
+    def fetch_kpis(self, day=None):
+        """
+        Fetch the KPI row of a day, like WarehouseOps.fetch_kpis.
+
+        Parameters:
+        day (int): The day (default is None, i.e. the latest day).
+
+        Returns:
+        dict: The row keyed by KPI_COLUMNS, or None if there is none.
+        """
+        rows = [row for row in self.daily_kpis if day is None or row["day"] == day]
+        return dict(rows[-1]) if rows else None
+
+    def fetch_sku_kpis(self, limit=10):
+        """
+        Fetch the products with the most Floor stock-out days, like WarehouseOps.fetch_sku_kpis.
+
+        Parameters:
+        limit (int): Number of products (default is 10).
+
+        Returns:
+        list: (product_id, stockout_days, last_stockout_day) rows, most stock-out days first.
+        """
+        order = np.lexsort((np.arange(len(self.stockout_days)), -self.stockout_days))[:limit]
+        return [(int(index) + 1, int(self.stockout_days[index]), int(self.last_stockout_day[index]) or None)
+                for index in order]
+
+    def fetch_pallet_history(self, pallet_id=None):
+        """
+        Fetch the recorded pallet moves, like WarehouseOps.fetch_pallet_history.
+
+        Parameters:
+        pallet_id (int): Only the moves of this pallet (default is None, all moves).
+
+        Returns:
+        list: Rows in HISTORY_COLUMNS order, in the order of the moves.
+        """
+        if not self.history_chunks:
+            return []
+        history = np.concatenate(self.history_chunks)
+        if pallet_id is not None:
+            history = history[history[:, 2] == pallet_id]
+        history = history[np.lexsort((history[:, 2], history[:, 1]))]
+        return [(day, movement_id, pallet, product or None, source, destination)
+                for day, movement_id, pallet, product, source, destination in history.tolist()]
+
+    def fetch_movements(self):
+        """
+        Fetch the pallet counts recorded by log_movement.
+
+        Returns:
+        list: (storage, loadingdock, floor, buffer) tuples in the order they were logged.
+        """
+        return [movement[2:] for movement in self.movements]
+
+    def fetch_daily_summary(self, max_points=500):
+        """
+        Aggregate the movements per day, bucketed like WarehouseOps.fetch_daily_summary.
+
+        Parameters:
+        max_points (int): Maximum number of buckets (default is 500).
+
+        Returns:
+        list: (first_day, last_day, then min, mean and max of storage, loadingdock,
+        floor and buffer) tuples in day order.
+        """
+        days = np.array([movement[0] for movement in self.movements], dtype=np.int64)
+        counts = np.array([movement[2:] for movement in self.movements], dtype=np.int64).reshape(-1, 4)
+        counts = counts[days > 0]
+        days = days[days > 0]
+        if not len(days):
+            return []
+
+        # Movements are in day order, so every bucket is a contiguous slice
+        bucket = (days - 1) * max_points // max(int(days.max()), 1)
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        sizes = np.diff(np.r_[starts, len(days)])
+        low = np.minimum.reduceat(counts, starts)
+        mean = np.add.reduceat(counts, starts) / sizes[:, None]
+        high = np.maximum.reduceat(counts, starts)
+        return [(int(days[start]), int(days[start + size - 1]),
+                 *(value for area in range(4) for value in (int(low[i, area]), float(mean[i, area]),
+                                                            int(high[i, area]))))
+                for i, (start, size) in enumerate(zip(starts, sizes))]
+
+    def export_movements(self, path, format="csv", chunk_size=10000):
+        """
+        Write the in-memory movements to a CSV or Parquet file.
+
+        Parameters:
+        path (str): Output file path.
+        format (str): "csv" or "parquet" (default is "csv").
+        chunk_size (int): Rows per Parquet row group (default is 10000).
+
+        Returns:
+        None
+        """
+        if format == "csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(MOVEMENT_COLUMNS)
+                writer.writerows(self.movements)
+        elif format == "parquet":
+            write_parquet(path, (self.movements[start:start + chunk_size]
+                                 for start in range(0, len(self.movements), chunk_size)))
+        else:
+            raise ValueError(f"Unknown export format: {format}")
+        self.log(f"Exported movements to {path}")
+
+    def snapshot(self, name="snapshot"):
+        """
+        Freeze the current state of the warehouse in memory.
+
+        The pallet arrays, occupancy counters, movements, day counter and random
+        generator state are copied. The layout arrays are rebuilt from the settings
+        by fork().
+
+        Parameters:
+        name (str): Label kept with the snapshot, for logging only (default is "snapshot").
+
+        Returns:
+        dict: The snapshot, to pass to fork(); it can be pickled to other processes.
+        """
+        snapshot = {
+            "name": name,
+            "settings": dict(self.settings),
+            "day": self.day,
+            "rng_state": self.rng.getstate(),
+            "pallet_product": self.pallet_product.copy(),
+            "pallet_location": self.pallet_location.copy(),
+            "pallet_quantity": self.pallet_quantity.copy(),
+            "occupancy": self.occupancy.copy(),
+            "area_occupancy": self.area_occupancy.copy(),
+            "movements": list(self.movements),
+            "history_chunks": list(self.history_chunks),
+            "daily_kpis": [dict(row) for row in self.daily_kpis],
+            "stockout_days": self.stockout_days.copy(),
+            "last_stockout_day": self.last_stockout_day.copy(),
+        }
+        self.log(f"Snapshot {name} taken on day {self.day}")
+        return snapshot
+
+    @classmethod
+    def fork(cls, snapshot, seed=None, settings=None, **options):
+        """
+        Start a new in-memory run from a snapshot taken by snapshot().
+
+        Parameters:
+        snapshot (dict): The snapshot.
+        seed (int): Reseed the random generator instead of continuing the snapshot's
+            draws (default is None).
+        settings (dict): Overrides of the daily-phase settings such as new_pallets or
+            min_sale (default is None).
+        **options: Other constructor arguments, e.g. log_path, log_options or profile.
+
+        Returns:
+        ArrayWarehouseOps: The forked instance.
+        """
+        ops = cls(settings=merge_run_settings(snapshot["settings"], settings or {}), **options)
+        ops.day = snapshot["day"]
+        ops.rng.setstate(snapshot["rng_state"])
+        if seed is not None:
+            ops.rng.seed(seed)
+        for name in ("pallet_product", "pallet_location", "pallet_quantity", "occupancy", "area_occupancy"):
+            setattr(ops, name, snapshot[name].copy())
+        ops.movements = list(snapshot["movements"])
+        if ops.history:
+            ops.history_chunks = list(snapshot["history_chunks"])
+        if ops.kpis is not None:
+            ops.daily_kpis = [dict(row) for row in snapshot["daily_kpis"]]
+            ops.stockout_days = snapshot["stockout_days"].copy()
+            ops.last_stockout_day = snapshot["last_stockout_day"].copy()
+            ops.kpis.start(ops.area_occupancy, ops.fetch_kpis())
+        ops.log(f"Forked from snapshot {snapshot['name']} on day {ops.day}")
+        return ops
+
+    def persist(self, dbname: str, user: str, password: str, host: str):
+        """
+        Write the current state and the movements of the run to PostgreSQL.
+
+        The database is dropped and recreated with create_tables, then the pallets are
+        brought to their in-memory state with one UPDATE and the movements are inserted
+        in one statement. Recorded pallet moves are copied into PalletHistory, one
+        partition per day, and tracked KPIs into DailyKPIs and SkuKPIs.
+
+        Parameters:
+        dbname (str): Name of the database.
+        user (str): Username for the database.
+        password (str): Password for the database user.
+        host (str): Database host address.
+
+        Returns:
+        None
+        """
+        self.dbname = dbname
+        self.user = user
+        self.password = password
+        self.host = host
+        self.drop_db()
+        self.connect_db()
+        self.create_tables()
+
+        self.cur.execute("""
+            UPDATE Pallets p
+            SET product_id = v.product_id, location_id = v.location_id, quantity = v.quantity
+            FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[])
+                AS v(id, product_id, location_id, quantity)
+            WHERE p.id = v.id
+        """, (list(range(1, len(self.pallet_location) + 1)),
+              [int(product) or None for product in self.pallet_product],
+              (self.pallet_location + 1).tolist(),
+              self.pallet_quantity.tolist()))
+        execute_values(self.cur, """
+            INSERT INTO Movements (day, event, storage, loadingdock, floor, buffer) VALUES %s
+        """, self.movements)
+        history = self.fetch_pallet_history()
+        for day, rows in itertools.groupby(sorted(history), key=lambda row: row[0]):
+            self.day_partition(day)
+            self.copy_rows("PalletHistory", HISTORY_COLUMNS, rows)
+        if self.daily_kpis:
+            self.copy_rows("DailyKPIs", KPI_COLUMNS,
+                           ([row[name] for name in KPI_COLUMNS] for row in self.daily_kpis))
+            self.cur.execute("""
+                UPDATE SkuKPIs s
+                SET stockout_days = v.stockout_days, last_stockout_day = NULLIF(v.last_stockout_day, 0)
+                FROM unnest(%s::int[], %s::int[], %s::int[]) AS v(product_id, stockout_days, last_stockout_day)
+                WHERE s.product_id = v.product_id
+            """, (list(range(1, len(self.stockout_days) + 1)), self.stockout_days.tolist(),
+                  self.last_stockout_day.tolist()))
+        self.conn.commit()
+        self.log(f"Persisted {len(self.movements)} movements to database {self.dbname}")
@@ -0,0 +1,106 @@
+"""
+Benchmark of the hot per-pallet queries with and without the INDEXES of procedures.py.
+
+For every pallet count a warehouse is bulk-seeded, warmed up for a few days so that
+every area holds pallets, and each query is timed with the indexes dropped and then
+recreated:
+
+    python benchmarks/bench_indexes.py --password secret --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from warehouse_ops import WarehouseOps  # noqa: E402
+
+# name -> (query, function of ops returning its parameters)
+QUERIES = {
+    "storage pick": (
+        "SELECT id FROM Pallets WHERE location_id = %s ORDER BY id LIMIT 1",
+        lambda ops: (ops.storage_location_id,)),
+    "dock scan": (
+        "SELECT id, product_id FROM Pallets WHERE location_id = %s ORDER BY id",
+        lambda ops: (ops.loading_dock_location_id,)),
+    "buffer search": (
+        """SELECT p.id FROM Pallets p JOIN LocationOccupancy o ON o.location_id = p.location_id
+           WHERE p.product_id = %s AND o.area = 'Buffer' ORDER BY p.id LIMIT 1""",
+        lambda ops: (1,)),
+    "floor check": (
+        """SELECT location_id FROM LocationOccupancy
+           WHERE area = 'Floor' AND product_id = %s AND pallets < max_pallets
+           ORDER BY location_id LIMIT 1""",
+        lambda ops: (1,)),
+    "open floor": (
+        """SELECT location_id, product_id FROM LocationOccupancy
+           WHERE area = 'Floor' AND pallets < max_pallets ORDER BY location_id""",
+        lambda ops: ()),
+    "free buffer": (
+        """SELECT location_id FROM LocationOccupancy WHERE area = 'Buffer' AND pallets < max_pallets
+           ORDER BY location_id LIMIT 1""",
+        lambda ops: ()),
+}
+
+
+def time_query(ops, query, params, repeats):
+    """
+    Return the median wall-clock time of a query in milliseconds.
+
+    Parameters:
+    ops (WarehouseOps): Connected instance.
+    query (str): SQL text.
+    params (tuple): Query parameters.
+    repeats (int): Number of timed executions.
+
+    Returns:
+    float: Median time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ops.cur.execute(query, params)
+        ops.cur.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dbname", default="bench_indexes")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=os.environ.get("PGPASSWORD", ""))
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'pallets':>8}  {'query':<14} {'no index ms':>12} {'index ms':>10}")
+    for n_pallets in args.sizes:
+        ops = WarehouseOps(dbname=args.dbname, user=args.user, password=args.password,
+                           host=args.host, drop_db_flag=True, seed=1, bulk=True,
+                           settings={"n_pallets_storage": n_pallets}, log_path=os.devnull)
+        ops.simulate(days=args.days)
+
+        results = {}
+        for indexed in (False, True):
+            if indexed:
+                ops.create_indexes()
+            else:
+                ops.drop_indexes()
+                ops.cur.execute("ANALYZE")
+            ops.conn.commit()
+            for name, (query, params) in QUERIES.items():
+                results.setdefault(name, []).append(time_query(ops, query, params(ops), args.repeats))
+
+        for name, (without, with_index) in results.items():
+            print(f"{n_pallets:>8}  {name:<14} {without:>12.3f} {with_index:>10.3f}")
+        ops.conn.close()
+        ops.drop_db()
+
+
+if __name__ == "__main__":
+    main()
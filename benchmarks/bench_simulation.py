@@ -0,0 +1,264 @@
+"""
+Benchmark of the simulation phases at several warehouse scales.
+
+Every scale/mode pair runs in a fresh worker process. It builds a warehouse with the
+given number of SKUs using layout.generate_layout, so Buffer locations and Storage
+pallets are in proportion to the default 20-SKU layout, and simulates a few days. It reports the time spent in each
+phase of simulate(), days per second, queries per day and the peak resident memory
+of the worker. Phase times and statement counts come from the profiler of
+instrumentation.py:
+
+    python benchmarks/bench_simulation.py --scales 20 1000 10000 --modes per_row bulk array
+    python benchmarks/bench_simulation.py --save-baseline
+
+Results are compared with benchmarks/baselines.json. A case is flagged as a regression
+if queries/day grows by more than --tolerance, and the script then exits with status 1.
+Absolute days/sec depend on the machine and are not checked; with --reference, days/sec
+relative to that mode at the same scale in the same run are checked as well:
+
+    python benchmarks/bench_simulation.py --scales 1000 --modes bulk server_side --reference bulk
+
+With --initdb the PostgreSQL modes run against a throwaway cluster created with initdb
+and pg_ctl in a temporary directory and removed afterwards.
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import NO_PHASE  # noqa: E402
+from layout import generate_layout  # noqa: E402
+from warehouse_ops import WarehouseOps  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# mode -> WarehouseOps arguments; "array" runs ArrayWarehouseOps instead
+MODES = {
+    "per_row": {},
+    "prepared": {"prepared": True},
+    "bulk": {"bulk": True},
+    "server_side": {"bulk": True, "server_side": True},
+    "array": None,
+}
+
+
+def scaled_settings(n_skus, floor_slots=1, seed=None):
+    """
+    Build the settings of a benchmark warehouse.
+
+    Parameters:
+    n_skus (int): Number of products.
+    floor_slots (int): Floor locations per product (default is 1).
+    seed (int): Seed of the generated layout (default is None).
+
+    Returns:
+    dict: Overrides for warehouse_settings(); empty for the default 20-SKU layout.
+    """
+    if n_skus == len(WarehouseOps.warehouse_settings()["product_name"]) and floor_slots == 1:
+        return {}
+    return generate_layout(n_skus, floor_slots=floor_slots, seed=seed)
+
+
+def run_case(case):
+    """
+    Run one scale/mode pair; executed inside a fresh worker process.
+
+    Parameters:
+    case (dict): n_skus, floor_slots, mode, days, seed and connection.
+
+    Returns:
+    dict: Timings, days/sec, queries/day and peak memory of the run.
+    """
+    settings = scaled_settings(case["n_skus"], case["floor_slots"], case["seed"])
+    log_options = {"level": "ERROR"}
+    start = time.perf_counter()
+    if MODES[case["mode"]] is None:
+        from array_ops import ArrayWarehouseOps
+        ops = ArrayWarehouseOps(seed=case["seed"], settings=settings, log_path=os.devnull,
+                                log_options=log_options, profile=True)
+    else:
+        connection = case["connection"]
+        ops = WarehouseOps(dbname=connection["dbname"], user=connection["user"],
+                           password=connection["password"], host=connection["host"],
+                           drop_db_flag=True, seed=case["seed"], settings=settings,
+                           log_path=os.devnull, log_options=log_options, profile=True,
+                           **MODES[case["mode"]])
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ops.simulate(days=case["days"])
+    elapsed = time.perf_counter() - start
+    # Statements outside the phases belong to the setup
+    phases = [row for row in ops.profile_report().by_phase() if row["phase"] != NO_PHASE]
+
+    if ops.conn is not None:
+        ops.conn.close()
+        ops.drop_db()
+
+    days = case["days"]
+    return {
+        "setup_s": round(setup, 3),
+        "days_per_sec": round(days / elapsed, 3),
+        "queries_per_day": round(sum(row["statements"] for row in phases) / days, 1),
+        # Phase times include the log_movement calls nested in them
+        "phase_ms_per_day": {row["phase"]: round(row["phase_ms"] / days, 2) for row in phases},
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+@contextlib.contextmanager
+def throwaway_cluster(pg_bin=None, user="postgres"):
+    """
+    Start a temporary PostgreSQL cluster listening on a Unix socket only.
+
+    Parameters:
+    pg_bin (str): Directory holding initdb and pg_ctl (default is None, i.e. search PATH).
+    user (str): Superuser of the new cluster (default is "postgres").
+
+    Returns:
+    generator: Yields the socket directory, usable as the host of a connection.
+    """
+    def binary(name):
+        path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+        if not path:
+            raise FileNotFoundError(f"{name} not found; pass --pg-bin")
+        return path
+
+    root = tempfile.mkdtemp(prefix="bench_pg_")
+    data = os.path.join(root, "data")
+    subprocess.run([binary("initdb"), "-D", data, "-U", user, "--auth=trust", "--no-sync"],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([binary("pg_ctl"), "-D", data, "-l", os.path.join(root, "server.log"), "-w",
+                    "-o", f"-c listen_addresses='' -k {root} -c fsync=off", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield root
+    finally:
+        subprocess.run([binary("pg_ctl"), "-D", data, "-m", "fast", "-w", "stop"],
+                       check=False, stdout=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def relative_speed(cases, key, reference):
+    """
+    Return the days/sec of a case relative to the reference mode at the same scale.
+
+    Parameters:
+    cases (dict): Case key -> result of run_case().
+    key (str): Case key, "<scale>/<mode>".
+    reference (str): Mode to divide by, or None.
+
+    Returns:
+    float: The ratio, or None without a reference run at that scale.
+    """
+    scale, mode = key.split("/")
+    reference_case = cases.get(f"{scale}/{reference}")
+    if reference is None or mode == reference or not reference_case or not reference_case["days_per_sec"]:
+        return None
+    return cases[key]["days_per_sec"] / reference_case["days_per_sec"]
+
+
+def compare(results, baselines, tolerance, reference=None):
+    """
+    Compare results with stored baselines.
+
+    Queries per day do not depend on the machine and are compared directly. Days per
+    second are only compared as ratios to the reference mode of the same run, so the
+    baselines hold on a faster or slower machine.
+
+    Parameters:
+    results (dict): Case key -> result of run_case().
+    baselines (dict): Case key -> stored result.
+    tolerance (float): Allowed relative change, e.g. 0.2 for 20%.
+    reference (str): Mode the speed of the others is measured against (default is
+        None, i.e. only compare queries per day).
+
+    Returns:
+    list: Regression messages, empty if there is none.
+    """
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        speed = relative_speed(results, key, reference)
+        baseline_speed = relative_speed(baselines, key, reference)
+        if speed is not None and baseline_speed is not None and speed < baseline_speed * (1 - tolerance):
+            regressions.append(f"{key}: {speed:.3f}x the days/sec of {reference}, "
+                               f"baseline {baseline_speed:.3f}x")
+        if result["queries_per_day"] > baseline["queries_per_day"] * (1 + tolerance):
+            regressions.append(f"{key}: {result['queries_per_day']} queries/day, "
+                               f"baseline {baseline['queries_per_day']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dbname", default="bench_simulation")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=os.environ.get("PGPASSWORD", ""))
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--initdb", action="store_true", help="run against a throwaway cluster")
+    parser.add_argument("--pg-bin", help="directory of initdb and pg_ctl for --initdb")
+    parser.add_argument("--scales", type=int, nargs="+", default=[20, 1000, 10000])
+    parser.add_argument("--floor-slots", type=int, default=1, help="Floor locations per SKU")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=["bulk", "server_side", "array"])
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--reference", choices=list(MODES),
+                        help="also compare days/sec relative to this mode")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        host = args.host
+        if args.initdb and any(MODES[mode] is not None for mode in args.modes):
+            host = stack.enter_context(throwaway_cluster(args.pg_bin, args.user))
+        connection = {"dbname": args.dbname, "user": args.user, "password": args.password, "host": host}
+
+        results = {}
+        print(f"{'skus':>6}  {'mode':<12} {'days/s':>8} {'queries/day':>12} {'peak MB':>8}  phase ms/day")
+        for n_skus in args.scales:
+            for mode in args.modes:
+                case = {"n_skus": n_skus, "floor_slots": args.floor_slots, "mode": mode, "days": args.days, "seed": args.seed,
+                        "connection": connection}
+                # A new worker per case keeps the peak memory of one case from hiding the next
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    result = pool.submit(run_case, case).result()
+                # Layouts with several Floor slots per SKU get baselines of their own
+                scale = n_skus if args.floor_slots == 1 else f"{n_skus}x{args.floor_slots}"
+                results[f"{scale}/{mode}"] = result
+                phases = " ".join(f"{name}={ms}" for name, ms in result["phase_ms_per_day"].items())
+                print(f"{n_skus:>6}  {mode:<12} {result['days_per_sec']:>8} {result['queries_per_day']:>12} "
+                      f"{result['peak_rss_mb']:>8}  {phases}")
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        with open(args.baselines, "w") as f:
+            json.dump({**baselines, **results}, f, indent=2, sort_keys=True)
+        print(f"Baselines saved to {args.baselines}")
+        return
+
+    regressions = compare(results, baselines, args.tolerance, args.reference)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
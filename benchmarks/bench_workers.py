@@ -0,0 +1,75 @@
+"""
+Benchmark of the concurrent pallet movement of workers.py for growing worker counts.
+
+For every worker count a warehouse is bulk-seeded with the same seed and simulated
+for a few days with ConcurrentWorkers. The script reports the pallets moved per second
+of put-away and replenishment, the speedup over the first worker count, and the
+retries and drain rounds that show how much the workers got in each other's way:
+
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --skus 2000 --days 5
+
+The speedup is bounded by the CPUs available to PostgreSQL and by the occupancy
+counter rows every move updates.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout import generate_layout  # noqa: E402
+from warehouse_ops import WarehouseOps  # noqa: E402
+from workers import ConcurrentWorkers  # noqa: E402
+
+
+def run_case(n_workers, settings, args):
+    """
+    Simulate a fresh warehouse with a number of workers.
+
+    Parameters:
+    n_workers (int): Number of concurrent workers.
+    settings (dict): Overrides for warehouse_settings().
+    args (argparse.Namespace): Connection, days and seed arguments.
+
+    Returns:
+    dict: ConcurrentWorkers.throughput() of the run.
+    """
+    ops = WarehouseOps(dbname=args.dbname, user=args.user, password=args.password, host=args.host,
+                       drop_db_flag=True, seed=args.seed, bulk=True, settings=settings,
+                       log_path=os.devnull, log_options={"level": "ERROR"})
+    workers = ConcurrentWorkers(ops, workers=n_workers)
+    try:
+        workers.run(days=args.days)
+    finally:
+        workers.close()
+        ops.conn.close()
+        ops.drop_db()
+    return workers.throughput()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dbname", default="bench_workers")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default=os.environ.get("PGPASSWORD", ""))
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--floor-slots", type=int, default=2, help="Floor locations per SKU")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    settings = generate_layout(args.skus, floor_slots=args.floor_slots, seed=args.seed)
+    print(f"{'workers':>7}  {'moved':>7} {'seconds':>8} {'moves/s':>8} {'speedup':>8} {'retries':>8} {'rounds':>7}")
+    first = None
+    for n_workers in args.workers:
+        result = run_case(n_workers, settings, args)
+        first = first or result["moves_per_sec"]
+        speedup = result["moves_per_sec"] / first if first else 0.0
+        print(f"{n_workers:>7}  {result['moved']:>7} {result['seconds']:>8} {result['moves_per_sec']:>8} "
+              f"{speedup:>8.2f} {result['retries']:>8} {result['rounds']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Online bottleneck detection for simulation runs.
+
+A BottleneckDetector watches the pallet counts that log_movement records and stops
+a run whose outcome is already settled. At the end of every day it checks three
+conditions:
+
+    storage_exhausted  Storage ran out before a truck was unloaded on storage_patience
+                       days in a row; trucks are short-shipped
+    buffer_saturated   Buffer was full and pallets were left on the LoadingDock at the
+                       end of window days in a row
+    dock_growth        the end-of-day LoadingDock count grew by at least min_growth
+                       pallets per day (least-squares slope) over the last window days,
+                       never dropping to zero
+
+Pass a detector to WarehouseOps or ArrayWarehouseOps. simulate() and the event
+scheduler then stop after the day on which a condition is met, and ops.stop_reason
+says why:
+
+    ops = ArrayWarehouseOps(seed=1, settings={"new_pallets": 1.0}, detector=BottleneckDetector())
+    ops.simulate(days=365)
+    print(ops.day, ops.stop_reason)
+"""
+import collections
+
+from event_log import WARNING
+
+
+class BottleneckDetector:
+    def __init__(self, window=7, min_growth=0.5, storage_patience=3):
+        """
+        Configure the detector.
+
+        Parameters:
+        window (int): Days of history the Buffer and LoadingDock checks look at (default is 7).
+        min_growth (float): LoadingDock growth in pallets per day that counts as a
+            backlog (default is 0.5).
+        storage_patience (int): Days in a row with a short-shipped truck (default is 3).
+
+        Returns:
+        None
+        """
+        if window < 2:
+            raise ValueError("The detector window must cover at least two days")
+        self.window = window
+        self.min_growth = min_growth
+        self.storage_patience = storage_patience
+        self.buffer_capacity = None
+        self.start({"buffer_locations": [], "n_pallets_buffer": 1})
+
+    def start(self, settings):
+        """
+        Reset the history for a new run.
+
+        Parameters:
+        settings (dict): Warehouse settings of the run; the Buffer is full with
+            n_pallets_buffer pallets on every Buffer location.
+
+        Returns:
+        None
+        """
+        self.buffer_capacity = len(settings["buffer_locations"]) * settings["n_pallets_buffer"]
+        self.end_of_day = collections.deque(maxlen=self.window)
+        self.latest = None
+        self.short_today = False
+        self.short_days = 0
+        self.saturated_days = 0
+        self.reason = None
+        self.message = None
+        self.day = None
+
+    def observe(self, event, counts):
+        """
+        Take the pallet counts recorded by log_movement.
+
+        Parameters:
+        event (str): The movement event.
+        counts (tuple): (storage, loadingdock, floor, buffer) after the event.
+
+        Returns:
+        None
+        """
+        self.latest = counts
+
+    def truck_unloaded(self, drawn, loaded):
+        """
+        Take the outcome of a truck arrival; the day counts as short-shipped if
+        Storage ran out of pallets before the truck was unloaded.
+
+        Parameters:
+        drawn (int): Pallets on the truck.
+        loaded (int): Pallets moved from Storage to the LoadingDock.
+
+        Returns:
+        None
+        """
+        if loaded < drawn:
+            self.short_today = True
+
+    def end_day(self, day):
+        """
+        Check the finished day against the bottleneck conditions.
+
+        Parameters:
+        day (int): The day that ended.
+
+        Returns:
+        str: The reason code if the run should stop, otherwise None.
+        """
+        if self.reason is not None or self.latest is None:
+            return self.reason
+        storage, loadingdock, _, buffer = self.latest
+        self.end_of_day.append(loadingdock)
+        self.short_days = self.short_days + 1 if self.short_today else 0
+        self.short_today = False
+        backed_up = loadingdock > 0 and buffer >= self.buffer_capacity
+        self.saturated_days = self.saturated_days + 1 if backed_up else 0
+
+        if self.short_days >= self.storage_patience:
+            self.stop(day, "storage_exhausted",
+                      f"Trucks short-shipped for {self.short_days} days")
+        elif self.saturated_days >= self.window:
+            self.stop(day, "buffer_saturated",
+                      f"Buffer full with pallets left on the LoadingDock for {self.saturated_days} days")
+        elif len(self.end_of_day) == self.window and min(self.end_of_day) > 0:
+            growth = self.slope(self.end_of_day)
+            if growth >= self.min_growth:
+                self.stop(day, "dock_growth",
+                          f"LoadingDock grew {growth:.2f} pallets/day over {self.window} days")
+        return self.reason
+
+    @staticmethod
+    def slope(values):
+        """
+        Return the least-squares slope of equally spaced values.
+
+        Parameters:
+        values (sequence): Values on consecutive days.
+
+        Returns:
+        float: Change per day.
+        """
+        n = len(values)
+        mean_x = (n - 1) / 2
+        mean_y = sum(values) / n
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+        variance = sum((x - mean_x) ** 2 for x in range(n))
+        return covariance / variance
+
+    def stop(self, day, reason, message):
+        """
+        Record why and when the run should stop.
+
+        Parameters:
+        day (int): The day the condition was met.
+        reason (str): Reason code.
+        message (str): Human-readable explanation.
+
+        Returns:
+        None
+        """
+        self.day = day
+        self.reason = reason
+        self.message = message
+
+
+def check_day(ops):
+    """
+    Run the detector of a warehouse at the end of its current day.
+
+    Sets ops.stop_reason and logs a warning the first time a condition is met.
+
+    Parameters:
+    ops (WarehouseOps): Warehouse whose day just ended.
+
+    Returns:
+    bool: True if the run should stop.
+    """
+    detector = ops.detector
+    if detector is None:
+        return False
+    if ops.stop_reason is None and detector.end_day(ops.day):
+        ops.stop_reason = detector.reason
+        ops.log(f"Stopping after day {ops.day}: {detector.message}", WARNING)
+    return ops.stop_reason is not None
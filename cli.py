@@ -0,0 +1,202 @@
+"""
+Command line of the warehouse simulation.
+
+    python -m warehouse_ops run --days 30 --seed 1 --backend bulk --drop --figure run.png
+
+Every option can be given on the command line; the connection falls back to the
+usual libpq environment variables (PGDATABASE, PGUSER, PGPASSWORD, PGHOST), so no
+password has to appear in a job definition. Nothing is asked interactively.
+matplotlib is only imported when --figure or --show is given, and --figure renders
+without a display. The run prints a one-line JSON summary to stdout, and the exit
+status is 0 when the run completed, even if a bottleneck detector stopped it early.
+It is 2 for invalid options or settings and 1, with a one-line message, when the
+database cannot be reached or, without --drop, holds no warehouse tables.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# backend -> WarehouseOps arguments; "array" runs ArrayWarehouseOps instead
+BACKENDS = {
+    "per_row": {},
+    "prepared": {"prepared": True},
+    "bulk": {"bulk": True},
+    "server_side": {"bulk": True, "server_side": True},
+    "array": None,
+}
+
+
+def build_parser():
+    """
+    Build the argument parser of the command line.
+
+    Returns:
+    argparse.ArgumentParser: The parser, with one sub-command per action.
+    """
+    parser = argparse.ArgumentParser(prog="python -m warehouse_ops",
+                                     description="Warehouse pallet simulation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="simulate a number of days")
+    run.add_argument("--days", type=int, default=10, help="days to simulate (default 10)")
+    run.add_argument("--seed", type=int, help="seed of the trucks and sales draws")
+    run.add_argument("--backend", choices=list(BACKENDS), default="per_row",
+                     help="simulation code path (default per_row)")
+    run.add_argument("--settings", help="JSON or TOML settings file, see layout.load_settings")
+    run.add_argument("--dbname", default=os.environ.get("PGDATABASE", "FC3"))
+    run.add_argument("--user", default=os.environ.get("PGUSER", "postgres"))
+    run.add_argument("--password", default=os.environ.get("PGPASSWORD", ""))
+    run.add_argument("--host", default=os.environ.get("PGHOST", "localhost"))
+    run.add_argument("--drop", action="store_true",
+                     help="drop and recreate the database; without it the tables must exist")
+    run.add_argument("--persist", action="store_true",
+                     help="with --backend array, write the finished run to the database")
+    run.add_argument("--history", action="store_true", help="record every pallet move in PalletHistory")
+    run.add_argument("--itersize", type=int,
+                     help="stream the phase scans in server-side cursors of this many rows")
+    run.add_argument("--kpis", action="store_true", help="keep daily KPIs in DailyKPIs and SkuKPIs")
+    run.add_argument("--early-stop", action="store_true",
+                     help="stop once a BottleneckDetector settles the outcome")
+    run.add_argument("--profile", help="write a per-phase profile to this file, as CSV for .csv and JSON otherwise")
+    run.add_argument("--export", help="write the Movements trace to this file")
+    run.add_argument("--export-format", choices=("csv", "parquet"), default="csv")
+    run.add_argument("--figure", help="save the occupancy chart to this file, without a display")
+    run.add_argument("--show", action="store_true", help="open the occupancy chart in a window")
+    run.add_argument("--log", default="log.txt", help="log file (default log.txt)")
+    run.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"), default="INFO")
+    return parser
+
+
+def check_database(args, tables):
+    """
+    Check that PostgreSQL accepts the connection of a run, and that the tables exist.
+
+    Parameters:
+    args (argparse.Namespace): Arguments of the run command.
+    tables (bool): Also check that the database of the run holds the warehouse tables.
+
+    Returns:
+    None
+    """
+    import psycopg2
+    dbname = args.dbname if tables else "postgres"
+    try:
+        conn = psycopg2.connect(dbname=dbname, user=args.user, password=args.password, host=args.host,
+                                connect_timeout=10)
+    except psycopg2.OperationalError as e:
+        reason = str(e).strip().splitlines() or ["connection failed"]
+        raise ConnectionError(f"cannot connect to database {dbname} on {args.host}: {reason[0].strip()}")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('locations') IS NOT NULL")
+            exists = cur.fetchone()[0]
+    finally:
+        conn.close()
+    if tables and not exists:
+        raise ConnectionError(f"database {dbname} has no warehouse tables; run with --drop to create them")
+
+
+def create_ops(args, settings):
+    """
+    Create the warehouse of a run from the parsed arguments.
+
+    Parameters:
+    args (argparse.Namespace): Arguments of the run command.
+    settings (dict): Setting overrides, empty for the defaults.
+
+    Returns:
+    WarehouseOps: The warehouse, an ArrayWarehouseOps for the array backend.
+    """
+    if BACKENDS[args.backend] is not None or args.persist:
+        # Without --drop the run continues on the existing tables
+        check_database(args, tables=BACKENDS[args.backend] is not None and not args.drop)
+    detector = None
+    if args.early_stop:
+        from bottlenecks import BottleneckDetector
+        detector = BottleneckDetector()
+    common = {"seed": args.seed, "settings": settings, "log_path": args.log,
+              "log_options": {"level": args.log_level}, "profile": args.profile is not None,
+              "detector": detector, "history": args.history,
+              "kpis": args.kpis}
+    if BACKENDS[args.backend] is None:
+        if args.itersize is not None:
+            raise ValueError("--itersize does not apply to --backend array")
+        from array_ops import ArrayWarehouseOps
+        return ArrayWarehouseOps(**common)
+
+    from warehouse_ops import WarehouseOps
+    return WarehouseOps(args.dbname, args.user, args.password, args.host, args.drop,
+                        itersize=args.itersize, **common, **BACKENDS[args.backend])
+
+
+def run(args):
+    """
+    Simulate, then write the outputs that were asked for.
+
+    Parameters:
+    args (argparse.Namespace): Arguments of the run command.
+
+    Returns:
+    dict: Summary of the run: backend, days, final occupancy, stop reason, latest KPIs
+    and seconds.
+    """
+    if args.persist and args.backend != "array":
+        raise ValueError("--persist only applies to --backend array")
+    settings = {}
+    if args.settings:
+        from layout import load_settings
+        settings = load_settings(args.settings)
+
+    ops = create_ops(args, settings)
+    start = time.perf_counter()
+    ops.simulate(days=args.days)
+    elapsed = time.perf_counter() - start
+
+    if args.persist:
+        ops.persist(args.dbname, args.user, args.password, args.host)
+    if args.profile:
+        ops.profile_report().dump(args.profile, format="csv" if args.profile.lower().endswith(".csv") else "json")
+    if args.export:
+        ops.export_movements(args.export, format=args.export_format)
+    if args.figure:
+        ops.make_figure(args.figure)
+    if args.show:
+        ops.make_figure()
+
+    movements = ops.fetch_movements()
+    return {
+        "backend": args.backend,
+        "days": ops.day,
+        "final": dict(zip(("storage", "loadingdock", "floor", "buffer"),
+                          map(int, movements[-1]) if movements else ())),
+        "stop_reason": ops.stop_reason,
+        "kpis": ops.fetch_kpis() if args.kpis else None,
+        "seconds": round(elapsed, 3),
+    }
+
+
+def main(argv=None):
+    """
+    Run the command line.
+
+    Parameters:
+    argv (list): Arguments without the program name (default is None, i.e. sys.argv).
+
+    Returns:
+    int: Exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "run":
+            print(json.dumps(run(args)))
+    except ValueError as e:
+        # Invalid settings or option combinations; exits with status 2
+        parser.error(str(e))
+    except ConnectionError as e:
+        # Unreachable server or missing tables; exits with status 1
+        print(f"{parser.prog}: error: {e}", file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,190 @@
+"""
+Buffered, level-filtered event log for WarehouseOps.
+
+Messages below the configured level are dropped before they are queued, and callers
+check enabled() before building per-pallet messages, so those are not even formatted
+when their level is off. The rest are queued and written by a background thread in
+batches, so the simulation never waits for the disk. Three output formats are supported:
+
+    text    one message per line, like the original log.txt
+    jsonl   one {"ts", "run_id", "level", "message"} object per line
+    binary  length-prefixed records: timestamp, level, run id and message
+
+read_events() reads any of them back, optionally filtered by run id and level.
+"""
+import atexit
+import json
+import queue
+import struct
+import threading
+import time
+import uuid
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+FORMATS = ("text", "jsonl", "binary")
+
+# Binary record header: timestamp, level, run id length, message length
+RECORD_HEADER = struct.Struct("<dBHI")
+
+
+class EventLog:
+    def __init__(self, path: str = "log.txt", level="DEBUG", format: str = "text",
+                 run_id: str = None, append: bool = False, batch_size: int = 1000,
+                 flush_interval: float = 0.5):
+        """
+        Open the log file and start the writer thread.
+
+        Parameters:
+        path (str): Path of the log file (default is "log.txt").
+        level (str or int): Lowest level that is written (default is "DEBUG").
+        format (str): "text", "jsonl" or "binary" (default is "text").
+        run_id (str): Identifier stored with every jsonl/binary record (default is a random id).
+        append (bool): Append to the file instead of truncating it (default is False).
+        batch_size (int): Records written per batch at most (default is 1000).
+        flush_interval (float): Seconds a record may wait before the batch is flushed (default is 0.5).
+
+        Returns:
+        None
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown log format: {format}")
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        self.format = format
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.file = open(path, ("a" if append else "w") + ("b" if format == "binary" else ""))
+        self.queue = queue.SimpleQueue()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.writer, name="EventLog", daemon=True)
+        self.thread.start()
+        # Flush what is left when the interpreter exits without close()
+        atexit.register(self.close)
+
+    def enabled(self, level):
+        """
+        Tell whether messages of a level would be written.
+
+        Parameters:
+        level (int): Message level.
+
+        Returns:
+        bool: True if the level is at or above the configured level.
+        """
+        return level >= self.level
+
+    def write(self, message, level=INFO):
+        """
+        Queue a message for writing.
+
+        Parameters:
+        message (str): The message to be logged.
+        level (int): Message level (default is INFO).
+
+        Returns:
+        None
+        """
+        if level >= self.level and not self.closed:
+            self.queue.put((time.time(), level, message))
+
+    def encode(self, record):
+        """
+        Format a record for the configured output format.
+
+        Parameters:
+        record (tuple): (timestamp, level, message).
+
+        Returns:
+        str or bytes: The formatted record.
+        """
+        timestamp, level, message = record
+        if self.format == "text":
+            return f"{message}\n"
+        if self.format == "jsonl":
+            return json.dumps({"ts": timestamp, "run_id": self.run_id,
+                               "level": LEVEL_NAMES.get(level, level), "message": message}) + "\n"
+        run_id = self.run_id.encode()
+        text = message.encode()
+        return RECORD_HEADER.pack(timestamp, level, len(run_id), len(text)) + run_id + text
+
+    def writer(self):
+        """
+        Write queued records in batches until close() queues the stop marker.
+
+        Returns:
+        None
+        """
+        empty = b"" if self.format == "binary" else ""
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if record is None:
+                    running = False
+                    break
+                batch.append(self.encode(record))
+            if batch:
+                self.file.write(empty.join(batch))
+                self.file.flush()
+
+    def close(self):
+        """
+        Write the remaining records, stop the writer thread and close the file.
+
+        Returns:
+        None
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        atexit.unregister(self.close)
+
+
+def read_events(path, format="jsonl", run_id=None, level="DEBUG"):
+    """
+    Read the records of a jsonl or binary event log.
+
+    Parameters:
+    path (str): Path of the log file.
+    format (str): "jsonl" or "binary" (default is "jsonl").
+    run_id (str): Only yield records of this run (default is None, all runs).
+    level (str or int): Only yield records at or above this level (default is "DEBUG").
+
+    Returns:
+    generator: {"ts", "run_id", "level", "message"} dicts in file order.
+    """
+    min_level = LEVELS[level] if isinstance(level, str) else level
+    if format == "jsonl":
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if (run_id is None or record["run_id"] == run_id) and LEVELS[record["level"]] >= min_level:
+                    yield record
+    elif format == "binary":
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                timestamp, record_level, run_id_length, message_length = RECORD_HEADER.unpack(header)
+                record_run_id = f.read(run_id_length).decode()
+                message = f.read(message_length).decode()
+                if (run_id is None or record_run_id == run_id) and record_level >= min_level:
+                    yield {"ts": timestamp, "run_id": record_run_id,
+                           "level": LEVEL_NAMES.get(record_level, record_level), "message": message}
+    else:
+        raise ValueError(f"Cannot read log format: {format}")
@@ -0,0 +1,281 @@
+"""
+Per-phase query and latency instrumentation for WarehouseOps.
+
+With profile=True, WarehouseOps opens its cursor with InstrumentedCursor. That
+cursor times every statement and reports it to a Profiler together with the
+number of rows it touched. Phase methods decorated with @profiled tell the
+profiler which phase and day is running. A nested phase, such as log_movement
+called at the end of a dispatch, gets its own statements. The collected counters
+come back as a ProfileReport:
+
+    ops = WarehouseOps(..., profile=True)
+    ops.simulate(days=10)
+    report = ops.profile_report()
+    print(report.format())
+    report.dump("profile.json")
+"""
+import contextlib
+import csv
+import functools
+import json
+import math
+import time
+
+import psycopg2.extensions
+
+# Phase of statements issued outside any profiled method (setup, exports, ...)
+NO_PHASE = "other"
+
+
+def percentile(values, q):
+    """
+    Return the nearest-rank percentile of a list of values.
+
+    Parameters:
+    values (list): Sample values.
+    q (float): Percentile between 0 and 100.
+
+    Returns:
+    float: The percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class PhaseStats:
+    """Counters of one phase on one day."""
+    __slots__ = ("calls", "seconds", "latencies", "statements", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.latencies = []
+        self.statements = 0
+        self.rows = 0
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Create an empty profiler.
+
+        Returns:
+        None
+        """
+        self.stats = {}
+        self.stack = [(0, NO_PHASE)]
+
+    def stats_for(self, key):
+        """
+        Return the counters of a (day, phase) pair, creating them on first use.
+
+        Parameters:
+        key (tuple): (day, phase).
+
+        Returns:
+        PhaseStats: The counters.
+        """
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = PhaseStats()
+        return stats
+
+    @contextlib.contextmanager
+    def phase(self, name, day):
+        """
+        Attribute the statements issued inside the block to a phase.
+
+        Parameters:
+        name (str): Phase name.
+        day (int): Simulated day the phase runs on.
+
+        Returns:
+        generator: Context manager timing the block.
+        """
+        key = (day, name)
+        self.stack.append(key)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            stats = self.stats_for(key)
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - start
+
+    def record(self, seconds, rows, statements=1):
+        """
+        Record one round-trip of the current phase.
+
+        Parameters:
+        seconds (float): Round-trip latency.
+        rows (int): Rows returned or affected, -1 if unknown.
+        statements (int): Statements sent in the round-trip (default is 1).
+
+        Returns:
+        None
+        """
+        stats = self.stats_for(self.stack[-1])
+        stats.latencies.append(seconds)
+        stats.statements += statements
+        if rows > 0:
+            stats.rows += rows
+
+    def report(self):
+        """
+        Summarize the counters collected so far.
+
+        Returns:
+        ProfileReport: One row per day and phase.
+        """
+        rows = []
+        for (day, name), stats in sorted(self.stats.items()):
+            rows.append({
+                "day": day,
+                "phase": name,
+                "calls": stats.calls,
+                "phase_ms": round(stats.seconds * 1000, 3),
+                "statements": stats.statements,
+                "sql_ms": round(sum(stats.latencies) * 1000, 3),
+                "p99_ms": round(percentile(stats.latencies, 99) * 1000, 3),
+                "rows": stats.rows,
+            })
+        return ProfileReport(rows, {key: stats.latencies for key, stats in self.stats.items()})
+
+
+class ProfileReport:
+    def __init__(self, rows, latencies):
+        """
+        Wrap the per-day, per-phase rows of a Profiler.
+
+        Parameters:
+        rows (list): Dicts with day, phase, calls, phase_ms, statements, sql_ms, p99_ms and rows.
+        latencies (dict): (day, phase) -> statement latencies in seconds, used to
+            compute percentiles over several days.
+
+        Returns:
+        None
+        """
+        self.rows = rows
+        self.latencies = latencies
+
+    def by_phase(self):
+        """
+        Aggregate the rows over all days.
+
+        Returns:
+        list: One dict per phase with calls, phase_ms, statements, sql_ms, p99_ms,
+        rows and statements_per_day.
+        """
+        totals = {}
+        for row in self.rows:
+            total = totals.setdefault(row["phase"], {"phase": row["phase"], "days": set(), "calls": 0,
+                                                     "phase_ms": 0.0, "statements": 0, "sql_ms": 0.0,
+                                                     "rows": 0})
+            total["days"].add(row["day"])
+            for name in ("calls", "phase_ms", "statements", "sql_ms", "rows"):
+                total[name] += row[name]
+        for name, total in totals.items():
+            latencies = [seconds for (_, phase), values in self.latencies.items() if phase == name
+                         for seconds in values]
+            total["p99_ms"] = round(percentile(latencies, 99) * 1000, 3)
+            total["phase_ms"] = round(total["phase_ms"], 3)
+            total["sql_ms"] = round(total["sql_ms"], 3)
+            total["statements_per_day"] = round(total["statements"] / len(total.pop("days")), 1)
+        return list(totals.values())
+
+    def format(self):
+        """
+        Render the per-phase totals as a text table.
+
+        Returns:
+        str: The table.
+        """
+        lines = [f"{'phase':<32} {'calls':>7} {'phase ms':>10} {'stmts':>8} {'stmts/day':>10} "
+                 f"{'sql ms':>10} {'p99 ms':>8} {'rows':>9}"]
+        for row in self.by_phase():
+            lines.append(f"{row['phase']:<32} {row['calls']:>7} {row['phase_ms']:>10.1f} {row['statements']:>8} "
+                         f"{row['statements_per_day']:>10} {row['sql_ms']:>10.1f} {row['p99_ms']:>8.3f} "
+                         f"{row['rows']:>9}")
+        return "\n".join(lines)
+
+    def dump(self, path, format="json"):
+        """
+        Write the per-day rows to a file.
+
+        Parameters:
+        path (str): Output file path.
+        format (str): "json" (rows and per-phase totals) or "csv" (rows only) (default is "json").
+
+        Returns:
+        None
+        """
+        if format == "json":
+            with open(path, "w") as f:
+                json.dump({"phases": self.by_phase(), "days": self.rows}, f, indent=2)
+        elif format == "csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.rows[0]) if self.rows else ["day", "phase"])
+                writer.writeheader()
+                writer.writerows(self.rows)
+        else:
+            raise ValueError(f"Unknown profile format: {format}")
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor reporting the latency and row count of every statement to its profiler."""
+    profiler = None
+
+    def timed(self, run, *args, statements=1):
+        start = time.perf_counter()
+        try:
+            return run(*args)
+        finally:
+            if self.profiler is not None:
+                self.profiler.record(time.perf_counter() - start, self.rowcount, statements)
+
+    def execute(self, query, vars=None):
+        return self.timed(super().execute, query, vars)
+
+    def execute_statements(self, statements):
+        # Several statements in one string are one round-trip, but each of them counts
+        return self.timed(super().execute, b";".join(statements), None, statements=len(statements))
+
+    def executemany(self, query, vars_list):
+        return self.timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self.timed(super().copy_expert, sql, file, size)
+
+    def fetchmany(self, size):
+        # Only a named (server-side) cursor goes to the server to fetch
+        if self.name is None:
+            return super().fetchmany(size)
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        if self.profiler is not None:
+            self.profiler.record(time.perf_counter() - start, len(rows))
+        return rows
+
+
+def profiled(method):
+    """
+    Decorate a phase method so that its statements are attributed to it.
+
+    The instance needs a profiler attribute; when it is None the method runs unchanged.
+
+    Parameters:
+    method (function): Phase method of WarehouseOps.
+
+    Returns:
+    function: The wrapped method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        with self.profiler.phase(method.__name__, self.day):
+            return method(self, *args, **kwargs)
+    return wrapper
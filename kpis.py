@@ -0,0 +1,130 @@
+"""
+Incremental KPIs of a simulation run.
+
+A KPITracker is fed the pallet counts that log_movement records and the spills the
+put-aways report, and turns each finished day into one row of daily KPIs plus
+running totals:
+
+    arrivals          pallets the trucks brought (LoadingDock growth on TruckArrives)
+    spilled           pallets put away from the LoadingDock to the Buffer, as reported
+                      by the phases that move them
+    stranded          pallets left on the LoadingDock at the end of the day
+    storage_left      empty pallets left in Storage at the end of the day
+    storage_min       fewest empty pallets in Storage during the day
+    stockout_skus     products without a Floor pallet at the end of the day
+
+The totals (total_arrivals, total_spilled, stranded_days, storage_empty_days and
+stockout_sku_days) are carried from day to day, so the latest row summarizes the whole
+run and a dashboard reads it in constant time. With kpis=True, WarehouseOps writes
+the rows to the DailyKPIs table and counts the stock-out days of every product in
+SkuKPIs; ArrayWarehouseOps keeps both in memory and persist() writes them:
+
+    ops = WarehouseOps(..., kpis=True)
+    ops.simulate(days=365)
+    print(ops.fetch_kpis())
+"""
+
+# Columns of the DailyKPIs table, in order
+KPI_COLUMNS = ("day", "arrivals", "spilled", "stranded", "storage_left", "storage_min", "stockout_skus",
+               "total_arrivals", "total_spilled", "stranded_days", "storage_empty_days",
+               "stockout_sku_days")
+
+# Running totals and the daily value each one adds up
+TOTALS = {
+    "total_arrivals": lambda row: row["arrivals"],
+    "total_spilled": lambda row: row["spilled"],
+    "stranded_days": lambda row: row["stranded"] > 0,
+    "storage_empty_days": lambda row: row["storage_min"] == 0,
+    "stockout_sku_days": lambda row: row["stockout_skus"],
+}
+
+
+class KPITracker:
+    def __init__(self):
+        """
+        Start a tracker with empty totals; start() sets the counts it continues from.
+
+        Returns:
+        None
+        """
+        self.start()
+
+    def start(self, counts=(0, 0, 0, 0), latest=None):
+        """
+        Continue from a known state, e.g. a fresh warehouse or a fork.
+
+        Parameters:
+        counts (tuple): (storage, loadingdock, floor, buffer) before the next event
+            (default is an empty warehouse).
+        latest (dict): The last KPI row written, whose totals carry on (default is
+            None, i.e. totals start at zero).
+
+        Returns:
+        None
+        """
+        self.previous = tuple(counts)
+        self.totals = {name: int(latest[name]) if latest else 0 for name in TOTALS}
+        self.reset_day()
+
+    def reset_day(self):
+        """
+        Clear the counters of the current day.
+
+        Returns:
+        None
+        """
+        self.arrivals = 0
+        self.spilled = 0
+        self.storage_min = self.previous[0]
+
+    def spill(self, pallets):
+        """
+        Count pallets put away from the LoadingDock to the Buffer.
+
+        The phases report their moves, since the Buffer count alone nets them against
+        the Buffer pallets replenishing the Floor in the same phase.
+
+        Parameters:
+        pallets (int): Pallets moved to the Buffer.
+
+        Returns:
+        None
+        """
+        self.spilled += pallets
+
+    def observe(self, event, counts):
+        """
+        Take the pallet counts recorded by log_movement.
+
+        Parameters:
+        event (str): The movement event.
+        counts (tuple): (storage, loadingdock, floor, buffer) after the event.
+
+        Returns:
+        None
+        """
+        storage, loadingdock, _, _ = counts
+        if event == 'TruckArrives':
+            self.arrivals += max(loadingdock - self.previous[1], 0)
+        self.storage_min = min(self.storage_min, storage)
+        self.previous = tuple(counts)
+
+    def end_day(self, day, stockout_skus):
+        """
+        Close a day and return its KPI row.
+
+        Parameters:
+        day (int): The day that ended.
+        stockout_skus (int): Products without a Floor pallet at the end of the day.
+
+        Returns:
+        dict: The row, keyed by KPI_COLUMNS.
+        """
+        storage, loadingdock, _, _ = self.previous
+        row = {"day": day, "arrivals": self.arrivals, "spilled": self.spilled, "stranded": loadingdock,
+               "storage_left": storage, "storage_min": self.storage_min, "stockout_skus": stockout_skus}
+        for name, daily in TOTALS.items():
+            self.totals[name] += int(daily(row))
+        row.update(self.totals)
+        self.reset_day()
+        return row
@@ -0,0 +1,157 @@
+"""
+Warehouse settings loader and synthetic layout generator.
+
+The default settings describe a 20-SKU warehouse. Larger fulfilment centres are
+described either by a settings file or by generate_layout():
+
+    from layout import generate_layout, load_settings
+
+    settings = generate_layout(n_skus=20000, floor_slots=3, seed=1)
+    settings = load_settings("fc_large.toml")
+    ops = WarehouseOps(..., settings=settings)
+
+A settings file (JSON, or TOML on Python 3.11+) holds setting overrides at the top
+level. An optional "layout" table holds generate_layout() arguments, and the
+overrides are applied on top of the generated layout:
+
+    new_pallets = 0.6
+
+    [layout]
+    n_skus = 5000
+    floor_slots = 2
+
+validate_settings() rejects settings whose lists do not line up. Without it,
+create_tables would zip them and silently drop products.
+"""
+import json
+import os
+import random
+
+# Per-SKU proportions of the default 20-SKU warehouse
+BUFFER_PER_SKU = 1.5
+STORAGE_PER_SKU = 5
+LOADING_DOCK_PER_SKU = 1.5
+UNITS_PER_PALLET = (200, 250, 350, 400, 450, 500, 550, 600, 800)
+
+# Settings that shape the products, locations and pallets; the rest drive the daily phases
+LAYOUT_SETTINGS = ("product_name", "n_units_per_pallet", "floor_locations", "floor_slots_per_product",
+                   "n_pallets_floor", "loading_dock_label", "n_pallets_loading_dock",
+                   "buffer_locations", "n_pallets_buffer", "storage_label", "n_pallets_storage")
+
+
+def generate_layout(n_skus, floor_slots=1, buffer_per_sku=BUFFER_PER_SKU,
+                    storage_per_sku=STORAGE_PER_SKU, loading_dock_per_sku=LOADING_DOCK_PER_SKU,
+                    units_per_pallet=UNITS_PER_PALLET, seed=None):
+    """
+    Generate a consistent product, location and capacity layout.
+
+    Every SKU gets floor_slots Floor locations. Buffer locations, Storage pallets and
+    LoadingDock capacity scale with the number of SKUs.
+
+    Parameters:
+    n_skus (int): Number of products.
+    floor_slots (int): Floor locations per product (default is 1).
+    buffer_per_sku (float): Buffer locations per product (default is 1.5).
+    storage_per_sku (float): Storage pallets per product (default is 5).
+    loading_dock_per_sku (float): LoadingDock capacity per product (default is 1.5).
+    units_per_pallet (tuple): Pallet sizes the products draw from (default is UNITS_PER_PALLET).
+    seed (int): Seed for the pallet size draw (default is None).
+
+    Returns:
+    dict: Settings overriding those of warehouse_settings().
+    """
+    if n_skus < 1 or floor_slots < 1:
+        raise ValueError("A layout needs at least one SKU and one Floor slot per SKU")
+    rng = random.Random(seed)
+    width = len(str(n_skus))
+    return {
+        "product_name": [f"SKU-{i:0{width}d}" for i in range(1, n_skus + 1)],
+        "n_units_per_pallet": rng.choices(units_per_pallet, k=n_skus),
+        "floor_locations": [f"F-{i:0{width}d}-{slot}" for i in range(1, n_skus + 1)
+                            for slot in range(1, floor_slots + 1)],
+        "floor_slots_per_product": floor_slots,
+        "buffer_locations": [f"B-{i:0{width}d}" for i in range(1, round(n_skus * buffer_per_sku) + 1)],
+        "n_pallets_storage": max(round(n_skus * storage_per_sku), 1),
+        "n_pallets_loading_dock": max(round(n_skus * loading_dock_per_sku), 1),
+    }
+
+
+def load_settings(path):
+    """
+    Load setting overrides from a JSON or TOML file.
+
+    Parameters:
+    path (str): File path; the extension selects the format (.json or .toml).
+
+    Returns:
+    dict: Settings overriding those of warehouse_settings().
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path) as f:
+            data = json.load(f)
+    elif extension == ".toml":
+        import tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        raise ValueError(f"Unknown settings format: {path}")
+
+    layout = data.pop("layout", None)
+    return {**(generate_layout(**layout) if layout else {}), **data}
+
+
+def validate_settings(settings):
+    """
+    Check that the per-product and per-location settings line up.
+
+    Parameters:
+    settings (dict): Complete warehouse settings.
+
+    Returns:
+    None
+    """
+    n_products = len(settings["product_name"])
+    slots = settings["floor_slots_per_product"]
+    errors = []
+    if n_products == 0:
+        errors.append("product_name is empty")
+    if len(settings["n_units_per_pallet"]) != n_products:
+        errors.append(f"n_units_per_pallet has {len(settings['n_units_per_pallet'])} entries "
+                      f"for {n_products} products")
+    if slots < 1:
+        errors.append("floor_slots_per_product must be at least 1")
+    elif len(settings["floor_locations"]) != n_products * slots:
+        errors.append(f"floor_locations has {len(settings['floor_locations'])} entries, "
+                      f"expected {n_products} products x {slots} slots")
+    labels = [*settings["floor_locations"], settings["loading_dock_label"], settings["storage_label"],
+              *settings["buffer_locations"]]
+    if len(set(labels)) != len(labels):
+        errors.append("location labels are not unique")
+    for name in ("n_pallets_floor", "n_pallets_loading_dock", "n_pallets_buffer"):
+        if settings[name] < 1:
+            errors.append(f"{name} must be at least 1")
+    if settings["n_pallets_storage"] < 0:
+        errors.append("n_pallets_storage must not be negative")
+    if errors:
+        raise ValueError("Invalid warehouse settings: " + "; ".join(errors))
+
+
+def merge_run_settings(settings, overrides):
+    """
+    Apply setting overrides to a warehouse that already exists, e.g. a fork of a snapshot.
+
+    Only the settings that drive the daily phases can change. The layout is already
+    in the tables or arrays.
+
+    Parameters:
+    settings (dict): Settings the warehouse was built with.
+    overrides (dict): New values; layout settings must equal the current ones.
+
+    Returns:
+    dict: The merged settings.
+    """
+    changed = [name for name in LAYOUT_SETTINGS if name in overrides and overrides[name] != settings[name]]
+    if changed:
+        raise ValueError(f"Layout settings cannot change after the warehouse is built: {', '.join(changed)}")
+    return {**settings, **overrides}
@@ -0,0 +1,272 @@
+"""
+SQL shared by the set-based phases of WarehouseOps and the server-side procedures.
+
+INDEXES lists the indexes behind the per-pallet queries. OCCUPANCY_SQL creates
+the LocationOccupancy and AreaOccupancy counter tables and the triggers keeping
+them in step with Pallets. LocationOccupancy doubles as the free-slot list: it
+carries the product and capacity of every location, and a partial index holds
+only the locations with a free slot. WarehouseOps.create_tables() creates both once the
+tables are populated.
+
+Install the procedures with WarehouseOps.install_procedures(); simulate_day(seed, settings)
+then runs the five phases of a simulated day inside the database, and
+simulate_days(days, seed, settings) runs several days in one call.
+"""
+
+# Indexes matching the phase queries: the Storage pick and dock scan by location in id
+# order, the Buffer search by product, the Floor lookups by area and product, and two
+# free-slot lists, which only hold the locations that can take another pallet: by area
+# in location order for the Buffer slot search and the open Floor scan, and by product
+# for the Floor slot search
+INDEXES = {
+    "pallets_location_idx": "Pallets (location_id, id)",
+    "pallets_product_location_idx": "Pallets (product_id, location_id, id)",
+    "locations_area_product_idx": "Locations (area, product_id, id)",
+    "location_occupancy_area_idx": "LocationOccupancy (area, location_id) WHERE pallets < max_pallets",
+    "location_occupancy_free_idx":
+        "LocationOccupancy (area, product_id, location_id) WHERE pallets < max_pallets",
+}
+
+# Pallet counts per location and per area, maintained by statement-level triggers on
+# Pallets so that capacity checks and snapshots never have to count Pallets rows. The
+# product and capacity of a location are copied from Locations so that free slots are
+# found without a join.
+OCCUPANCY_SQL = """
+    CREATE TABLE LocationOccupancy (
+        location_id INTEGER PRIMARY KEY REFERENCES Locations(id),
+        area VARCHAR(255) NOT NULL,
+        product_id INTEGER,
+        max_pallets INTEGER NOT NULL,
+        pallets INTEGER NOT NULL
+    );
+
+    CREATE TABLE AreaOccupancy (
+        area VARCHAR(255) PRIMARY KEY,
+        pallets INTEGER NOT NULL
+    );
+
+    INSERT INTO LocationOccupancy (location_id, area, product_id, max_pallets, pallets)
+    SELECT l.id, l.area, l.product_id, l.max_pallets, COUNT(p.id)
+    FROM Locations l
+    LEFT JOIN Pallets p ON p.location_id = l.id
+    GROUP BY l.id;
+
+    INSERT INTO AreaOccupancy (area, pallets)
+    SELECT a.area, COALESCE(SUM(o.pallets), 0)
+    FROM (VALUES ('Storage'), ('LoadingDock'), ('Floor'), ('Buffer')) AS a(area)
+    LEFT JOIN LocationOccupancy o ON o.area = a.area
+    GROUP BY a.area;
+
+    -- Add change to the counters of every listed location, once per occurrence
+    CREATE OR REPLACE FUNCTION shift_occupancy(location_ids INTEGER[], change INTEGER)
+    RETURNS VOID LANGUAGE sql AS $$
+        WITH delta AS (
+            SELECT location_id, COUNT(*) * change AS pallets
+            FROM unnest(location_ids) AS location_id
+            WHERE location_id IS NOT NULL
+            GROUP BY location_id
+        ),
+        by_location AS (
+            UPDATE LocationOccupancy o
+            SET pallets = o.pallets + d.pallets
+            FROM delta d
+            WHERE o.location_id = d.location_id
+            RETURNING o.area, d.pallets
+        )
+        UPDATE AreaOccupancy a
+        SET pallets = a.pallets + s.pallets
+        FROM (SELECT area, SUM(pallets) AS pallets FROM by_location GROUP BY area) s
+        WHERE a.area = s.area;
+    $$;
+
+    CREATE OR REPLACE FUNCTION track_occupancy() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM shift_occupancy(ARRAY(SELECT location_id FROM new_pallets), 1);
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM shift_occupancy(ARRAY(SELECT location_id FROM old_pallets), -1);
+        ELSE
+            -- Only pallets that changed location move the counters
+            PERFORM shift_occupancy(ARRAY(
+                SELECT o.location_id FROM old_pallets o JOIN new_pallets n ON n.id = o.id
+                WHERE o.location_id IS DISTINCT FROM n.location_id), -1);
+            PERFORM shift_occupancy(ARRAY(
+                SELECT n.location_id FROM old_pallets o JOIN new_pallets n ON n.id = o.id
+                WHERE o.location_id IS DISTINCT FROM n.location_id), 1);
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER pallets_occupancy_insert AFTER INSERT ON Pallets
+        REFERENCING NEW TABLE AS new_pallets
+        FOR EACH STATEMENT EXECUTE FUNCTION track_occupancy();
+    CREATE TRIGGER pallets_occupancy_update AFTER UPDATE ON Pallets
+        REFERENCING OLD TABLE AS old_pallets NEW TABLE AS new_pallets
+        FOR EACH STATEMENT EXECUTE FUNCTION track_occupancy();
+    CREATE TRIGGER pallets_occupancy_delete AFTER DELETE ON Pallets
+        REFERENCING OLD TABLE AS old_pallets
+        FOR EACH STATEMENT EXECUTE FUNCTION track_occupancy();
+"""
+
+# Dispatch every LoadingDock pallet: first to a free Floor slot of its product,
+# then to a free Buffer slot, ranking both sides with window functions.
+# %(dock_id)s is the LoadingDock location id. Callers may append a RETURNING clause
+# over p (Pallets) and m (id, location_id, area).
+DISPATCH_SQL = """
+    WITH dock AS (
+        SELECT id, product_id,
+               ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY id) AS product_rank
+        FROM Pallets
+        WHERE location_id = %(dock_id)s
+    ),
+    floor_slots AS (
+        SELECT o.location_id, o.product_id,
+               ROW_NUMBER() OVER (PARTITION BY o.product_id ORDER BY o.location_id, slot) AS slot_rank
+        FROM LocationOccupancy o
+        CROSS JOIN LATERAL generate_series(1, o.max_pallets - o.pallets) AS slot
+        WHERE o.area = 'Floor' AND o.pallets < o.max_pallets
+          AND o.product_id IN (SELECT product_id FROM dock)
+    ),
+    to_floor AS (
+        SELECT d.id, f.location_id
+        FROM dock d
+        JOIN floor_slots f ON f.product_id = d.product_id AND f.slot_rank = d.product_rank
+    ),
+    leftover AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS rank
+        FROM dock
+        WHERE id NOT IN (SELECT id FROM to_floor)
+    ),
+    buffer_slots AS (
+        SELECT o.location_id, ROW_NUMBER() OVER (ORDER BY o.location_id, slot) AS rank
+        FROM LocationOccupancy o
+        CROSS JOIN LATERAL generate_series(1, o.max_pallets - o.pallets) AS slot
+        WHERE o.area = 'Buffer' AND o.pallets < o.max_pallets
+    ),
+    moves AS (
+        SELECT id, location_id, 'Floor' AS area FROM to_floor
+        UNION ALL
+        SELECT lo.id, b.location_id, 'Buffer'
+        FROM leftover lo
+        JOIN buffer_slots b ON b.rank = lo.rank
+    )
+    UPDATE Pallets p
+    SET location_id = m.location_id
+    FROM moves m
+    WHERE p.id = m.id
+"""
+
+# Every Floor location with a free slot takes the lowest-id Buffer pallet of its product;
+# only the pallets of products with an open Floor location are ranked
+BUFFER_MOVES_SQL = """
+    WITH open_floor AS (
+        SELECT location_id, product_id,
+               ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY location_id) AS rank
+        FROM LocationOccupancy
+        WHERE area = 'Floor' AND pallets < max_pallets
+    ),
+    buffer_pallets AS (
+        SELECT p.id, p.product_id,
+               ROW_NUMBER() OVER (PARTITION BY p.product_id ORDER BY p.id) AS rank
+        FROM Pallets p
+        JOIN LocationOccupancy o ON o.location_id = p.location_id
+        WHERE o.area = 'Buffer' AND p.product_id IN (SELECT product_id FROM open_floor)
+    )
+    UPDATE Pallets p
+    SET location_id = f.location_id
+    FROM open_floor f
+    JOIN buffer_pallets b ON b.product_id = f.product_id AND b.rank = f.rank
+    WHERE p.id = b.id
+"""
+
+PROCEDURES_SQL = f"""
+CREATE OR REPLACE PROCEDURE log_movement(movement_event TEXT, movement_day INTEGER)
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO Movements (day, event, storage, loadingdock, floor, buffer)
+    SELECT movement_day, movement_event,
+           SUM(pallets) FILTER (WHERE area = 'Storage'),
+           SUM(pallets) FILTER (WHERE area = 'LoadingDock'),
+           SUM(pallets) FILTER (WHERE area = 'Floor'),
+           SUM(pallets) FILTER (WHERE area = 'Buffer')
+    FROM AreaOccupancy;
+END;
+$$;
+
+CREATE OR REPLACE PROCEDURE simulate_day(seed DOUBLE PRECISION, settings JSONB)
+LANGUAGE plpgsql AS $$
+DECLARE
+    storage_id INTEGER := (SELECT id FROM Locations WHERE area = 'Storage');
+    dock_id INTEGER := (SELECT id FROM Locations WHERE area = 'LoadingDock');
+    floor_ids INTEGER[] := ARRAY(SELECT id FROM Locations WHERE area = 'Floor');
+    min_sale DOUBLE PRECISION := (settings->>'min_sale')::DOUBLE PRECISION;
+    new_pallets INTEGER := trunc((settings->>'new_pallets')::NUMERIC * (settings->>'n_products')::INTEGER);
+    variation INTEGER := trunc(new_pallets * (settings->>'variation')::NUMERIC);
+    n_new_pallets INTEGER;
+    today INTEGER := (SELECT COALESCE(MAX(day), 0) + 1 FROM Movements);
+BEGIN
+    IF seed IS NOT NULL THEN
+        PERFORM setseed(seed);
+    END IF;
+
+    -- Event 1: Truck Arrives, filling the lowest-id Storage pallets with a random sample of products
+    n_new_pallets := new_pallets + floor(random() * (2 * variation + 1))::INTEGER - variation;
+    WITH picks AS (
+        SELECT id, units_per_pallet, ROW_NUMBER() OVER (ORDER BY random()) AS rank
+        FROM Products
+    ),
+    empties AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS rank
+        FROM Pallets
+        WHERE location_id = storage_id
+    )
+    UPDATE Pallets p
+    SET product_id = pk.id, location_id = dock_id, quantity = pk.units_per_pallet
+    FROM picks pk
+    JOIN empties e ON e.rank = pk.rank
+    WHERE p.id = e.id AND pk.rank <= n_new_pallets;
+    CALL log_movement('TruckArrives', today);
+
+    -- Event 2: Move Pallets from Loading Dock
+    {(DISPATCH_SQL % {'dock_id': 'dock_id'}).strip()};
+    CALL log_movement('LoadingDock', today);
+
+    -- Event 3: Simulate Daily Sales, emptied pallets go back to Storage
+    UPDATE Pallets p
+    SET quantity = GREATEST(s.quantity, 0),
+        product_id = CASE WHEN s.quantity > 0 THEN p.product_id END,
+        location_id = CASE WHEN s.quantity > 0 THEN p.location_id ELSE storage_id END
+    FROM (
+        SELECT fp.id,
+               fp.quantity - trunc((min_sale + (1 - min_sale) * random()) * pr.units_per_pallet)::INTEGER
+                   AS quantity
+        FROM Pallets fp
+        JOIN Products pr ON pr.id = fp.product_id
+        WHERE fp.location_id = ANY(floor_ids)
+    ) s
+    WHERE p.id = s.id;
+    CALL log_movement('Sales', today);
+
+    -- Event 4: Move from Buffer
+    {BUFFER_MOVES_SQL.strip()};
+    CALL log_movement('BufferMoves', today);
+
+    -- Event 5: Move Pallets from Loading Dock again
+    {(DISPATCH_SQL % {'dock_id': 'dock_id'}).strip()};
+    CALL log_movement('LoadingDock', today);
+END;
+$$;
+
+CREATE OR REPLACE PROCEDURE simulate_days(days INTEGER, seed DOUBLE PRECISION, settings JSONB)
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF seed IS NOT NULL THEN
+        PERFORM setseed(seed);
+    END IF;
+    FOR day IN 1..days LOOP
+        CALL simulate_day(NULL, settings);
+    END LOOP;
+END;
+$$;
+"""
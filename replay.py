@@ -0,0 +1,262 @@
+"""
+Deterministic record and replay of simulation runs.
+
+The client-side phases draw from ops.rng: randint for the truck size, sample for the
+products on the truck and uniform for every sale. record_run() swaps in a
+RecordingRandom that keeps every draw, simulates, and saves the draws together with
+the resulting Movements trace and the settings in a compressed .npz file.
+replay_run() feeds the draws to another warehouse through a ReplayRandom, simulates
+the same days and checks that the trace matches row for row, timing the run:
+
+    from replay import record_run, replay_run
+
+    ops = WarehouseOps(..., seed=1)
+    record_run(ops, days=30, path="baseline.npz")
+
+    candidate = ArrayWarehouseOps()
+    result = replay_run(candidate, "baseline.npz")
+    print(result["match"], result["seconds"], result["recorded_seconds"])
+
+The replayed warehouse needs the recorded settings and must be at the recorded day;
+it does not need the seed. A code path that draws a different number of values, or
+draws them in another order, fails with a ValueError at the first draw that does not
+fit. server_side runs draw from PostgreSQL's random() and cannot be recorded.
+"""
+import json
+import random
+import time
+
+import numpy as np
+
+# Draw kinds of the phases, in the order of the arrays in a recording
+DRAWS = ("randint", "sample", "uniform")
+
+
+class RecordingRandom(random.Random):
+    def __init__(self, source):
+        """
+        Continue the draws of a generator and record them.
+
+        Parameters:
+        source (random.Random): Generator whose state the recording starts from.
+
+        Returns:
+        None
+        """
+        super().__init__()
+        self.setstate(source.getstate())
+        self.draws = {kind: [] for kind in DRAWS}
+
+    def randint(self, a, b):
+        value = super().randint(a, b)
+        self.draws["randint"].append(value)
+        return value
+
+    def sample(self, population, k, **kwargs):
+        values = super().sample(population, k, **kwargs)
+        self.draws["sample"].append(list(values))
+        return values
+
+    def uniform(self, a, b):
+        value = super().uniform(a, b)
+        self.draws["uniform"].append(value)
+        return value
+
+
+class ReplayRandom(random.Random):
+    def __init__(self, draws):
+        """
+        Hand out recorded draws instead of drawing.
+
+        Parameters:
+        draws (dict): Draw kind -> recorded values, as kept by RecordingRandom.
+
+        Returns:
+        None
+        """
+        super().__init__()
+        self.draws = draws
+        self.used = {kind: 0 for kind in DRAWS}
+
+    def next_draw(self, kind, call):
+        """
+        Return the next recorded value of a kind.
+
+        Parameters:
+        kind (str): One of DRAWS.
+        call (str): The call being replayed, for the error message.
+
+        Returns:
+        object: The recorded value.
+        """
+        index = self.used[kind]
+        if index >= len(self.draws[kind]):
+            raise ValueError(f"Replay diverged: {call} after all {index} recorded {kind} draws")
+        self.used[kind] = index + 1
+        return self.draws[kind][index]
+
+    def randint(self, a, b):
+        value = self.next_draw("randint", f"randint({a}, {b})")
+        if not a <= value <= b:
+            raise ValueError(f"Replay diverged: randint({a}, {b}) was recorded as {value}")
+        return value
+
+    def sample(self, population, k, **kwargs):
+        values = self.next_draw("sample", f"sample(k={k})")
+        if len(values) != k:
+            raise ValueError(f"Replay diverged: sample(k={k}) was recorded with {len(values)} values")
+        return list(values)
+
+    def uniform(self, a, b):
+        value = self.next_draw("uniform", f"uniform({a}, {b})")
+        if not min(a, b) <= value <= max(a, b):
+            raise ValueError(f"Replay diverged: uniform({a}, {b}) was recorded as {value}")
+        return value
+
+    def remaining(self):
+        """
+        Count the recorded draws that were not used.
+
+        Returns:
+        int: Unused draws over all kinds.
+        """
+        return sum(len(self.draws[kind]) - self.used[kind] for kind in DRAWS)
+
+
+def normalized(settings):
+    """
+    Return settings as they come back from a recording, for comparison.
+
+    Parameters:
+    settings (dict): Warehouse settings.
+
+    Returns:
+    dict: The settings after a JSON round-trip (tuples become lists).
+    """
+    return json.loads(json.dumps(settings))
+
+
+def record_run(ops, days, path):
+    """
+    Simulate days while recording every draw, and save the draws and the trace.
+
+    Parameters:
+    ops (WarehouseOps): Warehouse to run; any client-side backend.
+    days (int): Days to simulate.
+    path (str): Output .npz file.
+
+    Returns:
+    dict: Days, draws per kind, Movements rows recorded and wall-clock seconds.
+    """
+    if ops.server_side:
+        raise ValueError("A server_side run draws inside the database and cannot be recorded")
+    first_day = ops.day
+    first_movement = len(ops.fetch_movements())
+    recorder = RecordingRandom(ops.rng)
+    source, ops.rng = ops.rng, recorder
+    try:
+        start = time.perf_counter()
+        ops.simulate(days=days)
+        elapsed = time.perf_counter() - start
+    finally:
+        # The original generator continues after the recorded draws
+        source.setstate(recorder.getstate())
+        ops.rng = source
+    movements = [tuple(row) for row in ops.fetch_movements()[first_movement:]]
+
+    samples = recorder.draws["sample"]
+    metadata = {"settings": normalized(ops.settings), "first_day": first_day, "days": days,
+                "backend": type(ops).__name__, "seconds": elapsed}
+    np.savez_compressed(
+        path,
+        metadata=np.array(json.dumps(metadata)),
+        randint=np.array(recorder.draws["randint"], dtype=np.int64),
+        uniform=np.array(recorder.draws["uniform"], dtype=np.float64),
+        sample=np.array([value for values in samples for value in values], dtype=np.int64),
+        sample_sizes=np.array([len(values) for values in samples], dtype=np.int64),
+        movements=np.array(movements, dtype=np.int64).reshape(-1, 4))
+    ops.log(f"Recorded {days} days, {sum(map(len, recorder.draws.values()))} draws and "
+            f"{len(movements)} movements to {path}")
+    return {"days": days, "draws": {kind: len(values) for kind, values in recorder.draws.items()},
+            "movements": len(movements), "seconds": round(elapsed, 3)}
+
+
+def load_recording(path):
+    """
+    Load a recording saved by record_run().
+
+    Parameters:
+    path (str): The .npz file.
+
+    Returns:
+    dict: metadata (settings, first_day, days, backend, seconds), draws (kind -> values)
+    and movements ((storage, loadingdock, floor, buffer) tuples).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        boundaries = np.cumsum(data["sample_sizes"])[:-1]
+        samples = np.split(data["sample"], boundaries) if len(data["sample_sizes"]) else []
+        draws = {
+            "randint": data["randint"].tolist(),
+            "sample": [values.tolist() for values in samples],
+            "uniform": data["uniform"].tolist(),
+        }
+        movements = [tuple(row) for row in data["movements"].tolist()]
+    return {"metadata": metadata, "draws": draws, "movements": movements}
+
+
+def replay_run(ops, path, run=None):
+    """
+    Replay a recording on a warehouse and compare its Movements trace with the recorded one.
+
+    Parameters:
+    ops (WarehouseOps): Warehouse built with the recorded settings, at the recorded
+        day; any client-side backend or code path.
+    path (str): Recording saved by record_run().
+    run (callable): Called as run(ops, days) to simulate (default is None, i.e.
+        ops.simulate(days)); e.g. an EventScheduler with one event of each kind.
+
+    Returns:
+    dict: match, movements compared, first_mismatch (index, or None), expected and
+    actual rows at the mismatch, unused draws, seconds and recorded_seconds.
+    """
+    if ops.server_side:
+        raise ValueError("A server_side run draws inside the database and cannot replay a recording")
+    recording = load_recording(path)
+    metadata = recording["metadata"]
+    if normalized(ops.settings) != metadata["settings"]:
+        raise ValueError("The warehouse settings differ from the recorded settings")
+    if ops.day != metadata["first_day"]:
+        raise ValueError(f"The warehouse is at day {ops.day}, the recording starts at day {metadata['first_day']}")
+
+    first_movement = len(ops.fetch_movements())
+    replayer = ReplayRandom(recording["draws"])
+    source, ops.rng = ops.rng, replayer
+    try:
+        start = time.perf_counter()
+        if run is None:
+            ops.simulate(days=metadata["days"])
+        else:
+            run(ops, metadata["days"])
+        elapsed = time.perf_counter() - start
+    finally:
+        ops.rng = source
+    actual = [tuple(row) for row in ops.fetch_movements()[first_movement:]]
+    expected = recording["movements"]
+
+    mismatch = next((i for i, (a, b) in enumerate(zip(expected, actual)) if a != b), None)
+    if mismatch is None and len(expected) != len(actual):
+        mismatch = min(len(expected), len(actual))
+    result = {
+        "match": mismatch is None and not replayer.remaining(),
+        "movements": len(actual),
+        "first_mismatch": mismatch,
+        "expected": expected[mismatch] if mismatch is not None and mismatch < len(expected) else None,
+        "actual": actual[mismatch] if mismatch is not None and mismatch < len(actual) else None,
+        "unused_draws": replayer.remaining(),
+        "seconds": round(elapsed, 3),
+        "recorded_seconds": round(metadata["seconds"], 3),
+    }
+    ops.log(f"Replayed {path}: {'match' if result['match'] else 'MISMATCH'} over {len(actual)} movements "
+            f"in {result['seconds']} s (recorded {result['recorded_seconds']} s)")
+    return result
@@ -0,0 +1,181 @@
+"""
+Seeded Monte Carlo replications of one warehouse configuration.
+
+run_replications() runs N replications of the same settings in a process pool. Each
+replication gets its own random stream: the seed of replication i is drawn from
+numpy's SeedSequence(seed).spawn(N)[i], so the streams are independent and the whole
+set is reproducible from one seed. The end-of-day occupancy of every area is
+aggregated per day into a mean and a bootstrap confidence interval. The first day
+pallets are left on the LoadingDock is aggregated the same way:
+
+    from replications import run_replications
+    from sweep import write_csv
+
+    result = run_replications(replications=30, days=60, seed=1, settings={"new_pallets": 0.9})
+    print(result["first_backlog_day"])
+    write_csv(result["daily"], "replications.csv")
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sweep import EVENTS_PER_DAY, create_warehouse, run_metrics, warm_up
+from warehouse_ops import drop_database
+
+AREAS = ("storage", "loadingdock", "floor", "buffer")
+
+
+def replication_seeds(seed, replications):
+    """
+    Derive one independent seed per replication.
+
+    Parameters:
+    seed (int): Seed of the whole set (default None draws fresh entropy).
+    replications (int): Number of replications.
+
+    Returns:
+    tuple: (entropy, seeds); entropy reproduces the set when passed back as seed.
+    """
+    sequence = np.random.SeedSequence(seed)
+    seeds = [int(child.generate_state(1, np.uint64)[0]) for child in sequence.spawn(replications)]
+    return sequence.entropy, seeds
+
+
+def confidence_interval(samples, confidence=0.95, resamples=2000, seed=0):
+    """
+    Compute the mean and a percentile bootstrap confidence interval along axis 0.
+
+    Parameters:
+    samples (numpy.ndarray): One row per replication.
+    confidence (float): Confidence level (default is 0.95).
+    resamples (int): Bootstrap resamples (default is 2000).
+    seed (int): Seed of the resampling (default is 0).
+
+    Returns:
+    tuple: (mean, low, high) arrays shaped like one row of samples.
+    """
+    samples = np.asarray(samples, dtype=float)
+    mean = samples.mean(axis=0)
+    if len(samples) < 2:
+        return mean, mean, mean
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(samples), size=(resamples, len(samples)))
+    means = samples[picks].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail], axis=0)
+    return mean, low, high
+
+
+def run_replication(task):
+    """
+    Run one replication; executed inside a worker process.
+
+    Parameters:
+    task (dict): The sweep task fields (see sweep.create_warehouse) and days.
+
+    Returns:
+    dict: seed, end_of_day occupancy rows, run metrics and wall-clock time.
+    """
+    start = time.perf_counter()
+    ops = create_warehouse(task, log_name="replication")
+    try:
+        warmup_days = ops.day
+        ops.simulate(days=task["days"])
+        movements = ops.fetch_movements()[warmup_days * EVENTS_PER_DAY:]
+        elapsed = time.perf_counter() - start
+    finally:
+        if ops.conn is not None:
+            ops.conn.close()
+            ops.drop_db()
+
+    return {
+        "seed": task["seed"],
+        "end_of_day": [tuple(row) for row in movements[EVENTS_PER_DAY - 1::EVENTS_PER_DAY]],
+        "metrics": run_metrics(movements, ops.settings),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def run_replications(replications=10, days=30, seed=None, settings=None, backend="array",
+                     processes=None, options=None, confidence=0.95, resamples=2000,
+                     dbname="replication", user="postgres", password="", host="localhost",
+                     log_dir=None, warmup_days=0):
+    """
+    Run independent seeded replications of one configuration in a process pool.
+
+    Parameters:
+    replications (int): Number of replications (default is 10).
+    days (int): Days to simulate per replication (default is 30).
+    seed (int): Seed the replication seeds are derived from (default is None, fresh
+        entropy; the result reports it).
+    settings (dict): Values overriding those of warehouse_settings() (default is None).
+    backend (str): "array" for ArrayWarehouseOps or "postgres" for WarehouseOps (default is "array").
+    processes (int): Worker processes (default is None, i.e. one per CPU).
+    options (dict): Extra WarehouseOps arguments for the postgres backend, e.g. {"bulk": True}.
+    confidence (float): Level of the confidence intervals (default is 0.95).
+    resamples (int): Bootstrap resamples per interval (default is 2000).
+    dbname (str): Prefix of the per-replication databases (default is "replication").
+    user (str): Username for the database.
+    password (str): Password for the database user.
+    host (str): Database host address.
+    log_dir (str): Directory for one log file per replication (default is None, no logs).
+    warmup_days (int): Days simulated once, from a seed derived like the others, and
+        snapshotted; every replication forks the snapshot with its own seed (default is 0).
+
+    Returns:
+    dict: seed (entropy of the set), replications, daily (one row per day with the mean,
+    low and high of every area), first_backlog_day (share of replications that backed
+    up, with mean, low and high of the first backlog day among them) and runs (seed
+    and metrics per replication).
+    """
+    if backend not in ("array", "postgres"):
+        raise ValueError(f"Unknown backend: {backend}")
+    if replications < 1:
+        raise ValueError("At least one replication is needed")
+    entropy, seeds = replication_seeds(seed, replications + 1)
+    connection = {"dbname": dbname, "user": user, "password": password, "host": host}
+    # The last derived seed drives the shared warm-up; forks then reseed with their own
+    snapshot = (warm_up(backend, warmup_days, seeds[-1], options or {}, connection, settings)
+                if warmup_days else None)
+    tasks = [{"index": index, "overrides": settings or {}, "days": days, "seed": replication_seed,
+              "backend": backend, "options": options or {}, "connection": connection,
+              "log_dir": log_dir, "snapshot": snapshot, "reseed": True,
+              "early_stop": None}
+             for index, replication_seed in enumerate(seeds[:replications])]
+
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            runs = list(pool.map(run_replication, tasks))
+    finally:
+        if backend == "postgres" and snapshot is not None:
+            drop_database(snapshot, user, password, host)
+
+    # replications x days x areas; every run has the same number of days
+    occupancy = np.array([run["end_of_day"] for run in runs], dtype=float).reshape(len(runs), -1, len(AREAS))
+    mean, low, high = confidence_interval(occupancy, confidence, resamples)
+    daily = []
+    for day in range(occupancy.shape[1]):
+        row = {"day": day + 1}
+        for i, area in enumerate(AREAS):
+            row[f"{area}_mean"] = round(float(mean[day, i]), 3)
+            row[f"{area}_low"] = round(float(low[day, i]), 3)
+            row[f"{area}_high"] = round(float(high[day, i]), 3)
+        daily.append(row)
+
+    backlog_days = [run["metrics"]["first_backlog_day"] for run in runs
+                    if run["metrics"]["first_backlog_day"] is not None]
+    first_backlog_day = {"share": len(backlog_days) / len(runs), "mean": None, "low": None, "high": None}
+    if backlog_days:
+        backlog_mean, backlog_low, backlog_high = confidence_interval(backlog_days, confidence, resamples)
+        first_backlog_day.update(mean=round(float(backlog_mean), 3), low=round(float(backlog_low), 3),
+                                 high=round(float(backlog_high), 3))
+
+    return {
+        "seed": entropy,
+        "replications": len(runs),
+        "confidence": confidence,
+        "daily": daily,
+        "first_backlog_day": first_backlog_day,
+        "runs": [{"seed": run["seed"], **run["metrics"], "seconds": run["seconds"]} for run in runs],
+    }
@@ -0,0 +1,253 @@
+"""
+Discrete-event scheduler for WarehouseOps and ArrayWarehouseOps.
+
+simulate() runs five fixed phases per day. EventScheduler instead keeps a heap of
+timestamped events (hours since the start of the run) and runs the existing phase
+methods as their handlers:
+
+    truck       truck_arrives() with the truck's part of the day's delivery, then a
+                put-away shortly after
+    putaway     move_pallets_from_loading_dock()
+    sales       simulate_daily_sales(share=1 / sales_batches_per_day)
+    replenish   move_from_buffer(), then a put-away of what is left on the dock
+    day_end     commit the day, check the bottleneck detector and schedule the next day
+
+Only one day of events is in the heap at a time, so a long run needs no more memory
+than a short one. Phases do not commit on their own while the scheduler runs; each
+simulated day is committed once. With one truck, one sales batch and one
+replenishment per day, the events come in the same order as in simulate() and the
+run gives the same Movements trace:
+
+    from scheduler import EventScheduler
+
+    scheduler = EventScheduler(ops, trucks_per_day=3, sales_batches_per_day=12)
+    scheduler.run(days=30)
+    print(scheduler.counts)
+
+Other events can be added with schedule(time, kind) after registering a handler in
+handlers[kind].
+"""
+import collections
+import heapq
+import itertools
+
+from event_log import DEBUG, WARNING
+
+HOURS_PER_DAY = 24.0
+
+
+class EventScheduler:
+    def __init__(self, ops, trucks_per_day=1, sales_batches_per_day=1, replenishments_per_day=1,
+                 shift=(6.0, 22.0), putaway_delay=0.5, jitter=0.0):
+        """
+        Prepare a scheduler driving a warehouse.
+
+        Trucks, sales batches and replenishments are spread evenly over the shift:
+        trucks at its start and every shift_length / trucks_per_day hours after, sales
+        batches in the middle of their slots, replenishments at the end of theirs.
+
+        Parameters:
+        ops (WarehouseOps): Warehouse whose phase methods handle the events; it must
+            not use server_side.
+        trucks_per_day (int): Trucks per day; the day's delivery is drawn once and split
+            over them, the first trucks taking one pallet more when it does not divide
+            evenly (default is 1).
+        sales_batches_per_day (int): Sales batches per day, each selling an equal share
+            of the daily sales; see WarehouseOps.draw_sales (default is 1).
+        replenishments_per_day (int): Buffer-to-Floor replenishments per day (default is 1).
+        shift (tuple): Start and end hour of the working day (default is (6.0, 22.0)).
+        putaway_delay (float): Hours between a truck arrival and its put-away (default is 0.5).
+        jitter (float): Largest random shift of a truck arrival in hours, drawn from the
+            warehouse's random generator (default is 0.0, i.e. no jitter).
+
+        Returns:
+        None
+        """
+        if ops.server_side:
+            raise ValueError("The event scheduler needs a client-side warehouse, not server_side")
+        if min(trucks_per_day, sales_batches_per_day, replenishments_per_day) < 1:
+            raise ValueError("Trucks, sales batches and replenishments per day must be at least 1")
+        self.ops = ops
+        self.trucks_per_day = trucks_per_day
+        self.sales_batches_per_day = sales_batches_per_day
+        self.replenishments_per_day = replenishments_per_day
+        self.shift = shift
+        self.putaway_delay = putaway_delay
+        self.jitter = jitter
+
+        self.queue = []
+        # Tie-breaker keeping events with equal timestamps in scheduling order
+        self.sequence = itertools.count()
+        self.now = 0.0
+        self.last_day = 0
+        # Products of the current day's delivery, drawn by its first truck
+        self.delivery = None
+        self.counts = collections.Counter()
+        self.handlers = {
+            "truck": self.on_truck,
+            "putaway": self.on_putaway,
+            "sales": self.on_sales,
+            "replenish": self.on_replenish,
+            "day_end": self.on_day_end,
+        }
+
+    def schedule(self, time, kind, **data):
+        """
+        Add an event to the queue.
+
+        Parameters:
+        time (float): Hours since the start of the run; not before the current time.
+        kind (str): Event kind, a key of handlers.
+        **data: Arguments passed to the handler.
+
+        Returns:
+        None
+        """
+        heapq.heappush(self.queue, (time, next(self.sequence), kind, data))
+
+    def schedule_day(self, day):
+        """
+        Queue the trucks, sales batches, replenishments and day end of a day.
+
+        Parameters:
+        day (int): Zero-based day of the run.
+
+        Returns:
+        None
+        """
+        start, end = self.shift
+        base = day * HOURS_PER_DAY
+        length = end - start
+        self.delivery = None
+
+        for i in range(self.trucks_per_day):
+            time = start + i * length / self.trucks_per_day
+            if self.jitter:
+                time = min(max(time + self.ops.rng.uniform(-self.jitter, self.jitter), start), end)
+            self.schedule(base + time, "truck", truck=i)
+        for i in range(self.sales_batches_per_day):
+            self.schedule(base + start + (i + 0.5) * length / self.sales_batches_per_day, "sales",
+                          share=1 / self.sales_batches_per_day)
+        for i in range(self.replenishments_per_day):
+            self.schedule(base + start + (i + 1) * length / self.replenishments_per_day, "replenish")
+        self.schedule(base + HOURS_PER_DAY, "day_end", day=day)
+
+    def run(self, days=10):
+        """
+        Simulate days by processing events in timestamp order.
+
+        Day numbers continue from earlier simulate() or run() calls. The run ends early
+        if the warehouse's bottleneck detector stops it.
+
+        Parameters:
+        days (int): The number of days to run (default is 10).
+
+        Returns:
+        collections.Counter: Events processed per kind, over all runs.
+        """
+        ops = self.ops
+        if ops.stop_reason is not None:
+            ops.log(f"Run already stopped: {ops.stop_reason}", WARNING)
+            return self.counts
+        first_day = ops.day
+        self.last_day = first_day + days
+        self.now = first_day * HOURS_PER_DAY
+        ops.log(f"Days {first_day + 1}-{self.last_day} event simulation starts")
+
+        ops.defer_commits = True
+        try:
+            if days > 0:
+                self.schedule_day(first_day)
+            queue = self.queue
+            handlers = self.handlers
+            debug = ops.event_log.enabled(DEBUG)
+            while queue:
+                self.now, _, kind, data = heapq.heappop(queue)
+                # Movements rows are stamped with the one-based day of the event
+                ops.day = int(self.now // HOURS_PER_DAY) + 1
+                if debug:
+                    ops.log(f"Event {kind} at hour {self.now % HOURS_PER_DAY:.2f} of day {ops.day}", DEBUG)
+                handlers[kind](**data)
+                self.counts[kind] += 1
+        finally:
+            ops.defer_commits = False
+            if ops.conn is not None:
+                ops.conn.commit()
+        ops.day = self.last_day
+
+        ops.log(f"Days {first_day + 1}-{self.last_day} event simulation ends after "
+                f"{sum(self.counts.values())} events")
+        return self.counts
+
+    def on_truck(self, truck):
+        """
+        Unload a truck on the loading dock and schedule its put-away.
+
+        The first truck of a day draws the day's delivery; every truck unloads its
+        part of it.
+
+        Parameters:
+        truck (int): Zero-based index of the truck in the day.
+
+        Returns:
+        None
+        """
+        if self.delivery is None:
+            self.delivery = self.ops.draw_delivery()
+        size, extra = divmod(len(self.delivery), self.trucks_per_day)
+        first = truck * size + min(truck, extra)
+        self.ops.truck_arrives(self.delivery[first:first + size + (truck < extra)])
+        self.schedule(self.now + self.putaway_delay, "putaway")
+
+    def on_putaway(self):
+        """
+        Move the loading dock pallets to Floor or Buffer.
+
+        Returns:
+        None
+        """
+        self.ops.move_pallets_from_loading_dock()
+
+    def on_sales(self, share):
+        """
+        Sell a batch from the Floor pallets.
+
+        Parameters:
+        share (float): Part of the daily sales in this batch.
+
+        Returns:
+        None
+        """
+        self.ops.simulate_daily_sales(share)
+
+    def on_replenish(self):
+        """
+        Refill the Floor from Buffer, then put away what waits on the dock.
+
+        Returns:
+        None
+        """
+        self.ops.move_from_buffer()
+        self.schedule(self.now, "putaway")
+
+    def on_day_end(self, day):
+        """
+        Close and commit the finished day and schedule the next one, unless the
+        warehouse's bottleneck detector stops the run.
+
+        Parameters:
+        day (int): Zero-based day that ends.
+
+        Returns:
+        None
+        """
+        ops = self.ops
+        ops.day = day + 1
+        stop = ops.end_day()
+        if ops.conn is not None:
+            ops.conn.commit()
+        if stop:
+            self.queue.clear()
+            self.last_day = day + 1
+        elif day + 1 < self.last_day:
+            self.schedule_day(day + 1)
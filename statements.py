@@ -0,0 +1,239 @@
+"""
+Prepared and pipelined per-pallet statements for WarehouseOps.
+
+The per-row phases send the same few statements once per pallet. With prepared=True,
+WarehouseOps opens a PreparedStatements layer on its cursor: the statements of
+STATEMENTS are prepared with PREPARE once per connection, so PostgreSQL parses them
+once and can reuse their plans, and each call is a short EXECUTE. Without it the
+phases run the same statements through Statements, one round-trip per call.
+
+Writes that return nothing do not need a round-trip of their own. run() queues them,
+and the next fetchone() sends them together with its query in one multi-statement
+string, which PostgreSQL executes in order; flush() sends what is left in pages of
+page_size statements. A per-row phase then costs one round-trip per lookup instead
+of one per statement, and a sales phase, which only writes, a handful of round-trips
+in total:
+
+    ops = WarehouseOps(..., prepared=True)
+    ops.simulate(days=10)
+
+log_movement() flushes the queue before it reads the area counts, so every phase ends
+with its writes applied. An error in a queued write is raised by the call that sends it.
+"""
+
+# name -> (parameter types, statement), with %s for the parameters in order
+STATEMENTS = {
+    # truck_arrives: the lowest-id pallet in Storage, and its loading onto the dock
+    "storage_pick": ("INTEGER", """
+        SELECT id FROM Pallets WHERE location_id = %s
+        ORDER BY id LIMIT 1
+    """),
+    "load_pallet": ("INTEGER, INTEGER, INTEGER, INTEGER", """
+        UPDATE Pallets
+        SET product_id = %s, location_id = %s, quantity = %s
+        WHERE id = %s
+    """),
+    # dispatch_per_pallet: a free Floor slot of the product, else a free Buffer slot
+    "floor_slot": ("INTEGER", """
+        SELECT location_id FROM LocationOccupancy
+        WHERE area = 'Floor' AND product_id = %s AND pallets < max_pallets
+        ORDER BY location_id LIMIT 1
+    """),
+    "buffer_slot": ("", """
+        SELECT location_id FROM LocationOccupancy
+        WHERE area = 'Buffer' AND pallets < max_pallets
+        ORDER BY location_id LIMIT 1
+    """),
+    "move_pallet": ("INTEGER, INTEGER", """
+        UPDATE Pallets
+        SET location_id = %s
+        WHERE id = %s
+    """),
+    # sell_per_pallet: a sale, or an emptied pallet back to Storage
+    "sell": ("INTEGER, INTEGER", """
+        UPDATE Pallets
+        SET quantity = %s
+        WHERE id = %s
+    """),
+    "empty_pallet": ("INTEGER, INTEGER", """
+        UPDATE Pallets
+        SET product_id = NULL, location_id = %s, quantity = 0
+        WHERE id = %s
+    """),
+    # move_from_buffer: the lowest-id Buffer pallet of a product
+    "buffer_pallet": ("INTEGER", """
+        SELECT p.id, p.location_id FROM Pallets p
+        JOIN LocationOccupancy o ON o.location_id = p.location_id
+        WHERE p.product_id = %s AND o.area = 'Buffer'
+        ORDER BY p.id LIMIT 1
+    """),
+}
+
+
+class Statements:
+    def __init__(self, cur):
+        """
+        Run the statements of STATEMENTS on a cursor, one round-trip per call.
+
+        Parameters:
+        cur (psycopg2.extensions.cursor): Cursor to run them on.
+
+        Returns:
+        None
+        """
+        self.cur = cur
+
+    def run(self, name, params=()):
+        """
+        Run a write.
+
+        Parameters:
+        name (str): Statement name in STATEMENTS.
+        params (tuple): Parameter values (default is none).
+
+        Returns:
+        None
+        """
+        self.cur.execute(STATEMENTS[name][1], params)
+
+    def fetchone(self, name, params=()):
+        """
+        Run a query and return its first row.
+
+        Parameters:
+        name (str): Statement name in STATEMENTS.
+        params (tuple): Parameter values (default is none).
+
+        Returns:
+        tuple: The first row, or None.
+        """
+        self.cur.execute(STATEMENTS[name][1], params)
+        return self.cur.fetchone()
+
+    def flush(self):
+        """
+        Nothing is queued; see PreparedStatements.flush().
+
+        Returns:
+        None
+        """
+
+
+class PreparedStatements(Statements):
+    def __init__(self, cur, page_size=100):
+        """
+        Wrap a cursor; the statements are prepared on first use.
+
+        Parameters:
+        cur (psycopg2.extensions.cursor): Cursor of the connection to prepare on.
+        page_size (int): Most queued writes sent in one round-trip (default is 100).
+
+        Returns:
+        None
+        """
+        super().__init__(cur)
+        self.page_size = page_size
+        self.prepared = False
+        self.pending = []
+
+    def prepare(self):
+        """
+        Prepare every statement of STATEMENTS in one round-trip.
+
+        Prepared statements live as long as the session, also across rollbacks, so
+        this runs once per connection.
+
+        Returns:
+        None
+        """
+        prepares = []
+        for name, (types, statement) in STATEMENTS.items():
+            # PREPARE numbers its parameters
+            parts = statement.split("%s")
+            statement = parts[0] + "".join(f"${n}{part}" for n, part in enumerate(parts[1:], 1))
+            prepares.append(f"PREPARE {name} ({types}) AS {statement}" if types
+                            else f"PREPARE {name} AS {statement}")
+        self.cur.execute(";".join(prepares))
+        self.prepared = True
+
+    def execute_sql(self, name, params):
+        """
+        Render the EXECUTE of a prepared statement with its parameters bound.
+
+        Parameters:
+        name (str): Statement name in STATEMENTS.
+        params (tuple): Parameter values.
+
+        Returns:
+        bytes: The EXECUTE statement.
+        """
+        if not params:
+            return f"EXECUTE {name}".encode()
+        return self.cur.mogrify(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+    def send(self, statements):
+        """
+        Send rendered statements in one round-trip.
+
+        An InstrumentedCursor counts every statement of the round-trip, so profiles
+        report the same statement counts as without the queue.
+
+        Parameters:
+        statements (list): EXECUTE statements as returned by execute_sql().
+
+        Returns:
+        None
+        """
+        execute_statements = getattr(self.cur, "execute_statements", None)
+        if execute_statements is None:
+            self.cur.execute(b";".join(statements))
+        else:
+            execute_statements(statements)
+
+    def run(self, name, params=()):
+        """
+        Queue a write; it is sent with the next fetchone() or flush().
+
+        Parameters:
+        name (str): Statement name in STATEMENTS.
+        params (tuple): Parameter values (default is none).
+
+        Returns:
+        None
+        """
+        self.pending.append(self.execute_sql(name, params))
+        if len(self.pending) >= self.page_size:
+            self.flush()
+
+    def fetchone(self, name, params=()):
+        """
+        Send the queued writes and a query in one round-trip and return its first row.
+
+        Parameters:
+        name (str): Statement name in STATEMENTS.
+        params (tuple): Parameter values (default is none).
+
+        Returns:
+        tuple: The first row, or None.
+        """
+        if not self.prepared:
+            self.prepare()
+        self.pending.append(self.execute_sql(name, params))
+        statements, self.pending = self.pending, []
+        self.send(statements)
+        return self.cur.fetchone()
+
+    def flush(self):
+        """
+        Send the queued writes, page_size statements per round-trip.
+
+        Returns:
+        None
+        """
+        if not self.pending:
+            return
+        if not self.prepared:
+            self.prepare()
+        statements, self.pending = self.pending, []
+        for start in range(0, len(statements), self.page_size):
+            self.send(statements[start:start + self.page_size])
@@ -0,0 +1,265 @@
+"""
+Parallel parameter sweeps for bottleneck discovery.
+
+run_sweep() expands a grid over warehouse settings, runs every configuration in a
+process pool and returns one row of metrics per configuration:
+
+    from sweep import run_sweep, write_csv
+
+    results = run_sweep({"new_pallets": [0.5, 0.7, 0.9], "n_pallets_buffer": [1, 2]}, days=60, seed=1)
+    write_csv(results, "sweep.csv")
+
+Every worker runs an isolated warehouse: an in-memory ArrayWarehouseOps by default,
+or, with backend="postgres", its own database that is dropped when the run ends.
+
+With warmup_days, the warm-up is simulated once and snapshotted, and every
+configuration starts from a fork of that snapshot. The grid can then only vary the
+daily-phase settings (new_pallets, variation, min_sale), and the metrics cover the
+days after the warm-up.
+
+With early_stop, every configuration runs a BottleneckDetector (see bottlenecks.py) and
+stops as soon as its outcome is settled; the stop_reason column says why, and days
+counts the days actually simulated:
+
+    results = run_sweep({"new_pallets": [0.5, 0.7, 0.9, 1.0]}, days=365, seed=1, early_stop={})
+"""
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bottlenecks import BottleneckDetector
+from layout import LAYOUT_SETTINGS
+from warehouse_ops import WarehouseOps, drop_database
+
+EVENTS_PER_DAY = 5
+
+
+def expand_grid(grid):
+    """
+    Expand a grid of setting values into the list of configurations to run.
+
+    Parameters:
+    grid (dict): Setting name -> list of values to try.
+
+    Returns:
+    list: One settings-override dict per combination, in itertools.product order.
+    """
+    defaults = WarehouseOps.warehouse_settings()
+    unknown = [name for name in grid if name not in defaults]
+    if unknown:
+        raise ValueError(f"Unknown warehouse settings: {', '.join(unknown)}")
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_metrics(movements, settings):
+    """
+    Compute the bottleneck metrics of a finished run.
+
+    Parameters:
+    movements (list): (storage, loadingdock, floor, buffer) tuples as returned by fetch_movements().
+    settings (dict): Warehouse settings of the run.
+
+    Returns:
+    dict: End-of-day occupancy statistics of the run.
+    """
+    # The last event of each day is the second loading dock clearance
+    end_of_day = movements[EVENTS_PER_DAY - 1::EVENTS_PER_DAY]
+    buffer_capacity = len(settings["buffer_locations"]) * settings["n_pallets_buffer"]
+    backlog_days = [day for day, (_, loadingdock, _, _) in enumerate(end_of_day, start=1) if loadingdock > 0]
+    storage, loadingdock, floor, buffer = end_of_day[-1] if end_of_day else (0, 0, 0, 0)
+    return {
+        "days": len(end_of_day),
+        "storage": storage,
+        "loadingdock": loadingdock,
+        "floor": floor,
+        "buffer": buffer,
+        "max_loadingdock": max((row[1] for row in end_of_day), default=0),
+        "max_buffer": max((row[3] for row in end_of_day), default=0),
+        "min_storage": min((row[0] for row in end_of_day), default=0),
+        "mean_floor": sum(row[2] for row in end_of_day) / len(end_of_day) if end_of_day else 0,
+        "first_backlog_day": backlog_days[0] if backlog_days else None,
+        "backlog_days": len(backlog_days),
+        "buffer_full_days": sum(1 for row in end_of_day if row[3] >= buffer_capacity),
+        "storage_empty_days": sum(1 for row in end_of_day if row[0] == 0),
+    }
+
+
+def create_warehouse(task, log_name="sweep"):
+    """
+    Create the warehouse of one run, or fork it from the task's snapshot.
+
+    Parameters:
+    task (dict): index, overrides, seed, backend, options, connection, log_dir, snapshot,
+        reseed and early_stop as built by run_sweep(); with reseed a fork draws from seed
+        instead of continuing the snapshot's random stream, with early_stop the run gets a
+        BottleneckDetector built from those arguments.
+    log_name (str): Prefix of the log file name in log_dir (default is "sweep").
+
+    Returns:
+    WarehouseOps: The warehouse, an ArrayWarehouseOps for the array backend.
+    """
+    index = task["index"]
+    overrides = task["overrides"]
+    if task["log_dir"]:
+        log_path = os.path.join(task["log_dir"], f"{log_name}_{index}.txt")
+        log_options = {"level": "INFO"}
+    else:
+        log_path = os.devnull
+        log_options = {"level": "ERROR"}
+
+    snapshot = task["snapshot"]
+    connection = task["connection"]
+    fork_seed = task["seed"] if task["reseed"] else None
+    detector = BottleneckDetector(**task["early_stop"]) if task["early_stop"] is not None else None
+    if task["backend"] == "array":
+        from array_ops import ArrayWarehouseOps
+        if snapshot is None:
+            ops = ArrayWarehouseOps(seed=task["seed"], settings=overrides, log_path=log_path,
+                                    log_options=log_options, detector=detector)
+        else:
+            ops = ArrayWarehouseOps.fork(snapshot, seed=fork_seed, settings=overrides,
+                                         log_path=log_path, log_options=log_options, detector=detector)
+    elif snapshot is None:
+        ops = WarehouseOps(dbname=f"{connection['dbname']}_{index}", user=connection["user"],
+                           password=connection["password"], host=connection["host"],
+                           drop_db_flag=True, seed=task["seed"], settings=overrides,
+                           log_path=log_path, log_options=log_options, detector=detector,
+                           **task["options"])
+    else:
+        ops = WarehouseOps.fork(snapshot, f"{connection['dbname']}_{index}", connection["user"],
+                                connection["password"], connection["host"], seed=fork_seed,
+                                settings=overrides, log_path=log_path, log_options=log_options,
+                                detector=detector, **task["options"])
+    return ops
+
+
+def run_configuration(task):
+    """
+    Run one configuration of a sweep; executed inside a worker process.
+
+    Parameters:
+    task (dict): index, overrides, days, seed, backend, options, connection, log_dir,
+        snapshot and early_stop as built by run_sweep().
+
+    Returns:
+    dict: The overrides followed by the run metrics, the stop reason and the wall-clock time.
+    """
+    start = time.perf_counter()
+    ops = create_warehouse(task)
+    try:
+        warmup_days = ops.day
+        ops.simulate(days=task["days"])
+        movements = ops.fetch_movements()[warmup_days * EVENTS_PER_DAY:]
+        elapsed = time.perf_counter() - start
+    finally:
+        # A failed run must not leave its database behind
+        if ops.conn is not None:
+            ops.conn.close()
+            ops.drop_db()
+
+    return {**task["overrides"], **run_metrics(movements, ops.settings), "stop_reason": ops.stop_reason,
+            "seconds": round(elapsed, 3)}
+
+
+def warm_up(backend, days, seed, options, connection, settings=None):
+    """
+    Simulate the warm-up shared by all configurations and snapshot it.
+
+    Parameters:
+    backend (str): "array" or "postgres".
+    days (int): Warm-up days.
+    seed (int): Seed of the warm-up run.
+    options (dict): Extra WarehouseOps arguments for the postgres backend.
+    connection (dict): dbname prefix, user, password and host.
+    settings (dict): Values overriding those of warehouse_settings() (default is None).
+
+    Returns:
+    dict or str: The in-memory snapshot, or the name of the snapshot database.
+    """
+    if backend == "array":
+        from array_ops import ArrayWarehouseOps
+        ops = ArrayWarehouseOps(seed=seed, settings=settings, log_path=os.devnull,
+                                log_options={"level": "ERROR"})
+        ops.simulate(days=days)
+        return ops.snapshot("warmup")
+
+    ops = WarehouseOps(dbname=f"{connection['dbname']}_warmup", user=connection["user"],
+                       password=connection["password"], host=connection["host"], drop_db_flag=True,
+                       seed=seed, settings=settings, log_path=os.devnull, log_options={"level": "ERROR"},
+                       **options)
+    ops.simulate(days=days)
+    snapshot = ops.snapshot(f"{connection['dbname']}_snapshot")
+    ops.conn.close()
+    ops.drop_db()
+    return snapshot
+
+
+def run_sweep(grid, days=30, seed=None, backend="array", processes=None, options=None,
+              dbname="sweep", user="postgres", password="", host="localhost", log_dir=None,
+              warmup_days=0, early_stop=None):
+    """
+    Run every configuration of a settings grid in a process pool.
+
+    Parameters:
+    grid (dict): Setting name -> list of values to try, e.g. {"new_pallets": [0.5, 0.7]}.
+    days (int): Days to simulate per configuration (default is 30).
+    seed (int): Seed shared by all configurations, so they see the same random draws
+        where their settings allow it (default is None).
+    backend (str): "array" for ArrayWarehouseOps or "postgres" for WarehouseOps (default is "array").
+    processes (int): Worker processes (default is None, i.e. one per CPU).
+    options (dict): Extra WarehouseOps arguments for the postgres backend, e.g. {"bulk": True}.
+    dbname (str): Prefix of the per-configuration databases (default is "sweep").
+    user (str): Username for the database.
+    password (str): Password for the database user.
+    host (str): Database host address.
+    log_dir (str): Directory for one log file per configuration (default is None, no logs).
+    warmup_days (int): Days simulated once with the default settings and snapshotted;
+        every configuration forks the snapshot and runs days more (default is 0).
+    early_stop (dict): BottleneckDetector arguments, e.g. {"window": 5}; every configuration
+        then stops once a bottleneck is detected (default is None, i.e. run all days).
+
+    Returns:
+    list: One dict per configuration with its overrides and metrics.
+    """
+    if backend not in ("array", "postgres"):
+        raise ValueError(f"Unknown backend: {backend}")
+    layout = [name for name in grid if name in LAYOUT_SETTINGS]
+    if warmup_days and layout:
+        raise ValueError(f"A warmed-up sweep cannot vary layout settings: {', '.join(layout)}")
+    connection = {"dbname": dbname, "user": user, "password": password, "host": host}
+    configurations = expand_grid(grid)
+    snapshot = warm_up(backend, warmup_days, seed, options or {}, connection) if warmup_days else None
+    tasks = [{"index": index, "overrides": overrides, "days": days, "seed": seed,
+              "backend": backend, "options": options or {}, "connection": connection,
+              "log_dir": log_dir, "snapshot": snapshot, "reseed": False,
+              "early_stop": early_stop}
+             for index, overrides in enumerate(configurations)]
+
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return list(pool.map(run_configuration, tasks))
+    finally:
+        if backend == "postgres" and snapshot is not None:
+            drop_database(snapshot, user, password, host)
+
+
+def write_csv(results, path):
+    """
+    Write sweep results to a CSV file, one row per configuration.
+
+    Parameters:
+    results (list): Rows as returned by run_sweep().
+    path (str): Output file path.
+
+    Returns:
+    None
+    """
+    if not results:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Connection of the PostgreSQL tests, from the usual libpq environment variables
+CONNECTION = {
+    "user": os.environ.get("PGUSER", "postgres"),
+    "password": os.environ.get("PGPASSWORD", ""),
+    "host": os.environ.get("PGHOST", "localhost"),
+}
+
+
+@pytest.fixture(scope="session")
+def pg():
+    """Connection arguments for WarehouseOps; skips the test when PostgreSQL is unavailable."""
+    import psycopg2
+    try:
+        psycopg2.connect(dbname="postgres", connect_timeout=3, **CONNECTION).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not available: {e}")
+    return dict(CONNECTION)
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from array_ops import ArrayWarehouseOps
+from warehouse_ops import WarehouseOps
+
+DAYS = 10
+EVENTS_PER_DAY = 5
+# The default layout, and a busy one that fills the Buffer with two pallets per location
+CASES = [
+    (1, {}),
+    (6, {"new_pallets": 1.0, "variation": 0.0, "min_sale": 0, "n_pallets_buffer": 2}),
+]
+# backend -> WarehouseOps arguments of the modes that replay the array trace
+BACKENDS = {
+    "per_row": {},
+    "prepared": {"prepared": True},
+    "bulk": {"bulk": True},
+    # Named cursors fetching two rows at a time, so every scan spans several chunks
+    "streamed": {"itersize": 2},
+    "streamed_bulk": {"bulk": True, "itersize": 2},
+}
+
+
+def run_array(seed, settings):
+    ops = ArrayWarehouseOps(seed=seed, settings=settings, log_path=os.devnull, history=True, kpis=True)
+    ops.simulate(days=DAYS)
+    return ops
+
+
+@pytest.mark.parametrize("seed, settings", CASES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_replay_the_array_run(pg, backend, seed, settings):
+    expected = run_array(seed, settings)
+    ops = WarehouseOps("test_backends", drop_db_flag=True, seed=seed, settings=settings, history=True,
+                       kpis=True, log_path=os.devnull, **BACKENDS[backend], **pg)
+    try:
+        ops.simulate(days=DAYS)
+        assert [tuple(row) for row in ops.fetch_movements()] == expected.fetch_movements()
+        assert [tuple(row) for row in ops.fetch_pallet_history()] == expected.fetch_pallet_history()
+        assert [ops.fetch_kpis(day) for day in range(1, DAYS + 1)] == \
+            [expected.fetch_kpis(day) for day in range(1, DAYS + 1)]
+    finally:
+        ops.conn.close()
+        ops.drop_db()
+
+
+@pytest.mark.parametrize("seed, settings", CASES)
+def test_server_side_keeps_every_pallet(pg, seed, settings):
+    # The server-side loop draws from PostgreSQL's random(), so only its shape matches the array run
+    expected = run_array(seed, settings).fetch_movements()
+    ops = WarehouseOps("test_backends", drop_db_flag=True, seed=seed, settings=settings, bulk=True,
+                       server_side=True, log_path=os.devnull, **pg)
+    try:
+        ops.simulate(days=DAYS)
+        movements = [tuple(row) for row in ops.fetch_movements()]
+    finally:
+        ops.conn.close()
+        ops.drop_db()
+    assert len(movements) == len(expected) == DAYS * EVENTS_PER_DAY
+    assert {sum(row) for row in movements} == {sum(expected[0])}
+
+
+def test_prepared_profile_counts_every_queued_statement(pg):
+    statements = {}
+    for backend in ("per_row", "prepared"):
+        ops = WarehouseOps("test_backends", drop_db_flag=True, seed=1, profile=True, log_path=os.devnull,
+                           **BACKENDS[backend], **pg)
+        try:
+            ops.simulate(days=DAYS)
+            statements[backend] = sum(row["statements"] for row in ops.profile_report().by_phase())
+        finally:
+            ops.conn.close()
+            ops.drop_db()
+    # The queue only saves round-trips; the PREPAREs are sent as one more statement
+    assert statements["prepared"] == statements["per_row"] + 1
@@ -0,0 +1,36 @@
+import os
+
+from array_ops import ArrayWarehouseOps
+from bottlenecks import BottleneckDetector
+
+
+def run_days(detector, trucks):
+    detector.start({"buffer_locations": [1], "n_pallets_buffer": 1})
+    for day, (drawn, loaded) in enumerate(trucks, start=1):
+        detector.truck_unloaded(drawn, loaded)
+        # Storage is empty after every truck
+        detector.observe("TruckArrives", (0, loaded, 0, 0))
+        detector.observe("LoadingDockCleared", (0, 0, loaded, 0))
+        if detector.end_day(day):
+            return day
+    return None
+
+
+def test_a_truck_that_empties_storage_is_not_short_shipped():
+    detector = BottleneckDetector(storage_patience=2)
+    assert run_days(detector, [(5, 5)] * 5) is None
+    assert detector.reason is None
+
+
+def test_short_shipped_trucks_exhaust_storage():
+    detector = BottleneckDetector(storage_patience=2)
+    assert run_days(detector, [(5, 5), (5, 3), (5, 4)]) == 3
+    assert detector.reason == "storage_exhausted"
+
+
+def test_an_overfull_warehouse_stops_on_short_shipments():
+    ops = ArrayWarehouseOps(seed=1, settings={"new_pallets": 1.0, "variation": 0.0}, log_path=os.devnull,
+                            detector=BottleneckDetector())
+    ops.simulate(days=200)
+    assert ops.stop_reason == "storage_exhausted"
+    assert ops.day < 200
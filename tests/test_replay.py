@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from array_ops import ArrayWarehouseOps
+from replay import record_run, replay_run
+from warehouse_ops import WarehouseOps
+
+DAYS = 10
+EVENTS_PER_DAY = 5
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = str(tmp_path / "run.npz")
+    record_run(ArrayWarehouseOps(seed=1, log_path=os.devnull), days=DAYS, path=path)
+    return path
+
+
+@pytest.fixture
+def bulk_ops(pg):
+    ops = WarehouseOps("test_replay", drop_db_flag=True, bulk=True, log_path=os.devnull, **pg)
+    yield ops
+    ops.conn.close()
+    ops.drop_db()
+
+
+def test_bulk_replays_an_array_recording(recording, bulk_ops):
+    result = replay_run(bulk_ops, recording)
+    assert result["match"]
+    assert result["movements"] == DAYS * EVENTS_PER_DAY
+    assert result["unused_draws"] == 0
+
+
+def test_a_draw_that_no_longer_fits_raises(recording, bulk_ops, tmp_path):
+    # Record a truck size no randint() of the run can return
+    with np.load(recording) as data:
+        arrays = dict(data)
+    arrays["randint"][0] = 10 ** 6
+    tampered = str(tmp_path / "tampered.npz")
+    np.savez_compressed(tampered, **arrays)
+    with pytest.raises(ValueError, match="Replay diverged"):
+        replay_run(bulk_ops, tampered)
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from array_ops import FLOOR, ArrayWarehouseOps
+from scheduler import EventScheduler
+
+SEEDS = (1, 2, 3)
+DAYS = 30
+
+
+class CountingOps(ArrayWarehouseOps):
+    """ArrayWarehouseOps counting the units sold over all sales batches."""
+    sold = 0
+
+    def simulate_daily_sales(self, share=1.0):
+        before = self.pallet_quantity[self.pallets_in(FLOOR)].sum()
+        super().simulate_daily_sales(share)
+        self.sold += int(before - self.pallet_quantity[self.pallets_in(FLOOR)].sum())
+
+
+def run_totals(trucks_per_day, sales_batches_per_day):
+    arrivals = sold = 0
+    for seed in SEEDS:
+        ops = CountingOps(seed=seed, log_path=os.devnull, kpis=True)
+        EventScheduler(ops, trucks_per_day=trucks_per_day,
+                       sales_batches_per_day=sales_batches_per_day).run(DAYS)
+        arrivals += ops.fetch_kpis()["total_arrivals"]
+        sold += ops.sold
+    return arrivals, sold
+
+
+def test_one_event_of_each_kind_reproduces_simulate():
+    ops = ArrayWarehouseOps(seed=1, log_path=os.devnull)
+    ops.simulate(days=DAYS)
+    scheduled = ArrayWarehouseOps(seed=1, log_path=os.devnull)
+    EventScheduler(scheduled).run(DAYS)
+    assert scheduled.fetch_movements() == ops.fetch_movements()
+
+
+def test_trucks_split_the_daily_delivery():
+    ops = ArrayWarehouseOps(seed=1, log_path=os.devnull)
+    scheduler = EventScheduler(ops, trucks_per_day=7)
+    arrivals = []
+    ops.truck_arrives = arrivals.append
+    scheduler.delivery = list(range(17))
+    for truck in range(7):
+        scheduler.on_truck(truck)
+    assert [len(products) for products in arrivals] == [3, 3, 3, 2, 2, 2, 2]
+    assert sum(arrivals, []) == list(range(17))
+
+
+@pytest.mark.parametrize("trucks_per_day, sales_batches_per_day", [(3, 1), (7, 1), (20, 1), (1, 4), (1, 12), (3, 12)])
+def test_totals_do_not_depend_on_the_split_of_the_day(trucks_per_day, sales_batches_per_day):
+    arrivals, sold = run_totals(1, 1)
+    split_arrivals, split_sold = run_totals(trucks_per_day, sales_batches_per_day)
+    # Different splits draw differently, so the totals only agree up to sampling noise
+    assert split_arrivals == pytest.approx(arrivals, rel=0.1)
+    assert split_sold == pytest.approx(sold, rel=0.1)
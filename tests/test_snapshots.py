@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from array_ops import ArrayWarehouseOps
+from warehouse_ops import WarehouseOps
+
+WARMUP_DAYS = 4
+DAYS = 6
+SETTINGS = {"new_pallets": 0.9}
+
+
+def uninterrupted(seed):
+    ops = ArrayWarehouseOps(seed=seed, settings=SETTINGS, log_path=os.devnull, kpis=True)
+    ops.simulate(days=WARMUP_DAYS + DAYS)
+    return ops
+
+
+def test_array_fork_continues_the_run():
+    expected = uninterrupted(3)
+    ops = ArrayWarehouseOps(seed=3, settings=SETTINGS, log_path=os.devnull, kpis=True)
+    ops.simulate(days=WARMUP_DAYS)
+    fork = ArrayWarehouseOps.fork(ops.snapshot(), log_path=os.devnull, kpis=True)
+    fork.simulate(days=DAYS)
+    assert fork.fetch_movements() == expected.fetch_movements()
+    assert fork.fetch_kpis() == expected.fetch_kpis()
+
+
+@pytest.mark.parametrize("options", [{}, {"bulk": True}], ids=["per_row", "bulk"])
+def test_database_fork_continues_the_run(pg, options):
+    expected = uninterrupted(3)
+    ops = WarehouseOps("test_snapshots", drop_db_flag=True, seed=3, settings=SETTINGS, kpis=True,
+                       log_path=os.devnull, **options, **pg)
+    snapshot = fork = None
+    try:
+        ops.simulate(days=WARMUP_DAYS)
+        snapshot = ops.snapshot("test_snapshots_template")
+        fork = WarehouseOps.fork(snapshot, "test_snapshots_fork", pg["user"], pg["password"], pg["host"],
+                                 kpis=True, log_path=os.devnull, **options)
+        fork.simulate(days=DAYS)
+        assert [tuple(row) for row in fork.fetch_movements()] == expected.fetch_movements()
+        assert fork.fetch_kpis() == expected.fetch_kpis()
+
+        # The original run goes on unchanged by the snapshot
+        ops.simulate(days=DAYS)
+        assert [tuple(row) for row in ops.fetch_movements()] == expected.fetch_movements()
+    finally:
+        if fork is not None:
+            fork.conn.close()
+            fork.drop_db()
+        ops.conn.close()
+        if snapshot is not None:
+            ops.drop_snapshot(snapshot)
+        ops.drop_db()
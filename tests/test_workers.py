@@ -0,0 +1,26 @@
+import os
+
+from warehouse_ops import WarehouseOps
+from workers import ConcurrentWorkers
+
+SETTINGS = {"new_pallets": 0.9}
+DAYS = 15
+
+
+def test_workers_report_the_kpis_of_simulate(pg):
+    ops = WarehouseOps("test_workers", drop_db_flag=True, seed=5, settings=SETTINGS, kpis=True,
+                       log_path=os.devnull, **pg)
+    ops.simulate(days=DAYS)
+    expected = [ops.fetch_kpis(day) for day in range(1, DAYS + 1)]
+    ops.conn.close()
+
+    ops = WarehouseOps("test_workers", drop_db_flag=True, seed=5, settings=SETTINGS, kpis=True,
+                       log_path=os.devnull, **pg)
+    workers = ConcurrentWorkers(ops, workers=1)
+    try:
+        workers.run(days=DAYS)
+    finally:
+        workers.close()
+    assert [ops.fetch_kpis(day) for day in range(1, DAYS + 1)] == expected
+    ops.conn.close()
+    ops.drop_db()
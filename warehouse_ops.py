@@ -1,12 +1,117 @@
+import csv
+import io
+import itertools
+import os
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import Json
 import random
-import matplotlib.pyplot as plt
+import sys
+
+from bottlenecks import check_day
+from event_log import DEBUG, ERROR, INFO, WARNING, EventLog
+from instrumentation import InstrumentedCursor, Profiler, profiled
+from kpis import KPI_COLUMNS, KPITracker
+from layout import merge_run_settings, validate_settings
+from procedures import DISPATCH_SQL, INDEXES, OCCUPANCY_SQL, PROCEDURES_SQL
+from statements import PreparedStatements, Statements
+
+# Columns of a Movements export
+MOVEMENT_COLUMNS = ("day", "phase", "storage", "loadingdock", "floor", "buffer")
+
+# Columns of the PalletHistory table; movement_id is the Movements row of the phase
+HISTORY_COLUMNS = ("day", "movement_id", "pallet_id", "product_id", "from_location", "to_location")
+
+
+def write_parquet(path, chunks):
+    """
+    Write movement rows to a Parquet file, one row group per chunk.
+
+    pyarrow is only needed for this export and is imported on first use.
+
+    Parameters:
+    path (str): Output file path.
+    chunks (iterable): Lists of rows in MOVEMENT_COLUMNS order.
+
+    Returns:
+    int: Number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("day", pa.int32()), ("phase", pa.string()), ("storage", pa.int32()),
+                        ("loadingdock", pa.int32()), ("floor", pa.int32()), ("buffer", pa.int32())])
+    n_rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema))
+            n_rows += len(chunk)
+    return n_rows
+
+
+def drop_database(dbname, user, password, host):
+    """
+    Drop a database after closing its open sessions.
+
+    Parameters:
+    dbname (str): Name of the database.
+    user (str): Username for the database.
+    password (str): Password for the database user.
+    host (str): Database host address.
+
+    Returns:
+    None
+    """
+    conn = psycopg2.connect(dbname="postgres", user=user, password=password, host=host)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                WHERE datname = %s AND pid <> pg_backend_pid()
+            """, (dbname,))
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(dbname)))
+    finally:
+        conn.close()
+
+
+def copy_database(template, dbname, user, password, host):
+    """
+    Replace a database with a copy of another one made by CREATE DATABASE ... TEMPLATE.
+
+    The template must have no open sessions while it is copied.
+
+    Parameters:
+    template (str): Name of the database to copy.
+    dbname (str): Name of the new database; an existing one is dropped first.
+    user (str): Username for the database.
+    password (str): Password for the database user.
+    host (str): Database host address.
+
+    Returns:
+    None
+    """
+    drop_database(dbname, user, password, host)
+    conn = psycopg2.connect(dbname="postgres", user=user, password=password, host=host)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                sql.Identifier(dbname), sql.Identifier(template)))
+    finally:
+        conn.close()
 
 
 class WarehouseOps:
     def __init__(self, dbname: str, user: str, password: str, host: str,
-                 drop_db_flag: bool):
+                 drop_db_flag: bool, seed: int = None, bulk: bool = False,
+                 server_side: bool = False, settings: dict = None, log_path: str = "log.txt",
+                 log_options: dict = None, profile: bool = False, detector=None,
+                 history: bool = False, kpis: bool = False, prepared: bool = False,
+                 itersize: int = None):
         """
         Initialize the WarehouseOps instance.
 
@@ -16,6 +121,32 @@ class WarehouseOps:
         password (str): Password for the database user.
         host (str): Database host address.
         drop_db_flag (bool): Flag indicating whether to drop the existing database.
+        seed (int): Seed for the random generator driving truck contents and sales
+            (default is None, i.e. a non-reproducible run).
+        bulk (bool): Run the per-pallet phases as set-based SQL statements instead of
+            one round-trip per pallet (default is False).
+        server_side (bool): Install the simulate_day procedure and let simulate() run
+            the days inside the database (default is False).
+        settings (dict): Values overriding those of warehouse_settings(), e.g. from
+            layout.load_settings() or layout.generate_layout() (default is None).
+        log_path (str): Path of the log file (default is "log.txt").
+        log_options (dict): EventLog arguments such as level, format, run_id or append
+            (default is None, i.e. every message as text in a truncated file).
+        profile (bool): Count the statements, latency and rows of every phase per day;
+            see profile_report() (default is False).
+        detector (BottleneckDetector): Stops simulate() early once a bottleneck is
+            settled; not available with server_side (default is None).
+        history (bool): Record every pallet move in the day-partitioned PalletHistory
+            table; not available with server_side (default is False).
+        kpis (bool): Refresh the DailyKPIs and SkuKPIs tables at the end of every day;
+            not available with server_side (default is False).
+        prepared (bool): Prepare the per-pallet statements once per connection and send
+            their writes pipelined with the next query; see statements.py. Not available
+            with server_side (default is False).
+        itersize (int): Stream the pallet and location scans of the phases through named
+            server-side cursors, itersize rows per fetch, and apply the updates of each
+            chunk before fetching the next; not available with server_side (default is
+            None, i.e. every scan is fetched at once).
 
         Returns:
         None
@@ -27,10 +158,47 @@ class WarehouseOps:
         self.host = host
         self.conn = None
         self.cur = None
-        self.settings = self.warehouse_settings()
-
-        # Open log file in write mode to clear existing content
-        self.log_file = open("log.txt", "w")
+        self.settings = {**self.warehouse_settings(), **(settings or {})}
+        self.rng = random.Random(seed)
+        self.bulk = bulk
+        self.server_side = server_side
+        self.area_location_ids = {}
+        self.day = 0
+        # Set by scheduler.EventScheduler, which commits once per simulated day instead
+        self.defer_commits = False
+        self.profiler = Profiler() if profile else None
+        self.detector = detector
+        self.stop_reason = None
+        self.history = history
+        # Moves of the current phase, written to PalletHistory by log_movement
+        self.history_rows = []
+        self.history_partitions = set()
+        self.kpis = KPITracker() if kpis else None
+        # Fractions of a unit left unsold by the sales batches of sale_carry_day
+        self.sale_carry = {}
+        self.sale_carry_day = None
+        self.prepared = prepared
+        # The per-pallet statements of the phases, opened with the connection
+        self.statements = None
+        self.itersize = itersize
+
+        # Open the log; by default it truncates the file and keeps every level
+        self.event_log = EventLog(log_path, **(log_options or {}))
+        validate_settings(self.settings)
+        if detector is not None:
+            if server_side:
+                raise ValueError("A bottleneck detector cannot watch a server_side run")
+            detector.start(self.settings)
+        if history and server_side:
+            raise ValueError("Pallet history cannot be recorded in a server_side run")
+        if kpis and server_side:
+            raise ValueError("KPIs cannot be tracked in a server_side run")
+        if prepared and server_side:
+            raise ValueError("Prepared statements do not apply to a server_side run")
+        if itersize is not None and server_side:
+            raise ValueError("A server_side run has no phase scans to stream")
+        if itersize is not None and itersize < 1:
+            raise ValueError("itersize must be at least 1")
 
         self.log("Starting database operations")
         if drop_db_flag:
@@ -38,18 +206,40 @@ class WarehouseOps:
         self.connect_db()
         if drop_db_flag:
             self.create_tables()
+        self.cache_locations()
+        if kpis:
+            self.start_kpis()
+        if server_side:
+            self.install_procedures()
 
-    def log(self, message):
+    def log(self, message, level=INFO):
         """
         Write a log message to the log file.
 
+        Messages below the level of the event log are dropped; the others are written
+        in batches by the event log's background thread. The per-pallet DEBUG messages
+        are only built when event_log.enabled(DEBUG) is true.
+
         Parameters:
         message (str): The message to be logged.
+        level (int): DEBUG for per-pallet detail, INFO, WARNING or ERROR (default is INFO).
+
+        Returns:
+        None
+        """
+        self.event_log.write(message, level)
+
+    def commit(self):
+        """
+        Commit the current transaction at the end of a phase.
+
+        Does nothing while defer_commits is set; the caller commits itself.
 
         Returns:
         None
         """
-        self.log_file.write(f"{message}\n")
+        if not self.defer_commits:
+            self.conn.commit()
 
     def drop_db(self):
         """
@@ -75,7 +265,7 @@ class WarehouseOps:
             cur.close()
             conn.close()
         except Exception as e:
-            self.log(f"Error dropping database: {e}")
+            self.log(f"Error dropping database: {e}", ERROR)
 
     def connect_db(self):
         """
@@ -98,12 +288,18 @@ class WarehouseOps:
             cur.close()
             conn.close()
             self.conn = psycopg2.connect(dbname=self.dbname, user=self.user, password=self.password, host=self.host)
-            self.cur = self.conn.cursor()
+            if self.profiler is None:
+                self.cur = self.conn.cursor()
+            else:
+                self.cur = self.conn.cursor(cursor_factory=InstrumentedCursor)
+                self.cur.profiler = self.profiler
+            self.statements = (PreparedStatements if self.prepared else Statements)(self.cur)
             self.log(f"Connected to database {self.dbname}")
         except Exception as e:
-            self.log(f"Error connecting to database: {e}")
+            self.log(f"Error connecting to database: {e}", ERROR)
 
-    def warehouse_settings(self):
+    @staticmethod
+    def warehouse_settings():
         """
         Retrieve the warehouse settings.
 
@@ -125,6 +321,7 @@ class WarehouseOps:
                                    600, 550, 800, 400, 550, 350, 500, 800, 800,
                                    800, 450],
             "floor_locations": [f"AM-D-0{i}-01-1" for i in range(21, 61, 2)],
+            "floor_slots_per_product": 1,  # consecutive floor_locations per product
             "n_pallets_floor": 2,
             "loading_dock_label": "L-PALLET",
             "n_pallets_loading_dock": 30,
@@ -187,6 +384,7 @@ class WarehouseOps:
             self.cur.execute("""
                 CREATE TABLE Movements (
                     id SERIAL PRIMARY KEY,
+                    day INTEGER NOT NULL DEFAULT 0,
                     event VARCHAR(50) NOT NULL,
                     storage INTEGER NOT NULL,
                     loadingdock INTEGER NOT NULL,
@@ -196,132 +394,395 @@ class WarehouseOps:
             """)
             self.log("Movements table created")
 
-            # Insert records into Products table and use the returned id to insert into Locations table
-            settings = self.settings
-            products = settings["product_name"]
-            units_per_pallet = settings["n_units_per_pallet"]
-            floor_locations = settings["floor_locations"]
-            n_pallets_floor = settings["n_pallets_floor"]
+            # Create the PalletHistory table; log_movement adds a partition per day
+            self.cur.execute("""
+                CREATE TABLE PalletHistory (
+                    day INTEGER NOT NULL,
+                    movement_id INTEGER NOT NULL,
+                    pallet_id INTEGER NOT NULL,
+                    product_id INTEGER,
+                    from_location INTEGER NOT NULL,
+                    to_location INTEGER NOT NULL
+                ) PARTITION BY RANGE (day)
+            """)
+            self.log("PalletHistory table created")
+
+            # Create the KPI tables refreshed at the end of every day
+            self.cur.execute("""
+                CREATE TABLE DailyKPIs (
+                    day INTEGER PRIMARY KEY,
+                    arrivals INTEGER NOT NULL,
+                    spilled INTEGER NOT NULL,
+                    stranded INTEGER NOT NULL,
+                    storage_left INTEGER NOT NULL,
+                    storage_min INTEGER NOT NULL,
+                    stockout_skus INTEGER NOT NULL,
+                    total_arrivals INTEGER NOT NULL,
+                    total_spilled INTEGER NOT NULL,
+                    stranded_days INTEGER NOT NULL,
+                    storage_empty_days INTEGER NOT NULL,
+                    stockout_sku_days INTEGER NOT NULL
+                )
+            """)
+            self.cur.execute("""
+                CREATE TABLE SkuKPIs (
+                    product_id INTEGER PRIMARY KEY REFERENCES Products(id),
+                    stockout_days INTEGER NOT NULL DEFAULT 0,
+                    last_stockout_day INTEGER
+                )
+            """)
+            self.log("KPI tables created")
+
+            if self.bulk:
+                self.populate_bulk()
+            else:
+                self.populate_per_row()
 
-            for name, units, loc in zip(products, units_per_pallet,
-                                        floor_locations):
-                self.cur.execute("""
-                    INSERT INTO Products (name, units_per_pallet)
-                    VALUES (%s, %s)
-                    RETURNING id
-                """, (name, units))
-                product_id = self.cur.fetchone()[0]
-                self.log(
-                    f"Inserted product {name} with {units} units per pallet, id: {product_id}")
+            self.cur.execute("INSERT INTO SkuKPIs (product_id) SELECT id FROM Products")
 
+            # Create the occupancy counters and indexes once the pallets are in place
+            self.cur.execute(OCCUPANCY_SQL)
+            self.log("Occupancy tables and triggers created")
+            self.create_indexes()
+
+            self.conn.commit()
+            self.log("All products, locations, and pallets inserted")
+        except Exception as e:
+            self.log(f"Error creating tables: {e}", ERROR)
+
+    def populate_per_row(self):
+        """
+        Insert products, locations and the Storage pallets one row at a time.
+
+        Returns:
+        None
+        """
+        # Insert records into Products table and use the returned id to insert into Locations table
+        settings = self.settings
+        products = settings["product_name"]
+        units_per_pallet = settings["n_units_per_pallet"]
+        floor_locations = settings["floor_locations"]
+        slots = settings["floor_slots_per_product"]
+        n_pallets_floor = settings["n_pallets_floor"]
+
+        for i, (name, units) in enumerate(zip(products, units_per_pallet)):
+            self.cur.execute("""
+                INSERT INTO Products (name, units_per_pallet)
+                VALUES (%s, %s)
+                RETURNING id
+            """, (name, units))
+            product_id = self.cur.fetchone()[0]
+            self.log(
+                f"Inserted product {name} with {units} units per pallet, id: {product_id}", DEBUG)
+
+            for loc in floor_locations[i * slots:(i + 1) * slots]:
                 self.cur.execute("""
                     INSERT INTO Locations (label, area, product_id, max_pallets)
                     VALUES (%s, 'Floor', %s, %s)
                 """, (loc, product_id, n_pallets_floor))
-                self.log(f"Inserted location {loc} for product id {product_id}")
+                self.log(f"Inserted location {loc} for product id {product_id}", DEBUG)
 
-            # Insert LoadingDock location
-            loc = settings["loading_dock_label"]
-            product_id = None  # Use None instead of NULL
-            n_pallets_loading_dock = settings["n_pallets_loading_dock"]
+        # Insert LoadingDock location
+        loc = settings["loading_dock_label"]
+        product_id = None  # Use None instead of NULL
+        n_pallets_loading_dock = settings["n_pallets_loading_dock"]
+        self.cur.execute("""
+            INSERT INTO Locations (label, area, product_id, max_pallets)
+            VALUES (%s, 'LoadingDock', %s, %s)
+        """, (loc, product_id, n_pallets_loading_dock))
+        self.log(f"Inserted location {loc} for area LoadingDock", DEBUG)
+
+        # Insert Storage locations
+        storage_label = settings["storage_label"]
+        n_pallets_storage = settings["n_pallets_storage"]
+        self.cur.execute("""
+            INSERT INTO Locations (label, area, product_id, max_pallets)
+            VALUES (%s, 'Storage', %s, %s)
+        """, (storage_label, None, n_pallets_storage))
+        self.log(f"Inserted location {storage_label} for area Storage", DEBUG)
+
+        # Insert Buffer locations
+        buffer_locations = settings["buffer_locations"]
+        n_pallets_buffer = settings["n_pallets_buffer"]
+        for buffer_loc in buffer_locations:
             self.cur.execute("""
                 INSERT INTO Locations (label, area, product_id, max_pallets)
-                VALUES (%s, 'LoadingDock', %s, %s)
-            """, (loc, product_id, n_pallets_loading_dock))
-            self.log(f"Inserted location {loc} for area LoadingDock")
+                VALUES (%s, 'Buffer', %s, %s)
+            """, (buffer_loc, None, n_pallets_buffer))
+            self.log(f"Inserted location {buffer_loc} for area Buffer", DEBUG)
 
-            # Insert Storage locations
-            storage_label = settings["storage_label"]
-            n_pallets_storage = settings["n_pallets_storage"]
-            self.cur.execute("""
-                INSERT INTO Locations (label, area, product_id, max_pallets)
-                VALUES (%s, 'Storage', %s, %s)
-            """, (storage_label, None, n_pallets_storage))
-            self.log(f"Inserted location {storage_label} for area Storage")
-
-            # Insert Buffer locations
-            buffer_locations = settings["buffer_locations"]
-            n_pallets_buffer = settings["n_pallets_buffer"]
-            for buffer_loc in buffer_locations:
-                self.cur.execute("""
-                    INSERT INTO Locations (label, area, product_id, max_pallets)
-                    VALUES (%s, 'Buffer', %s, %s)
-                """, (buffer_loc, None, n_pallets_buffer))
-                self.log(f"Inserted location {buffer_loc} for area Buffer")
+        # Place all 100 pallets into Storage
+        self.cur.execute("""
+            SELECT id FROM Locations WHERE area = 'Storage'
+        """)
+        storage_location_id = self.cur.fetchone()[0]
 
-            # Place all 100 pallets into Storage
+        for _ in range(settings["n_pallets_storage"]):
             self.cur.execute("""
-                SELECT id FROM Locations WHERE area = 'Storage'
-            """)
-            storage_location_id = self.cur.fetchone()[0]
+                INSERT INTO Pallets (product_id, location_id, quantity)
+                VALUES (%s, %s, %s)
+            """, (None, storage_location_id, 0))
+            self.log(
+                f"Inserted a pallet into Storage with product_id=NULL and quantity=0", DEBUG)
 
-            for _ in range(settings["n_pallets_storage"]):
-                self.cur.execute("""
-                    INSERT INTO Pallets (product_id, location_id, quantity)
-                    VALUES (%s, %s, %s)
-                """, (None, storage_location_id, 0))
-                self.log(
-                    f"Inserted a pallet into Storage with product_id=NULL and quantity=0")
+    def populate_bulk(self):
+        """
+        Load products, locations and the Storage pallets with COPY FROM STDIN.
 
-            self.conn.commit()
-            self.log("All products, locations, and pallets inserted")
+        Rows get the same ids as populate_per_row would give them, each product
+        followed by its Floor locations, so both paths produce identical tables.
+        A single summary line is logged instead of one line per row.
+
+        Returns:
+        None
+        """
+        settings = self.settings
+        products = settings["product_name"]
+        floor_locations = settings["floor_locations"]
+        slots = settings["floor_slots_per_product"]
+        buffer_locations = settings["buffer_locations"]
+        n_pallets_storage = settings["n_pallets_storage"]
+        loading_dock_id = len(floor_locations) + 1
+        storage_location_id = len(floor_locations) + 2
+
+        self.copy_rows("Products", ("id", "name", "units_per_pallet"),
+                       ((i, name, units) for i, (name, units)
+                        in enumerate(zip(products, settings["n_units_per_pallet"]), start=1)))
+
+        floor = ((i + 1, loc, "Floor", i // slots + 1, settings["n_pallets_floor"])
+                 for i, loc in enumerate(floor_locations))
+        others = [
+            (loading_dock_id, settings["loading_dock_label"], "LoadingDock", None,
+             settings["n_pallets_loading_dock"]),
+            (storage_location_id, settings["storage_label"], "Storage", None, n_pallets_storage),
+        ]
+        buffer = ((i, loc, "Buffer", None, settings["n_pallets_buffer"])
+                  for i, loc in enumerate(buffer_locations, start=storage_location_id + 1))
+        self.copy_rows("Locations", ("id", "label", "area", "product_id", "max_pallets"),
+                       itertools.chain(floor, others, buffer))
+
+        self.copy_rows("Pallets", ("id", "product_id", "location_id", "quantity"),
+                       ((i, None, storage_location_id, 0) for i in range(1, n_pallets_storage + 1)))
+
+        # Explicit ids bypass the SERIAL sequences, so move them past the loaded rows
+        for table in ("Products", "Locations", "Pallets"):
+            self.cur.execute(sql.SQL(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {}"
+            ).format(sql.Identifier(table.lower())), (table.lower(),))
+
+        self.log(f"Bulk loaded {len(products)} products, {storage_location_id + len(buffer_locations)} "
+                 f"locations and {n_pallets_storage} pallets into Storage")
+
+    def copy_rows(self, table, columns, rows):
+        """
+        Stream rows into a table with COPY FROM STDIN in CSV format.
+
+        Parameters:
+        table (str): Name of the table.
+        columns (tuple): Column names, in the order of the row values.
+        rows (iterable): Row tuples; None is loaded as NULL.
+
+        Returns:
+        None
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        self.cur.copy_expert(sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.Identifier(table.lower()),
+            sql.SQL(", ").join(map(sql.Identifier, columns))), buffer)
+
+    def create_indexes(self):
+        """
+        Create the indexes used by the phase queries.
+
+        Returns:
+        None
+        """
+        for name, definition in INDEXES.items():
+            self.cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON " + definition).format(
+                sql.Identifier(name)))
+        self.cur.execute("ANALYZE")
+        self.log(f"Created {len(INDEXES)} indexes")
+
+    def drop_indexes(self):
+        """
+        Drop the indexes created by create_indexes, e.g. to measure their effect.
+
+        Returns:
+        None
+        """
+        for name in INDEXES:
+            self.cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(name)))
+        self.log(f"Dropped {len(INDEXES)} indexes")
+
+    def cache_locations(self):
+        """
+        Resolve the location ids used by the phase queries once.
+
+        Fills area_location_ids (area -> location ids, in id order), so the hot queries
+        take ids as parameters instead of looking them up in Locations every time.
+
+        Raises the error after logging it, e.g. when the connection failed or the
+        tables were never created, since no phase can run without the ids.
+
+        Returns:
+        None
+        """
+        if self.conn is None:
+            raise ConnectionError(f"Not connected to database {self.dbname}")
+        try:
+            self.cur.execute("SELECT id, area FROM Locations ORDER BY id")
+            self.area_location_ids = {area: [] for area in ("Storage", "LoadingDock", "Floor", "Buffer")}
+            for location_id, area in self.cur.fetchall():
+                self.area_location_ids[area].append(location_id)
+            self.storage_location_id = self.area_location_ids["Storage"][0]
+            self.loading_dock_location_id = self.area_location_ids["LoadingDock"][0]
+            self.log(f"Cached {sum(map(len, self.area_location_ids.values()))} location ids")
         except Exception as e:
-            self.log(f"Error creating tables: {e}")
+            self.conn.rollback()
+            self.log(f"Error caching locations: {e}", ERROR)
+            raise
 
-    def truck_arrives(self):
+    def install_procedures(self):
         """
-        Handle the arrival of a truck with new pallets.
+        Install the server-side simulation procedures.
 
-        This method simulates the arrival of a truck delivering new pallets of products
-        to the loading dock. The number and type of pallets are determined based on the
-        warehouse settings and current inventory levels.
+        simulate_day(seed, settings) runs the five phases of a day as set-based SQL
+        inside the database and simulate_days(days, seed, settings) loops over it.
+        The procedures draw from PostgreSQL's random(), so a seeded run is reproducible
+        but does not draw the same trucks and sales as the client-side paths.
 
         Returns:
         None
         """
+        try:
+            self.cur.execute(PROCEDURES_SQL)
+            self.conn.commit()
+            self.log("Simulation procedures installed")
+        except Exception as e:
+            self.conn.rollback()
+            self.log(f"Error installing procedures: {e}", ERROR)
+
+    def procedure_settings(self):
+        """
+        Return the settings the server-side procedures need.
+
+        Returns:
+        dict: Number of products, new_pallets, variation and min_sale.
+        """
+        settings = self.settings
+        return {
+            "n_products": len(settings["product_name"]),
+            "new_pallets": settings["new_pallets"],
+            "variation": settings["variation"],
+            "min_sale": settings["min_sale"],
+        }
+
+    def scan(self, name, query, params=None):
+        """
+        Run the scan of a phase and yield its rows in chunks.
+
+        Without itersize the scan is fetched at once and yielded as one chunk. With
+        itersize it runs in a named server-side cursor and is fetched itersize rows
+        at a time, so the client holds one chunk whatever the size of the warehouse.
+        The cursor reads the snapshot taken when it is opened, so the updates the
+        phase makes between chunks do not change the rows that come back.
+
+        Parameters:
+        name (str): Name of the server-side cursor.
+        query (str): The SELECT statement.
+        params (tuple): Query parameters (default is None).
+
+        Returns:
+        generator: Lists of rows, in the order of the query.
+        """
+        if self.itersize is None:
+            self.cur.execute(query, params)
+            yield self.cur.fetchall()
+            return
+        factory = InstrumentedCursor if self.profiler is not None else None
+        with self.conn.cursor(name=name, cursor_factory=factory) as cur:
+            if self.profiler is not None:
+                cur.profiler = self.profiler
+            cur.itersize = self.itersize
+            cur.execute(query, params)
+            yield from iter(lambda: cur.fetchmany(self.itersize), [])
+
+    def draw_delivery(self):
+        """
+        Draw the products delivered on a day.
+
+        The day's delivery holds at most one pallet of every product. Its size is
+        new_pallets times the number of products, varied by up to variation of that.
+
+        Returns:
+        list: Zero-based product indices, in the order they are unloaded.
+        """
         settings = self.settings
         products = settings["product_name"]
-        units_per_pallet = settings["n_units_per_pallet"]
         new_pallets = int(settings["new_pallets"] * len(products))
         variation = int(new_pallets * settings["variation"])
 
-        n_new_pallets = new_pallets + random.randint(-variation, variation)
+        # A day's delivery carries at most one pallet of every product
+        n_new_pallets = min(new_pallets + self.rng.randint(-variation, variation), len(products))
 
         # Select random new pallets
-        new_product_indices = random.sample(range(len(products)), n_new_pallets)
+        return self.rng.sample(range(len(products)), n_new_pallets)
+
+    @profiled
+    def truck_arrives(self, products=None):
+        """
+        Handle the arrival of a truck with new pallets.
+
+        This method simulates the arrival of a truck delivering new pallets of products
+        to the loading dock. The number and type of pallets are determined based on the
+        warehouse settings and current inventory levels.
+
+        Parameters:
+        products (list): Zero-based indices of the products on this truck, e.g. its
+            part of a draw_delivery() split over several trucks (default is None, i.e.
+            one truck with the day's whole delivery).
+
+        Returns:
+        int: The number of pallets moved to the LoadingDock.
+        """
+        settings = self.settings
+        units_per_pallet = settings["n_units_per_pallet"]
+        new_product_indices = self.draw_delivery() if products is None else products
+        products = settings["product_name"]
+        debug = self.event_log.enabled(DEBUG)
+        loaded = 0
         for idx in new_product_indices:
             product_name = products[idx]
             units = units_per_pallet[idx]
 
             # Move a pallet from Storage to LoadingDock
-            self.cur.execute("""
-                SELECT id FROM Pallets WHERE location_id = (
-                    SELECT id FROM Locations WHERE area = 'Storage'
-                ) LIMIT 1
-            """)
-            pallet_id = self.cur.fetchone()
+            pallet_id = self.statements.fetchone("storage_pick", (self.storage_location_id,))
 
             if pallet_id:
                 pallet_id = pallet_id[0]
-                self.cur.execute("""
-                    UPDATE Pallets
-                    SET product_id = %s, location_id = (
-                        SELECT id FROM Locations WHERE area = 'LoadingDock'
-                    ), quantity = %s
-                    WHERE id = %s
-                """, (idx + 1, units, pallet_id))
-                self.log(
-                    f"Moved pallet {pallet_id} with {product_name} to LoadingDock")
+                self.statements.run("load_pallet", (idx + 1, self.loading_dock_location_id, units, pallet_id))
+                loaded += 1
+                if self.history:
+                    self.history_rows.append(
+                        (pallet_id, idx + 1, self.storage_location_id, self.loading_dock_location_id))
+                if debug:
+                    self.log(f"Moved pallet {pallet_id} with {product_name} to LoadingDock", DEBUG)
             else:
                 self.log(
-                    "No more pallets available in storage to move to LoadingDock")
+                    "No more pallets available in storage to move to LoadingDock", WARNING)
                 break  # Exit the loop if no pallets are available
+        if self.detector is not None:
+            self.detector.truck_unloaded(len(new_product_indices), loaded)
 
         # Log the movement after all pallets have been moved
         self.log_movement('TruckArrives')
 
-        self.conn.commit()
+        self.commit()
+        return loaded
 
+    @profiled
     def move_pallets_from_loading_dock(self):
         """
         Move pallets from the loading dock to the floor or buffer areas.
@@ -333,58 +794,105 @@ class WarehouseOps:
         Returns:
         None
         """
-        # Query for pallets in LoadingDock
-        self.cur.execute("""
-            SELECT id, product_id FROM Pallets 
-            WHERE location_id = (SELECT id FROM Locations WHERE area = 'LoadingDock')
-        """)
-        pallets = self.cur.fetchall()
+        if self.bulk:
+            self.dispatch_bulk()
+        else:
+            self.dispatch_per_pallet()
 
-        for pallet_id, product_id in pallets:
-            # Check if there's space in the Floor area for this product
-            self.cur.execute("""
-                SELECT id FROM Locations 
-                WHERE area = 'Floor' AND product_id = %s 
-                AND (SELECT COUNT(*) FROM Pallets WHERE location_id = Locations.id) < 2
-            """, (product_id,))
-            floor_location = self.cur.fetchone()
+        # Log the movement after all pallets have been moved
+        self.log_movement('LoadingDock')
+
+        self.commit()
+
+    def dispatch_per_pallet(self):
+        """
+        Dispatch the loading dock pallets one at a time.
+
+        Each pallet, in id order, goes to a Floor location of its product with a free
+        slot, otherwise to the lowest-id Buffer location with a free slot, otherwise it
+        stays on the loading dock.
+
+        Returns:
+        None
+        """
+        # Query for pallets in LoadingDock
+        pallets = self.scan("dock_pallets", """
+            SELECT id, product_id FROM Pallets
+            WHERE location_id = %s
+            ORDER BY id
+        """, (self.loading_dock_location_id,))
+
+        spilled = 0
+        debug = self.event_log.enabled(DEBUG)
+        for pallet_id, product_id in itertools.chain.from_iterable(pallets):
+            # Check the free-slot list for a Floor location of this product
+            floor_location = self.statements.fetchone("floor_slot", (product_id,))
 
             if floor_location:
                 # Move pallet to the available floor location
-                self.cur.execute("""
-                    UPDATE Pallets
-                    SET location_id = %s
-                    WHERE id = %s
-                """, (floor_location[0], pallet_id))
-                self.log(
-                    f"Moved pallet {pallet_id} with product_id {product_id} to Floor location {floor_location[0]}")
+                self.statements.run("move_pallet", (floor_location[0], pallet_id))
+                if self.history:
+                    self.history_rows.append(
+                        (pallet_id, product_id, self.loading_dock_location_id, floor_location[0]))
+                if debug:
+                    self.log(
+                        f"Moved pallet {pallet_id} with product_id {product_id} to Floor location {floor_location[0]}", DEBUG)
             else:
-                # Move pallet to an empty Buffer location
-                self.cur.execute("""
-                    SELECT id FROM Locations 
-                    WHERE area = 'Buffer' 
-                    AND (SELECT COUNT(*) FROM Pallets WHERE location_id = Locations.id) = 0
-                    LIMIT 1
-                """)
-                buffer_location = self.cur.fetchone()
+                # Move pallet to a Buffer location with a free slot
+                buffer_location = self.statements.fetchone("buffer_slot")
                 if buffer_location:
-                    self.cur.execute("""
-                        UPDATE Pallets
-                        SET location_id = %s
-                        WHERE id = %s
-                    """, (buffer_location[0], pallet_id))
-                    self.log(
-                        f"Moved pallet {pallet_id} with product_id {product_id} to Buffer location {buffer_location[0]}")
+                    self.statements.run("move_pallet", (buffer_location[0], pallet_id))
+                    spilled += 1
+                    if self.history:
+                        self.history_rows.append(
+                            (pallet_id, product_id, self.loading_dock_location_id, buffer_location[0]))
+                    if debug:
+                        self.log(
+                            f"Moved pallet {pallet_id} with product_id {product_id} to Buffer location {buffer_location[0]}", DEBUG)
                 else:
                     self.log(
-                        f"No available space for pallet {pallet_id} with product_id {product_id}")
+                        f"No available space for pallet {pallet_id} with product_id {product_id}", WARNING)
+        if self.kpis is not None:
+            self.kpis.spill(spilled)
 
-        # Log the movement after all pallets have been moved
-        self.log_movement('LoadingDock')
+    def dispatch_bulk(self):
+        """
+        Dispatch all loading dock pallets with one set-based UPDATE.
 
-        self.conn.commit()
+        Dock pallets are ranked per product and matched against the free Floor slots of
+        their product, ranked in location id order. The pallets left over are ranked
+        again and matched against the free Buffer slots. The result is the same as
+        dispatch_per_pallet, but the number of statements does not grow with the dock.
 
-    def simulate_daily_sales(self):
+        Returns:
+        None
+        """
+        self.cur.execute(DISPATCH_SQL + """
+            RETURNING p.id, p.product_id, m.area, m.location_id
+        """, {"dock_id": self.loading_dock_location_id})
+        moved = self.cur.fetchall()
+        if self.kpis is not None:
+            self.kpis.spill(sum(area == 'Buffer' for _, _, area, _ in moved))
+        if self.history:
+            self.history_rows.extend((pallet_id, product_id, self.loading_dock_location_id, location_id)
+                                     for pallet_id, product_id, _, location_id in moved)
+        if self.event_log.enabled(DEBUG):
+            for pallet_id, product_id, area, location_id in sorted(moved):
+                self.log(
+                    f"Moved pallet {pallet_id} with product_id {product_id} to {area} location {location_id}", DEBUG)
+
+        # Whatever did not fit stays on the dock
+        pallets = self.scan("dock_pallets", """
+            SELECT id, product_id FROM Pallets
+            WHERE location_id = %s
+            ORDER BY id
+        """, (self.loading_dock_location_id,))
+        for pallet_id, product_id in itertools.chain.from_iterable(pallets):
+            self.log(
+                f"No available space for pallet {pallet_id} with product_id {product_id}", WARNING)
+
+    @profiled
+    def simulate_daily_sales(self, share=1.0):
         """
         Simulate daily sales of products on the floor area.
 
@@ -393,53 +901,138 @@ class WarehouseOps:
         updates the inventory accordingly. If a pallet is emptied, it is moved to
         storage.
 
+        Parameters:
+        share (float): Part of the daily sales this batch sells (default is 1.0, one
+            batch per day).
+
         Returns:
         None
         """
-        settings = self.settings
-        min_sale = settings["min_sale"]
-
-        # Query for pallets in the Floor area
-        self.cur.execute("""
-            SELECT p.id, p.product_id, p.quantity, pr.units_per_pallet 
+        # Query for pallets in the Floor area; a streamed scan sells chunk by chunk
+        chunks = self.scan("floor_pallets", """
+            SELECT p.id, p.product_id, p.quantity, pr.units_per_pallet, p.location_id
             FROM Pallets p
             JOIN Products pr ON p.product_id = pr.id
-            WHERE p.location_id IN (
-                SELECT id FROM Locations WHERE area = 'Floor'
-            )
-        """)
-        pallets = self.cur.fetchall()
+            WHERE p.location_id = ANY(%s)
+            ORDER BY p.id
+        """, (self.area_location_ids["Floor"],))
+
+        for pallets in chunks:
+            if self.bulk:
+                self.sell_bulk(pallets, share)
+            else:
+                self.sell_per_pallet(pallets, share)
+
+        # Log the movement
+        self.log_movement('Sales')
+
+        self.commit()
+
+    def draw_sales(self, pallets, share=1.0):
+        """
+        Draw the sale of every Floor pallet of a sales batch, in id order.
+
+        A pallet sells a random part, between min_sale and all, of units_per_pallet a
+        day, and a batch sells share of that. The fraction of a unit a batch cannot sell
+        is carried to the next batch of the same day for a pallet that is not emptied,
+        so splitting the day into batches does not lose units to rounding.
+
+        Parameters:
+        pallets (list): (id, product_id, quantity, units_per_pallet, location_id) rows in id order.
+        share (float): Part of the daily sales to apply (default is 1.0).
 
-        for pallet_id, product_id, quantity, units_per_pallet in pallets:
+        Returns:
+        list: Whole units sold from every pallet.
+        """
+        if self.sale_carry_day != self.day:
+            self.sale_carry = {}
+            self.sale_carry_day = self.day
+        min_sale = self.settings["min_sale"]
+
+        sale_quantities = []
+        for pallet_id, _, quantity, units_per_pallet, _ in pallets:
+            sale = self.rng.uniform(min_sale, 1) * share * units_per_pallet + self.sale_carry.pop(pallet_id, 0.0)
+            sale_quantities.append(int(sale))
+            if share < 1 and quantity > int(sale):
+                self.sale_carry[pallet_id] = sale - int(sale)
+        return sale_quantities
+
+    def sell_per_pallet(self, pallets, share=1.0):
+        """
+        Apply a random sale to every Floor pallet with one UPDATE per pallet.
+
+        Parameters:
+        pallets (list): (id, product_id, quantity, units_per_pallet, location_id) rows in id order.
+        share (float): Part of the daily sales to apply (default is 1.0).
+
+        Returns:
+        None
+        """
+        sale_quantities = self.draw_sales(pallets, share)
+
+        debug = self.event_log.enabled(DEBUG)
+        for (pallet_id, product_id, quantity, _, location_id), sale_quantity in zip(pallets, sale_quantities):
             # Decrease quantity by a whole number based on units_per_pallet
-            sale_quantity = int(random.uniform(min_sale, 1) * units_per_pallet)
             new_quantity = quantity - sale_quantity
 
             if new_quantity > 0:
                 # Update the pallet with the new quantity
-                self.cur.execute("""
-                    UPDATE Pallets
-                    SET quantity = %s
-                    WHERE id = %s
-                """, (new_quantity, pallet_id))
-                self.log(
-                    f"Sold {sale_quantity} units from pallet {pallet_id}, new quantity is {new_quantity}")
+                self.statements.run("sell", (new_quantity, pallet_id))
+                if debug:
+                    self.log(
+                        f"Sold {sale_quantity} units from pallet {pallet_id}, new quantity is {new_quantity}", DEBUG)
             else:
                 # Move the empty pallet to Storage
-                self.cur.execute("""
-                    UPDATE Pallets
-                    SET product_id = NULL, location_id = (
-                        SELECT id FROM Locations WHERE area = 'Storage'
-                    ), quantity = 0
-                    WHERE id = %s
-                """, (pallet_id,))
-                self.log(f"Pallet {pallet_id} is empty and moved to Storage")
+                self.statements.run("empty_pallet", (self.storage_location_id, pallet_id))
+                if self.history:
+                    self.history_rows.append((pallet_id, product_id, location_id, self.storage_location_id))
+                if debug:
+                    self.log(f"Pallet {pallet_id} is empty and moved to Storage", DEBUG)
 
-        # Log the movement
-        self.log_movement('Sales')
+    def sell_bulk(self, pallets, share=1.0):
+        """
+        Apply a random sale to every Floor pallet with a single UPDATE.
 
-        self.conn.commit()
+        All sales are drawn up front, in the same order as sell_per_pallet draws them,
+        and the decrements and empty-to-Storage resets go to the database as two arrays.
+
+        Parameters:
+        pallets (list): (id, product_id, quantity, units_per_pallet, location_id) rows in id order.
+        share (float): Part of the daily sales to apply (default is 1.0).
+
+        Returns:
+        None
+        """
+        # Draw the sale of every pallet at once
+        sale_quantities = self.draw_sales(pallets, share)
+        pallet_ids = [pallet_id for pallet_id, _, _, _, _ in pallets]
+        new_quantities = [quantity - sale_quantity
+                          for (_, _, quantity, _, _), sale_quantity in zip(pallets, sale_quantities)]
+
+        # Decrease the quantities and send the emptied pallets to Storage
+        self.cur.execute("""
+            UPDATE Pallets p
+            SET quantity = GREATEST(v.quantity, 0),
+                product_id = CASE WHEN v.quantity > 0 THEN p.product_id END,
+                location_id = CASE WHEN v.quantity > 0 THEN p.location_id ELSE %s END
+            FROM unnest(%s::int[], %s::int[]) AS v(id, quantity)
+            WHERE p.id = v.id
+        """, (self.storage_location_id, pallet_ids, new_quantities))
+        if self.history:
+            self.history_rows.extend((pallet_id, product_id, location_id, self.storage_location_id)
+                                     for (pallet_id, product_id, _, _, location_id), new_quantity
+                                     in zip(pallets, new_quantities) if new_quantity <= 0)
+
+        if not self.event_log.enabled(DEBUG):
+            return
+        for pallet_id, sale_quantity, new_quantity in zip(pallet_ids, sale_quantities, new_quantities):
+            if new_quantity > 0:
+                self.log(
+                    f"Sold {sale_quantity} units from pallet {pallet_id}, new quantity is {new_quantity}", DEBUG)
+            else:
+                self.log(f"Pallet {pallet_id} is empty and moved to Storage", DEBUG)
 
+    @profiled
     def move_from_buffer(self):
         """
         Move pallets from the buffer area to the floor area.
@@ -451,40 +1044,32 @@ class WarehouseOps:
         Returns:
         None
         """
-        # Query for available spots in the Floor area
-        self.cur.execute("""
-            SELECT id, product_id FROM Locations 
-            WHERE area = 'Floor' AND (
-                SELECT COUNT(*) FROM Pallets WHERE location_id = Locations.id
-            ) < Locations.max_pallets
+        # Query the free-slot list for available spots in the Floor area
+        floor_locations = self.scan("free_floor_locations", """
+            SELECT location_id, product_id FROM LocationOccupancy
+            WHERE area = 'Floor' AND pallets < max_pallets
+            ORDER BY location_id
         """)
-        floor_locations = self.cur.fetchall()
 
-        for floor_location_id, product_id in floor_locations:
-            # Find a pallet with the required product_id in the Buffer area
-            self.cur.execute("""
-                SELECT id FROM Pallets 
-                WHERE product_id = %s AND location_id IN (
-                    SELECT id FROM Locations WHERE area = 'Buffer'
-                )
-                LIMIT 1
-            """, (product_id,))
-            buffer_pallet = self.cur.fetchone()
+        debug = self.event_log.enabled(DEBUG)
+        for floor_location_id, product_id in itertools.chain.from_iterable(floor_locations):
+            # Find a pallet with the required product_id in the Buffer area; the product
+            # index yields the few pallets of the product, whatever the Buffer size
+            buffer_pallet = self.statements.fetchone("buffer_pallet", (product_id,))
 
             if buffer_pallet:
                 # Move the pallet from Buffer to Floor
-                self.cur.execute("""
-                    UPDATE Pallets
-                    SET location_id = %s
-                    WHERE id = %s
-                """, (floor_location_id, buffer_pallet[0]))
-                self.log(
-                    f"Moved pallet {buffer_pallet[0]} with product_id {product_id} from Buffer to Floor location {floor_location_id}")
+                self.statements.run("move_pallet", (floor_location_id, buffer_pallet[0]))
+                if self.history:
+                    self.history_rows.append((buffer_pallet[0], product_id, buffer_pallet[1], floor_location_id))
+                if debug:
+                    self.log(
+                        f"Moved pallet {buffer_pallet[0]} with product_id {product_id} from Buffer to Floor location {floor_location_id}", DEBUG)
 
         # Log the movement
         self.log_movement('BufferMoves')
 
-        self.conn.commit()
+        self.commit()
 
     def simulate(self, days=10):
         """
@@ -504,7 +1089,16 @@ class WarehouseOps:
         Returns:
         None
         """
-        for day in range(days):
+        if self.server_side:
+            self.simulate_server_side(days)
+            return
+        if self.stop_reason is not None:
+            self.log(f"Run already stopped: {self.stop_reason}", WARNING)
+            return
+
+        # Day numbers continue from earlier calls
+        for day in range(self.day, self.day + days):
+            self.day = day + 1
             self.log(f"Day {day + 1} simulation starts")
 
             # Event 1: Truck Arrives
@@ -524,91 +1118,514 @@ class WarehouseOps:
 
             self.log(f"Day {day + 1} simulation ends")
 
+            # Close the day; stop once the detector has settled the outcome of the run
+            if self.end_day():
+                break
+
+    @profiled
+    def simulate_server_side(self, days=10):
+        """
+        Run the simulation inside the database with a single procedure call.
+
+        The procedure seed is drawn from the instance's random generator, so runs with
+        the same seed are reproducible.
+
+        Parameters:
+        days (int): The number of days to run the simulation (default is 10).
+
+        Returns:
+        None
+        """
+        self.log(f"Days {self.day + 1}-{self.day + days} simulation starts in the database")
+        self.cur.execute("CALL simulate_days(%s, %s::DOUBLE PRECISION, %s::JSONB)",
+                         (days, self.rng.uniform(-1, 1), Json(self.procedure_settings())))
+        self.conn.commit()
+        self.day += days
+        self.log(f"Days {self.day - days + 1}-{self.day} simulation ends")
+
+    @profiled
     def log_movement(self, event):
         """
         Log the movement of pallets in the warehouse.
 
         This method records the movement event in the database by inserting a new record
-        into the Movements table. The record includes the event description and the current
-        count of pallets in the storage, loading dock, floor, and buffer areas.
+        into the Movements table. The record includes the day, the event description and the current
+        count of pallets in the storage, loading dock, floor, and buffer areas, read from
+        the trigger-maintained AreaOccupancy table. With history, the pallet moves of
+        the phase are written to PalletHistory under the id of the new Movements row.
+        Writes still queued by prepared statements are sent first.
 
         Parameters:
         event (str): A description of the movement event.
 
+        Returns:
+        tuple: The recorded (storage, loadingdock, floor, buffer) counts.
+        """
+        self.statements.flush()
+        self.cur.execute("""
+            INSERT INTO Movements (day, event, storage, loadingdock, floor, buffer)
+            SELECT %s, %s,
+                   SUM(pallets) FILTER (WHERE area = 'Storage'),
+                   SUM(pallets) FILTER (WHERE area = 'LoadingDock'),
+                   SUM(pallets) FILTER (WHERE area = 'Floor'),
+                   SUM(pallets) FILTER (WHERE area = 'Buffer')
+            FROM AreaOccupancy
+            RETURNING id, storage, loadingdock, floor, buffer
+        """, (self.day, event))
+        movement_id, *counts = self.cur.fetchone()
+        counts = tuple(counts)
+        if self.history_rows:
+            self.write_history(movement_id)
+        if self.detector is not None:
+            self.detector.observe(event, counts)
+        if self.kpis is not None:
+            self.kpis.observe(event, counts)
+        self.log(f"Logged movement: {event}")
+        self.commit()
+        return counts
+
+    def end_day(self):
+        """
+        Close the current day: refresh the KPIs and run the bottleneck detector.
+
+        simulate(), the event scheduler and the concurrent workers call this once
+        the last event of a day is logged.
+
+        Returns:
+        bool: True if the run should stop.
+        """
+        if self.kpis is not None:
+            self.refresh_kpis()
+        return check_day(self)
+
+    def start_kpis(self):
+        """
+        Point the KPI tracker at the last logged counts and KPI totals, so a fork or
+        a reconnected run carries on where the database stands.
+
+        Returns:
+        None
+        """
+        self.cur.execute("SELECT storage, loadingdock, floor, buffer FROM Movements ORDER BY id DESC LIMIT 1")
+        counts = self.cur.fetchone()
+        if counts is None:
+            self.cur.execute("""
+                SELECT SUM(pallets) FILTER (WHERE area = 'Storage'),
+                       SUM(pallets) FILTER (WHERE area = 'LoadingDock'),
+                       SUM(pallets) FILTER (WHERE area = 'Floor'),
+                       SUM(pallets) FILTER (WHERE area = 'Buffer')
+                FROM AreaOccupancy
+            """)
+            counts = self.cur.fetchone()
+        self.cur.execute(sql.SQL("SELECT {} FROM DailyKPIs ORDER BY day DESC LIMIT 1").format(
+            sql.SQL(", ").join(map(sql.Identifier, KPI_COLUMNS))))
+        latest = self.cur.fetchone()
+        self.kpis.start(counts, dict(zip(KPI_COLUMNS, latest)) if latest else None)
+
+    def refresh_kpis(self):
+        """
+        Add the KPIs of the finished day.
+
+        The stock-out days of the products without a Floor pallet are counted up with
+        one UPDATE over the Floor occupancy counters, and the day's row, with the
+        running totals, is appended to DailyKPIs. Neither statement reads earlier days.
+
+        Returns:
+        dict: The KPI row of the day.
+        """
+        self.cur.execute("""
+            UPDATE SkuKPIs s
+            SET stockout_days = s.stockout_days + 1, last_stockout_day = %s
+            FROM (
+                SELECT product_id FROM LocationOccupancy
+                WHERE area = 'Floor'
+                GROUP BY product_id
+                HAVING SUM(pallets) = 0
+            ) o
+            WHERE s.product_id = o.product_id
+        """, (self.day,))
+        row = self.kpis.end_day(self.day, self.cur.rowcount)
+        self.cur.execute(sql.SQL("INSERT INTO DailyKPIs ({}) VALUES ({})").format(
+            sql.SQL(", ").join(map(sql.Identifier, KPI_COLUMNS)),
+            sql.SQL(", ").join(sql.Placeholder() * len(KPI_COLUMNS))), [row[name] for name in KPI_COLUMNS])
+        self.commit()
+        return row
+
+    def fetch_kpis(self, day=None):
+        """
+        Fetch the KPI row of a day; its totals cover the run up to that day.
+
+        Parameters:
+        day (int): The day (default is None, i.e. the latest day).
+
+        Returns:
+        dict: The row keyed by KPI_COLUMNS, or None if there is none.
+        """
+        self.cur.execute(sql.SQL("SELECT {} FROM DailyKPIs WHERE %s IS NULL OR day = %s "
+                                 "ORDER BY day DESC LIMIT 1").format(
+            sql.SQL(", ").join(map(sql.Identifier, KPI_COLUMNS))), (day, day))
+        row = self.cur.fetchone()
+        return dict(zip(KPI_COLUMNS, row)) if row else None
+
+    def fetch_sku_kpis(self, limit=10):
+        """
+        Fetch the products with the most Floor stock-out days.
+
+        Parameters:
+        limit (int): Number of products (default is 10).
+
+        Returns:
+        list: (product_id, stockout_days, last_stockout_day) rows, most stock-out days first.
+        """
+        self.cur.execute("""
+            SELECT product_id, stockout_days, last_stockout_day FROM SkuKPIs
+            ORDER BY stockout_days DESC, product_id LIMIT %s
+        """, (limit,))
+        return self.cur.fetchall()
+
+    def write_history(self, movement_id):
+        """
+        Write the recorded moves of a phase to PalletHistory with one COPY.
+
+        Parameters:
+        movement_id (int): Id of the Movements row logged for the phase.
+
+        Returns:
+        None
+        """
+        day = self.day
+        self.day_partition(day)
+        rows, self.history_rows = self.history_rows, []
+        self.copy_rows("PalletHistory", HISTORY_COLUMNS,
+                       ((day, movement_id, *row) for row in rows))
+
+    def day_partition(self, day):
+        """
+        Create the PalletHistory partition of a day unless it exists.
+
+        Parameters:
+        day (int): The simulated day.
+
         Returns:
         None
         """
+        if day in self.history_partitions:
+            return
+        self.cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} PARTITION OF PalletHistory
+            FOR VALUES FROM (%s) TO (%s)
+        """).format(sql.Identifier(f"pallethistory_d{day}")), (day, day + 1))
+        self.history_partitions.add(day)
+
+    def history_partition_days(self):
+        """
+        List the days that have a PalletHistory partition.
+
+        Returns:
+        list: Days in ascending order.
+        """
         self.cur.execute("""
-            INSERT INTO Movements (event, storage, loadingdock, floor, buffer)
-            VALUES (
-                %s,
-                (SELECT COUNT(*) FROM Pallets WHERE location_id IN (
-                    SELECT id FROM Locations WHERE area = 'Storage'
-                )),
-                (SELECT COUNT(*) FROM Pallets WHERE location_id IN (
-                    SELECT id FROM Locations WHERE area = 'LoadingDock'
-                )),
-                (SELECT COUNT(*) FROM Pallets WHERE location_id IN (
-                    SELECT id FROM Locations WHERE area = 'Floor'
-                )),
-                (SELECT COUNT(*) FROM Pallets WHERE location_id IN (
-                    SELECT id FROM Locations WHERE area = 'Buffer'
-                ))
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'pallethistory'::regclass
+        """)
+        return sorted(int(name.rsplit("_d", 1)[1]) for name, in self.cur.fetchall())
+
+    def drop_history(self, before_day, archive_dir=None):
+        """
+        Drop the PalletHistory partitions of the days before a given day.
+
+        Dropping a partition removes a whole table instead of deleting rows, so old
+        history goes away without vacuum work.
+
+        Parameters:
+        before_day (int): First day to keep.
+        archive_dir (str): Directory to copy every partition to as
+            pallethistory_d<day>.csv before it is dropped (default is None, no archive).
+
+        Returns:
+        list: The days dropped.
+        """
+        days = [day for day in self.history_partition_days() if day < before_day]
+        for day in days:
+            partition = sql.Identifier(f"pallethistory_d{day}")
+            if archive_dir is not None:
+                with open(os.path.join(archive_dir, f"pallethistory_d{day}.csv"), "w", newline="") as f:
+                    f.write(",".join(HISTORY_COLUMNS) + "\n")
+                    self.cur.copy_expert(sql.SQL("COPY (SELECT {} FROM {} ORDER BY movement_id) "
+                                                 "TO STDOUT WITH (FORMAT csv)").format(
+                        sql.SQL(", ").join(map(sql.Identifier, HISTORY_COLUMNS)), partition), f)
+            self.cur.execute(sql.SQL("DROP TABLE {}").format(partition))
+            self.history_partitions.discard(day)
+        self.conn.commit()
+        self.log(f"Dropped PalletHistory partitions of {len(days)} days before day {before_day}")
+        return days
+
+    def fetch_pallet_history(self, pallet_id=None):
+        """
+        Fetch the recorded pallet moves.
+
+        Parameters:
+        pallet_id (int): Only the moves of this pallet (default is None, all moves).
+
+        Returns:
+        list: Rows in HISTORY_COLUMNS order, in the order of the moves.
+        """
+        self.cur.execute(sql.SQL("SELECT {} FROM PalletHistory WHERE %s IS NULL OR pallet_id = %s "
+                                 "ORDER BY movement_id, pallet_id").format(
+            sql.SQL(", ").join(map(sql.Identifier, HISTORY_COLUMNS))), (pallet_id, pallet_id))
+        return self.cur.fetchall()
+
+    def save_state(self):
+        """
+        Store the simulation state that lives outside the tables in SimulationState.
+
+        The day counter, the random generator state and the settings are kept in a
+        one-row table, so a copy of the database can continue the run.
+
+        Returns:
+        None
+        """
+        self.cur.execute("""
+            CREATE TABLE IF NOT EXISTS SimulationState (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                day INTEGER NOT NULL,
+                rng_state JSONB NOT NULL,
+                settings JSONB NOT NULL
             )
-        """, (event,))
-        self.log(f"Logged movement: {event}")
+        """)
+        self.cur.execute("""
+            INSERT INTO SimulationState (id, day, rng_state, settings) VALUES (1, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE
+            SET day = EXCLUDED.day, rng_state = EXCLUDED.rng_state, settings = EXCLUDED.settings
+        """, (self.day, Json(self.rng.getstate()), Json(self.settings)))
         self.conn.commit()
 
-    def make_figure(self):
+    def load_state(self, settings=None):
         """
-        Create a bar chart showing pallet movements over time.
+        Restore the state stored by save_state.
 
-        This method retrieves data from the Movements table, converts it into lists,
-        and generates a stacked bar chart using Matplotlib. The chart displays the
-        number of pallets in storage, loading dock, floor, and buffer areas over time.
+        Parameters:
+        settings (dict): Overrides of the stored settings; only the settings that drive
+            the daily phases may change (default is None).
 
         Returns:
         None
         """
+        self.cur.execute("SELECT day, rng_state, settings FROM SimulationState")
+        day, (version, internal_state, gauss_next), stored = self.cur.fetchone()
+        self.day = day
+        self.rng.setstate((version, tuple(internal_state), gauss_next))
+        self.settings = merge_run_settings(stored, settings or {})
+        validate_settings(self.settings)
+
+    def snapshot(self, name):
+        """
+        Freeze the current state of the warehouse in a template database.
+
+        The state is saved, the connection is closed for the copy (a template must have
+        no open sessions) and opened again afterwards. The run can go on; the snapshot
+        does not change.
+
+        Parameters:
+        name (str): Name of the snapshot database; an existing one is replaced.
+
+        Returns:
+        str: The snapshot name, to pass to fork().
+        """
+        try:
+            self.save_state()
+            self.conn.close()
+            copy_database(self.dbname, name, self.user, self.password, self.host)
+            self.log(f"Snapshot {name} taken on day {self.day}")
+        except Exception as e:
+            self.log(f"Error taking snapshot {name}: {e}", ERROR)
+        self.connect_db()
+        return name
+
+    @classmethod
+    def fork(cls, snapshot, dbname, user, password, host, seed=None, settings=None, **options):
+        """
+        Start a new run from a snapshot taken by snapshot().
+
+        The snapshot is copied into dbname, replacing any database of that name, and
+        the day counter, random generator and settings continue from where the
+        snapshot was taken.
+
+        Parameters:
+        snapshot (str): Name of the snapshot database.
+        dbname (str): Name of the database of the fork.
+        user (str): Username for the database.
+        password (str): Password for the database user.
+        host (str): Database host address.
+        seed (int): Reseed the random generator instead of continuing the snapshot's
+            draws (default is None).
+        settings (dict): Overrides of the daily-phase settings such as new_pallets or
+            min_sale (default is None).
+        **options: Other constructor arguments, e.g. bulk, server_side or log_path.
+
+        Returns:
+        WarehouseOps: The forked instance.
+        """
+        copy_database(snapshot, dbname, user, password, host)
+        ops = cls(dbname, user, password, host, drop_db_flag=False, **options)
+        ops.load_state(settings)
+        if seed is not None:
+            ops.rng.seed(seed)
+        ops.log(f"Forked from snapshot {snapshot} on day {ops.day}")
+        return ops
+
+    def drop_snapshot(self, name):
+        """
+        Drop a snapshot database.
+
+        Parameters:
+        name (str): Name of the snapshot database.
+
+        Returns:
+        None
+        """
+        try:
+            drop_database(name, self.user, self.password, self.host)
+            self.log(f"Snapshot {name} dropped")
+        except Exception as e:
+            self.log(f"Error dropping snapshot {name}: {e}", ERROR)
+
+    def profile_report(self):
+        """
+        Summarize the statements issued by each phase on each day.
+
+        Returns:
+        ProfileReport: Per-day and per-phase statement counts, latencies and rows touched.
+        """
+        if self.profiler is None:
+            raise RuntimeError("Profiling is off; create the instance with profile=True")
+        return self.profiler.report()
+
+    def fetch_movements(self):
+        """
+        Fetch the pallet counts recorded by log_movement.
+
+        Returns:
+        list: (storage, loadingdock, floor, buffer) tuples in the order they were logged.
+        """
         self.cur.execute("""
-            SELECT storage, loadingdock, floor, buffer FROM Movements
+            SELECT storage, loadingdock, floor, buffer FROM Movements ORDER BY id
         """)
-        data = self.cur.fetchall()
-
-        # Convert data to lists
-        storage = [row[0] for row in data]
-        loadingdock = [row[1] for row in data]
-        floor = [row[2] for row in data]
-        buffer = [row[3] for row in data]
-
-        # Create figure and axis
-        fig, ax = plt.subplots(figsize=(10, 6))
-
-        # Create a bar chart with stacked bars
-        bar_width = 0.35
-        ind = range(len(storage))
-
-        ax.bar(ind, storage, bar_width, label='Storage', color='b')
-        ax.bar(ind, loadingdock, bar_width, bottom=storage, label='LoadingDock',
-               color='g')
-        ax.bar(ind, floor, bar_width,
-               bottom=[i + j for i, j in zip(storage, loadingdock)],
-               label='Floor', color='r')
-        ax.bar(ind, buffer, bar_width, bottom=[i + j + k for i, j, k in
-                                               zip(storage, loadingdock,
-                                                   floor)], label='Buffer',
-               color='y')
+        return self.cur.fetchall()
+
+    def fetch_daily_summary(self, max_points=500):
+        """
+        Aggregate the Movements table per day on the database server.
+
+        Consecutive days are grouped into at most max_points buckets, so the result
+        size does not depend on the length of the run. A run of max_points days or
+        fewer gets one bucket per day.
+
+        Parameters:
+        max_points (int): Maximum number of buckets (default is 500).
+
+        Returns:
+        list: (first_day, last_day, then min, mean and max of storage, loadingdock,
+        floor and buffer) tuples in day order.
+        """
+        self.cur.execute("""
+            WITH run AS (SELECT GREATEST(MAX(day), 1) AS days FROM Movements)
+            SELECT MIN(day), MAX(day),
+                   MIN(storage), AVG(storage)::FLOAT, MAX(storage),
+                   MIN(loadingdock), AVG(loadingdock)::FLOAT, MAX(loadingdock),
+                   MIN(floor), AVG(floor)::FLOAT, MAX(floor),
+                   MIN(buffer), AVG(buffer)::FLOAT, MAX(buffer)
+            FROM Movements, run
+            WHERE day > 0
+            GROUP BY (day - 1) * %s / run.days
+            ORDER BY 1
+        """, (max_points,))
+        return self.cur.fetchall()
+
+    def export_movements(self, path, format="csv", chunk_size=10000):
+        """
+        Stream the Movements table to a CSV or Parquet file.
+
+        CSV goes through COPY ... TO STDOUT; Parquet reads a server-side cursor in
+        chunks of chunk_size rows. Either way the client never holds the whole table.
+
+        Parameters:
+        path (str): Output file path.
+        format (str): "csv" or "parquet" (default is "csv").
+        chunk_size (int): Rows per Parquet row group (default is 10000).
+
+        Returns:
+        None
+        """
+        query = """
+            SELECT day, event AS phase, storage, loadingdock, floor, buffer
+            FROM Movements ORDER BY id
+        """
+        if format == "csv":
+            with open(path, "w", newline="") as f:
+                self.cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        elif format == "parquet":
+            with self.conn.cursor(name="movements_export") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query)
+                write_parquet(path, iter(lambda: cur.fetchmany(chunk_size), []))
+        else:
+            raise ValueError(f"Unknown export format: {format}")
+        self.log(f"Exported movements to {path}")
+
+    def make_figure(self, path=None, max_points=500):
+        """
+        Create a chart showing pallet occupancy per area over time.
+
+        The data comes from fetch_daily_summary, so the number of plotted points is
+        bounded by max_points whatever the length of the run. Each area is drawn as
+        its mean per bucket, with a band from the minimum to the maximum.
+
+        matplotlib is imported on first use. With a path only its Figure class is
+        used, so no display or GUI backend is needed.
+
+        Parameters:
+        path (str): File to save the figure to without opening a window
+            (default is None, i.e. show it interactively).
+        max_points (int): Maximum number of points per area (default is 500).
+
+        Returns:
+        None
+        """
+        rows = self.fetch_daily_summary(max_points)
+        columns = list(zip(*rows)) or [()] * 14
+        first_day = columns[0]
+
+        # Create figure and axis; a bare Figure needs no display when saving to a file
+        if path:
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=(10, 6))
+            ax = fig.subplots()
+        else:
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots(figsize=(10, 6))
+
+        areas = (('Storage', 'b'), ('LoadingDock', 'g'), ('Floor', 'r'), ('Buffer', 'y'))
+        for i, (label, color) in enumerate(areas):
+            low, mean, high = columns[2 + 3 * i:5 + 3 * i]
+            ax.plot(first_day, mean, label=label, color=color)
+            ax.fill_between(first_day, low, high, color=color, alpha=0.2)
 
         # Add labels
-        ax.set_xlabel('Time')
+        ax.set_xlabel('Day')
         ax.set_ylabel('Number of Pallets')
         ax.set_title('Pallet Movements Over Time')
 
         # Place the legend outside the figure
         ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
-        plt.tight_layout()
-        plt.show()
+        fig.tight_layout()
+        if path:
+            fig.savefig(path)
+            self.log(f"Figure saved to {path}")
+        else:
+            plt.show()
 
     def __del__(self):
         """
@@ -616,23 +1633,16 @@ class WarehouseOps:
 
         This method is called when the WarehouseOps instance is about to be destroyed.
         It logs a message indicating that the log file is being closed and then closes
-        the log file to ensure all log entries are properly saved.
+        the event log, which writes the queued entries before closing the file.
 
         Returns:
         None
         """
         self.log("Closing log file")
-        self.log_file.close()
-
-
-# Example usage
-db_pwd = input("db password=")
-var = input("DROP existing db (y/n)?=")
-drop_flag = True if var in ("y", "Y") else False
+        self.event_log.close()
 
-ops = WarehouseOps(dbname="FC3", user="postgres", password=db_pwd,
-                   host="localhost", drop_db_flag=drop_flag)
 
-days = int(input("How many days to simulate? "))
-ops.simulate(days=days)
-ops.make_figure()
+if __name__ == "__main__":
+    # python -m warehouse_ops run ...; the command line lives in cli.py
+    from cli import main
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Concurrent pallet movement for WarehouseOps.
+
+simulate() moves pallets one after the other on a single connection. ConcurrentWorkers
+runs the put-aways and Buffer replenishments with several workers instead, like
+forklift drivers sharing the LoadingDock and the Buffer. Each worker is a thread with
+a connection of its own from a psycopg2 ThreadedConnectionPool and moves one pallet
+per transaction:
+
+    dock     claim the lowest-id LoadingDock pallet, then a free Floor slot of its
+             product or else a free Buffer slot
+    buffer   claim the lowest-id Floor location with a free slot, then the lowest-id
+             Buffer pallet of its product
+
+Pallets and slots are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so two workers
+never take the same pallet or the last free slot of a location, and no location
+exceeds max_pallets. A worker that finds a slot locked by someone else moves on to
+the next one, as a driver would. The occupancy counters updated by the Pallets
+triggers are shared by all workers, so the commits of concurrent moves queue on them;
+that queueing is part of the contention the mode shows.
+
+Workers claim work in a different order than the single-threaded phases, so a
+concurrent run does not reproduce the Movements trace of simulate() for the same seed:
+
+    from workers import ConcurrentWorkers
+
+    workers = ConcurrentWorkers(ops, workers=4)
+    workers.run(days=10)
+    print(workers.throughput())
+    workers.close()
+"""
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extensions import TransactionRollbackError
+from psycopg2.pool import ThreadedConnectionPool
+
+from event_log import DEBUG, WARNING
+
+# Work sources of the phases: the put-away drains the dock, the replenishment fills
+# the Floor from the Buffer first and then clears what is left on the dock
+PUTAWAY = ("dock",)
+REPLENISH = ("buffer", "dock")
+
+
+class ConcurrentWorkers:
+    def __init__(self, ops, workers=4):
+        """
+        Open a connection pool for the workers of a warehouse.
+
+        Parameters:
+        ops (WarehouseOps): Connected warehouse; it must not use server_side. Its
+            truck_arrives() and simulate_daily_sales() run on its own connection.
+        workers (int): Number of concurrent workers (default is 4).
+
+        Returns:
+        None
+        """
+        if ops.conn is None:
+            raise ValueError("Concurrent workers need a PostgreSQL warehouse")
+        if ops.server_side:
+            raise ValueError("Concurrent workers need a client-side warehouse, not server_side")
+        if workers < 1:
+            raise ValueError("At least one worker is needed")
+        self.ops = ops
+        self.workers = workers
+        self.pool = ThreadedConnectionPool(workers, workers, dbname=ops.dbname, user=ops.user,
+                                           password=ops.password, host=ops.host)
+        # Dock pallets and Floor locations that are done for the current round
+        self.unplaced = {"dock": set(), "buffer": set()}
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.seconds = 0.0
+
+    def close(self):
+        """
+        Close the connections of the pool.
+
+        Returns:
+        None
+        """
+        self.pool.closeall()
+
+    def run(self, days=10):
+        """
+        Simulate days with the pallet movements done by the workers.
+
+        The day has the five events of simulate() and logs the same Movements rows.
+        Day numbers continue from earlier simulate() or run() calls, and the run ends
+        early if the warehouse's bottleneck detector stops it.
+
+        Parameters:
+        days (int): The number of days to run (default is 10).
+
+        Returns:
+        collections.Counter: Moves and retries over all runs, see drain().
+        """
+        ops = self.ops
+        if ops.stop_reason is not None:
+            ops.log(f"Run already stopped: {ops.stop_reason}", WARNING)
+            return self.counts
+
+        for day in range(ops.day, ops.day + days):
+            ops.day = day + 1
+            ops.log(f"Day {day + 1} simulation with {self.workers} workers starts")
+            ops.truck_arrives()
+            self.drain(PUTAWAY)
+            ops.log_movement('LoadingDock')
+            ops.simulate_daily_sales()
+            self.drain(REPLENISH)
+            ops.log_movement('BufferMoves')
+            self.drain(PUTAWAY)
+            ops.log_movement('LoadingDock')
+            ops.log(f"Day {day + 1} simulation ends")
+            if ops.end_day():
+                break
+        return self.counts
+
+    def drain(self, sources):
+        """
+        Let all workers move pallets until none of the sources has work left.
+
+        A worker that claims a pallet or Floor location with nothing to pair it with
+        sets it aside for the round, and a Floor location takes one Buffer pallet per
+        round, as in move_from_buffer(). With several workers, slots skipped because
+        another worker held them may have room again once that worker commits, so
+        rounds repeat until one moves nothing.
+
+        Parameters:
+        sources (tuple): "dock" and/or "buffer", in the order workers try them.
+
+        Returns:
+        int: Pallets moved.
+        """
+        start = time.perf_counter()
+        moved = 0
+        spilled = 0
+        rounds = 0
+        while True:
+            rounds += 1
+            for skipped in self.unplaced.values():
+                skipped.clear()
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                counts = list(pool.map(lambda _: self.work(sources), range(self.workers)))
+            round_moved = 0
+            for worker_counts in counts:
+                self.counts.update(worker_counts)
+                round_moved += worker_counts["moved"]
+                spilled += worker_counts["to_buffer"]
+            moved += round_moved
+            if self.workers == 1 or not round_moved or not any(self.unplaced.values()):
+                break
+        self.counts["rounds"] += rounds
+        self.seconds += time.perf_counter() - start
+        if self.ops.kpis is not None:
+            # Dock pallets spill to the Buffer in the replenishment drain too
+            self.ops.kpis.spill(spilled)
+
+        if "dock" in sources and self.unplaced["dock"]:
+            self.ops.log(f"No available space for {len(self.unplaced['dock'])} pallets", WARNING)
+        return moved
+
+    def work(self, sources):
+        """
+        Move pallets one transaction at a time until no source has claimable work.
+
+        Runs in a worker thread with a pooled connection.
+
+        Parameters:
+        sources (tuple): "dock" and/or "buffer", in the order they are tried.
+
+        Returns:
+        collections.Counter: moved, to_floor, to_buffer, from_buffer and retries
+        (transactions rolled back on a deadlock or serialization failure).
+        """
+        counts = collections.Counter()
+        claims = {"dock": self.claim_dock, "buffer": self.claim_buffer}
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                busy = True
+                while busy:
+                    busy = False
+                    for source in sources:
+                        try:
+                            outcome, move = claims[source](cur)
+                            conn.commit()
+                        except TransactionRollbackError:
+                            conn.rollback()
+                            counts["retries"] += 1
+                            busy = True
+                            break
+                        if move is not None and self.ops.history:
+                            # Committed moves go to PalletHistory with the next log_movement
+                            self.ops.history_rows.append(move)
+                        if outcome is not None:
+                            counts[outcome] += 1
+                            if outcome != "unplaced":
+                                counts["moved"] += 1
+                            busy = True
+                            break
+        finally:
+            conn.rollback()
+            self.pool.putconn(conn)
+        del counts["unplaced"]
+        return counts
+
+    def skip(self, source):
+        """
+        Return the ids set aside in the current round.
+
+        Parameters:
+        source (str): "dock" for pallets or "buffer" for Floor locations.
+
+        Returns:
+        list: Pallet or location ids.
+        """
+        with self.lock:
+            return list(self.unplaced[source])
+
+    def set_aside(self, source, item_id):
+        """
+        Set a pallet or Floor location aside for the rest of the round.
+
+        Parameters:
+        source (str): "dock" or "buffer".
+        item_id (int): Pallet id for the dock, Floor location id for the Buffer.
+
+        Returns:
+        None
+        """
+        with self.lock:
+            self.unplaced[source].add(item_id)
+
+    def claim_dock(self, cur):
+        """
+        Claim a LoadingDock pallet and move it to a free Floor slot or free Buffer slot.
+
+        Parameters:
+        cur (psycopg2.extensions.cursor): Cursor of the worker's connection.
+
+        Returns:
+        tuple: The outcome, "to_floor", "to_buffer" or "unplaced", or None if no pallet
+        was left to claim, and the move as (pallet_id, product_id, from, to) or None.
+        """
+        cur.execute("""
+            SELECT id, product_id FROM Pallets
+            WHERE location_id = %s AND id <> ALL(%s)
+            ORDER BY id LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (self.ops.loading_dock_location_id, self.skip("dock")))
+        pallet = cur.fetchone()
+        if pallet is None:
+            return None, None
+        pallet_id, product_id = pallet
+
+        cur.execute("""
+            SELECT location_id FROM LocationOccupancy
+            WHERE area = 'Floor' AND product_id = %s AND pallets < max_pallets
+            ORDER BY location_id LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (product_id,))
+        location = cur.fetchone()
+        area = "Floor"
+        if location is None:
+            cur.execute("""
+                SELECT location_id FROM LocationOccupancy
+                WHERE area = 'Buffer' AND pallets < max_pallets
+                ORDER BY location_id LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            location = cur.fetchone()
+            area = "Buffer"
+        if location is None:
+            self.set_aside("dock", pallet_id)
+            return "unplaced", None
+
+        cur.execute("UPDATE Pallets SET location_id = %s WHERE id = %s", (location[0], pallet_id))
+        if self.ops.event_log.enabled(DEBUG):
+            self.ops.log(
+                f"Moved pallet {pallet_id} with product_id {product_id} to {area} location {location[0]}", DEBUG)
+        move = (pallet_id, product_id, self.ops.loading_dock_location_id, location[0])
+        return ("to_floor" if area == "Floor" else "to_buffer"), move
+
+    def claim_buffer(self, cur):
+        """
+        Claim a Floor location with a free slot and move a Buffer pallet of its product there.
+
+        Parameters:
+        cur (psycopg2.extensions.cursor): Cursor of the worker's connection.
+
+        Returns:
+        tuple: The outcome, "from_buffer" or "unplaced", or None if no Floor location
+        was left to claim, and the move as (pallet_id, product_id, from, to) or None.
+        """
+        cur.execute("""
+            SELECT location_id, product_id FROM LocationOccupancy
+            WHERE area = 'Floor' AND pallets < max_pallets AND location_id <> ALL(%s)
+            ORDER BY location_id LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (self.skip("buffer"),))
+        location = cur.fetchone()
+        if location is None:
+            return None, None
+        location_id, product_id = location
+
+        cur.execute("""
+            SELECT p.id, p.location_id FROM Pallets p
+            JOIN LocationOccupancy o ON o.location_id = p.location_id
+            WHERE p.product_id = %s AND o.area = 'Buffer'
+            ORDER BY p.id LIMIT 1
+            FOR UPDATE OF p SKIP LOCKED
+        """, (product_id,))
+        pallet = cur.fetchone()
+        if pallet is None:
+            self.set_aside("buffer", location_id)
+            return "unplaced", None
+
+        cur.execute("UPDATE Pallets SET location_id = %s WHERE id = %s", (location_id, pallet[0]))
+        self.set_aside("buffer", location_id)
+        if self.ops.event_log.enabled(DEBUG):
+            self.ops.log(
+                f"Moved pallet {pallet[0]} with product_id {product_id} from Buffer to Floor location {location_id}",
+                DEBUG)
+        return "from_buffer", (pallet[0], product_id, pallet[1], location_id)
+
+    def throughput(self):
+        """
+        Summarize the work done by the workers so far.
+
+        Returns:
+        dict: workers, pallets moved, seconds spent draining, moves per second,
+        retries and drain rounds.
+        """
+        moved = self.counts["moved"]
+        return {
+            "workers": self.workers,
+            "moved": moved,
+            "seconds": round(self.seconds, 3),
+            "moves_per_sec": round(moved / self.seconds, 1) if self.seconds else 0.0,
+            "retries": self.counts["retries"],
+            "rounds": self.counts["rounds"],
+        }